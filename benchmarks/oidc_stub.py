@@ -0,0 +1,151 @@
+"""Stand-in OIDC server for benchmarks: JWKS, discovery, token and userinfo endpoints"""
+
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import orjson
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+KID = "bench-key"
+
+
+class OidcStub:
+    """
+    Serves, on a random local port:
+    - GET  {issuer}/.well-known/openid-configuration
+    - GET  {issuer}/protocol/openid-connect/certs
+    - POST {issuer}/protocol/openid-connect/token
+    - GET  {issuer}/protocol/openid-connect/userinfo
+    Tokens are RS256 signed with a key generated at startup.
+    """
+
+    def __init__(self, host="127.0.0.1", userinfo_delay: float = 0):
+        self.userinfo_delay = userinfo_delay
+        self.request_counts = {}
+        self.token_response = None
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_key = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode()
+        public_key = jwk.construct(
+            key.public_key()
+            .public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
+            .decode(),
+            "RS256",
+        ).to_dict()
+        public_key.update({"kid": KID, "use": "sig"})
+        self.jwks = {"keys": [public_key]}
+
+        self.server = ThreadingHTTPServer((host, 0), self.get_handler_class())
+        self.server.daemon_threads = True
+        self.issuer = f"http://{host}:{self.server.server_address[1]}/realms/bench"
+        self.jwks_endpoint = f"{self.issuer}/protocol/openid-connect/certs"
+        self.token_endpoint = f"{self.issuer}/protocol/openid-connect/token"
+        self.userinfo_endpoint = f"{self.issuer}/protocol/openid-connect/userinfo"
+        self._thread = None
+
+    def start(self) -> "OidcStub":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def token(self, **claims) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": self.issuer,
+            "sub": "bench-user",
+            "aud": "account",
+            "iat": now,
+            "exp": now + 3600,
+            "jti": uuid.uuid4().hex,
+            "name": "Bench User",
+            "email": "bench@example.org",
+        }
+        payload.update(claims)
+        return jwt.encode(
+            payload, self.private_key, algorithm="RS256", headers={"kid": KID}
+        )
+
+    def get_handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; avoid delayed ACK stalls.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, body, status=200, headers=None):
+                data = orjson.dumps(body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def count(self):
+                path = self.path.split("?")[0]
+                stub.request_counts[path] = stub.request_counts.get(path, 0) + 1
+                return path
+
+            def do_GET(self):
+                path = self.count()
+                if path.endswith("/.well-known/openid-configuration"):
+                    self.send_json(
+                        {
+                            "issuer": stub.issuer,
+                            "jwks_uri": stub.jwks_endpoint,
+                            "token_endpoint": stub.token_endpoint,
+                            "userinfo_endpoint": stub.userinfo_endpoint,
+                        }
+                    )
+                elif path.endswith("/certs"):
+                    self.send_json(stub.jwks, headers={"Cache-Control": "max-age=3600"})
+                elif path.endswith("/userinfo"):
+                    if stub.userinfo_delay:
+                        time.sleep(stub.userinfo_delay)
+                    self.send_json(
+                        {
+                            "sub": "bench-user",
+                            "name": "Bench User",
+                            "email": "bench@example.org",
+                        }
+                    )
+                else:
+                    self.send_json({"error": "not_found"}, status=404)
+
+            def do_POST(self):
+                path = self.count()
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                if path.endswith("/token"):
+                    # Signed once, so that the stub's cost stays out of the results.
+                    if not stub.token_response:
+                        stub.token_response = {
+                            "access_token": stub.token(),
+                            "id_token": stub.token(),
+                            "token_type": "Bearer",
+                            "expires_in": 3600,
+                        }
+                    self.send_json(stub.token_response)
+                else:
+                    self.send_json({"error": "not_found"}, status=404)
+
+        return Handler
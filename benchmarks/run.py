@@ -0,0 +1,333 @@
+"""
+Benchmarks of the request paths of openg2p-fastapi-common and openg2p-fastapi-auth.
+
+Requests are sent in process (httpx ASGITransport), so results measure the app
+and not the network. A stand-in OIDC server serves JWKS, token and userinfo, and
+LoginProvider lives in SQLite (needs aiosqlite), or in the database given by --db-url.
+
+Usage:
+    python benchmarks/run.py --requests 2000 --concurrency 20 --output results.json
+"""
+
+import argparse
+import asyncio
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from types import SimpleNamespace
+from typing import List
+
+import orjson
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from oidc_stub import OidcStub  # noqa: E402
+
+
+class BenchItem(BaseModel):
+    id: int
+    name: str
+    active: bool
+    score: float
+    created: datetime
+    tags: List[str]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="OpenG2P FastAPI Benchmarks")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument(
+        "--db-url",
+        default=None,
+        help="Async SQLAlchemy url, like postgresql+asyncpg://... Defaults to SQLite.",
+    )
+    parser.add_argument(
+        "--only", nargs="*", default=None, help="Names of scenarios to run."
+    )
+    parser.add_argument(
+        "--userinfo-delay",
+        type=float,
+        default=0,
+        help="Seconds the stand-in userinfo endpoint takes to respond.",
+    )
+    parser.add_argument(
+        "--list-size",
+        type=int,
+        default=100,
+        help="Number of items in the responses of the serialize_list scenarios.",
+    )
+    parser.add_argument("--log-level", default="CRITICAL")
+    parser.add_argument(
+        "--output", default=None, help="Json output file. Defaults to stdout."
+    )
+    return parser.parse_args()
+
+
+def configure_env(args, oidc: OidcStub, db_dir: str):
+    # Must happen before Settings are first created, i.e. before importing the packages.
+    os.environ["common_db_datasource"] = (
+        args.db_url or f"sqlite+aiosqlite:///{os.path.join(db_dir, 'bench.db')}"
+    )
+    os.environ["common_auth_default_issuers"] = orjson.dumps([oidc.issuer]).decode()
+    os.environ["common_auth_default_jwks_urls"] = orjson.dumps(
+        [oidc.jwks_endpoint]
+    ).decode()
+    os.environ["common_logging_level"] = args.log_level
+    # Keeps stdout for results; json_logging writes access logs regardless of level.
+    os.environ["common_logging_queue_enabled"] = "true"
+    os.environ["common_logging_access_log_enabled"] = "false"
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(
+        0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+async def run_scenario(name, call, total: int, concurrency: int, warmup: int) -> dict:
+    """
+    call(i) sends the i-th request and returns whether the response was as expected.
+    """
+    for i in range(warmup):
+        await call(i)
+
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                ok = await call(i)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "name": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "duration_s": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 2),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 4),
+            "p50": round(percentile(latencies, 50) * 1000, 4),
+            "p90": round(percentile(latencies, 90) * 1000, 4),
+            "p99": round(percentile(latencies, 99) * 1000, 4),
+            "max": round(latencies[-1] * 1000, 4),
+        },
+    }
+
+
+def get_version(package: str) -> str:
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return None
+
+
+async def main(args, oidc: OidcStub) -> dict:
+    import httpx
+    from openg2p_fastapi_auth.app import Initializer as AuthInitializer
+    from openg2p_fastapi_auth.dependencies import JwtBearerAuth
+    from openg2p_fastapi_auth.models.orm.login_provider import (
+        LoginProvider,
+        LoginProviderTypes,
+    )
+    from openg2p_fastapi_common.app import Initializer
+    from openg2p_fastapi_common.context import app_registry
+    from openg2p_fastapi_common.controller import BaseController
+    from openg2p_fastapi_common.ping import PingController
+    from openg2p_fastapi_common.routing import (
+        BaseAPIRoute,
+        PydanticJSONAPIRoute,
+        trusted_response,
+    )
+    from starlette.requests import Request
+
+    Initializer()
+    AuthInitializer()
+    PingController().post_init()
+    app = app_registry.get()
+
+    items = [
+        BenchItem(
+            id=i,
+            name=f"item-{i}",
+            active=True,
+            score=i / 3,
+            created=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            tags=["a", "b"],
+        )
+        for i in range(args.list_size)
+    ]
+
+    async def list_items() -> List[BenchItem]:
+        return items
+
+    @trusted_response
+    async def list_items_trusted() -> List[BenchItem]:
+        return items
+
+    for prefix, route_class, endpoint in (
+        ("/bench/default", BaseAPIRoute, list_items),
+        ("/bench/pydantic", PydanticJSONAPIRoute, list_items),
+        ("/bench/pydantic_trusted", PydanticJSONAPIRoute, list_items_trusted),
+    ):
+        controller = BaseController(name=prefix, route_class=route_class)
+        controller.router.add_api_route(prefix, endpoint, methods=["GET"])
+        controller.post_init()
+
+    await LoginProvider.create_migrate()
+    await LoginProvider.bulk_upsert(
+        [
+            {
+                "id": 1,
+                "active": True,
+                "name": "bench",
+                "type": LoginProviderTypes.oauth2_auth_code,
+                "description": "",
+                "login_button_text": "Login",
+                "login_button_image_url": "",
+                "authorization_parameters": {
+                    "authorize_endpoint": f"{oidc.issuer}/protocol/openid-connect/auth",
+                    "token_endpoint": oidc.token_endpoint,
+                    "validate_endpoint": oidc.userinfo_endpoint,
+                    "jwks_endpoint": oidc.jwks_endpoint,
+                    "client_id": "bench-client",
+                    "client_secret": "bench-secret",
+                    "redirect_uri": "http://localhost/oauth2/callback",
+                    "code_verifier": "v" * 64,
+                },
+            }
+        ]
+    )
+
+    token = oidc.token()
+    unique_tokens = [oidc.token() for _ in range(args.requests + args.warmup)]
+    auth_headers = {"Authorization": f"Bearer {token}"}
+    jwt_bearer_auth = JwtBearerAuth()
+    route = SimpleNamespace(name="get_profile")
+
+    def get_auth_request(jwt_token: str) -> Request:
+        return Request(
+            {
+                "type": "http",
+                "method": "GET",
+                "path": "/auth/profile",
+                "headers": [(b"authorization", f"Bearer {jwt_token}".encode())],
+                "route": route,
+            }
+        )
+
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+
+        def get(path, expected_status, **kwargs):
+            async def call(i):
+                res = await client.get(path, **kwargs)
+                return res.status_code == expected_status
+
+            return call
+
+        async def jwt_bearer_auth_cached(i):
+            return bool(await jwt_bearer_auth(get_auth_request(token)))
+
+        async def jwt_bearer_auth_uncached(i):
+            return bool(await jwt_bearer_auth(get_auth_request(unique_tokens[i])))
+
+        state = orjson.dumps({"p": 1, "r": "/"}).decode()
+        scenarios = {
+            "ping": get("/ping", 200),
+            "jwt_bearer_auth_cached": jwt_bearer_auth_cached,
+            "jwt_bearer_auth_uncached": jwt_bearer_auth_uncached,
+            "profile_offline": get(
+                "/auth/profile", 200, params={"online": "false"}, headers=auth_headers
+            ),
+            "profile_online": get("/auth/profile", 200, headers=auth_headers),
+            "get_login_providers": get("/auth/getLoginProviders", 200),
+            "oauth_callback": get(
+                "/oauth2/callback", 307, params={"code": "bench-code", "state": state}
+            ),
+            "serialize_list_default": get("/bench/default", 200),
+            "serialize_list_pydantic": get("/bench/pydantic", 200),
+            "serialize_list_pydantic_trusted": get("/bench/pydantic_trusted", 200),
+            "error_401_unauthorized": get("/auth/profile", 401),
+            "error_404_not_found": get("/does-not-exist", 404),
+            "error_400_validation": get(
+                "/auth/getLoginProviderRedirect/not-an-int", 400
+            ),
+        }
+
+        results = []
+        for name, call in scenarios.items():
+            if args.only and name not in args.only:
+                continue
+            results.append(
+                await run_scenario(
+                    name, call, args.requests, args.concurrency, args.warmup
+                )
+            )
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": "sqlite" if not args.db_url else args.db_url.split(":")[0],
+            "packages": {
+                package: get_version(package)
+                for package in (
+                    "openg2p_fastapi_common",
+                    "openg2p_fastapi_auth",
+                    "fastapi",
+                    "starlette",
+                    "pydantic",
+                    "sqlalchemy",
+                    "httpx",
+                )
+            },
+            "args": vars(args),
+            "oidc_requests": dict(oidc.request_counts),
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    oidc = OidcStub(userinfo_delay=args.userinfo_delay).start()
+    with tempfile.TemporaryDirectory() as db_dir:
+        configure_env(args, oidc, db_dir)
+        try:
+            result = asyncio.run(main(args, oidc))
+        finally:
+            oidc.stop()
+    output = orjson.dumps(result, option=orjson.OPT_INDENT_2) + b"\n"
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(output)
+    else:
+        sys.stdout.buffer.write(output)
@@ -9,20 +9,44 @@ from .config import Settings
 _config = Settings.get_config(strict=False)
 
 from openg2p_fastapi_common.app import Initializer
+from openg2p_fastapi_common.metrics import Metrics
 
 from .controllers.auth_controller import AuthController
 from .controllers.oauth_controller import OAuthController
-from .models.orm.login_provider import LoginProvider
+from .services.jwks_manager import JwksManager
+from .services.login_provider_registry import LoginProviderRegistry
+from .services.provider_resilience import ProviderResilience
+from .services.token_cache import VerifiedTokenCache
+from .services.userinfo_cache import UserinfoCache
 
 
 class Initializer(Initializer):
     def initialize(self, **kwargs):
         # Initialize all Services, Controllers, any utils here.
+        jwks_manager = JwksManager()
+        token_cache = VerifiedTokenCache()
+        userinfo_cache = UserinfoCache()
+        LoginProviderRegistry()
+        ProviderResilience()
+        metrics = Metrics.get_component()
+        if metrics:
+            metrics.register_cache("jwks", jwks_manager.stats)
+            metrics.register_cache("auth_token", token_cache.stats)
+            metrics.register_cache("userinfo", userinfo_cache.stats)
         AuthController().post_init()
         OAuthController().post_init()
 
+    # The common Initializer is registered too, and the lifespan runs the hooks of
+    # each Initializer. So these run only the auth specific work.
+    async def fastapi_app_startup(self, app):
+        LoginProviderRegistry.get_component().start_background_refresh()
+
+    async def fastapi_app_shutdown(self, app):
+        await LoginProviderRegistry.get_component().stop_background_refresh()
+
     def migrate_database(self, args):
         super().migrate_database(args)
+        from .models.orm.login_provider import LoginProvider
 
         async def migrate():
             await LoginProvider.create_migrate()
@@ -9,6 +9,7 @@ class ApiAuthSettings(BaseModel):
     enabled: bool = False
     issuers: Optional[List[str]] = None
     audiences: Optional[List[str]] = None
+    jwks_urls: Optional[List[str]] = None
     claim_name: Optional[str] = None
     claim_values: Optional[List[str]] = None
     id_token_verify_at_hash: Optional[bool] = None
@@ -20,6 +21,9 @@ class Settings(Settings):
     )
 
     login_providers_table_name: str = "login_providers"
+    auth_login_provider_refresh_interval: int = 300
+    # Cleared whenever login providers are reloaded. 0 disables.
+    auth_login_providers_response_cache_ttl: int = 300
 
     auth_enabled: bool = True
 
@@ -27,6 +31,48 @@ class Settings(Settings):
     auth_default_audiences: List[str] = []
     auth_default_jwks_urls: List[str] = []
 
+    # With the "shared" cache_backend, each auth cache is a file of
+    # max_entries * (slot_size + 32) bytes in cache_shared_dir (a tmpfs like /dev/shm,
+    # 64 MB by default in docker). The defaults take about 1 MB (JWKS), 20.6 MB
+    # (tokens) and 20.8 MB (userinfo). A cache that doesn't fit in the free space
+    # falls back to the memory backend.
+    auth_jwks_cache_default_ttl: int = 3600
+    auth_jwks_cache_min_ttl: int = 60
+    auth_jwks_cache_max_ttl: int = 86400
+    auth_jwks_refresh_min_interval: int = 30
+    auth_jwks_fetch_timeout: float = 10
+    auth_jwks_discovery_enabled: bool = False
+    auth_jwks_cache_max_entries: int = 64
+    # Max size of a pickled JWKS, with the "shared" cache_backend.
+    auth_jwks_cache_slot_size: int = 16384
+
+    # Calls to login providers (token, userinfo). See ProviderResilience.
+    auth_provider_request_timeout: float = 10
+    auth_provider_max_retries: int = 2
+    auth_provider_retry_backoff: float = 0.1
+    auth_provider_retry_max_backoff: float = 1
+    # Retries per provider per interval: ratio of requests, or min, whichever is more.
+    auth_provider_retry_budget_ratio: float = 0.1
+    auth_provider_retry_budget_min: int = 10
+    auth_provider_retry_budget_interval: float = 10
+    auth_provider_circuit_failure_threshold: int = 5
+    auth_provider_circuit_reset_timeout: float = 30
+    # A second userinfo request is sent if the first takes longer. None disables.
+    auth_provider_userinfo_hedge_delay: Optional[float] = None
+
+    auth_token_cache_enabled: bool = True
+    auth_token_cache_max_entries: int = 5000
+    auth_token_cache_max_ttl: Optional[int] = None
+    # Max size of a pickled (iss, aud, AuthCredentials) entry, with the "shared"
+    # cache_backend. Larger ones are not cached (see cache_oversized_total).
+    auth_token_cache_slot_size: int = 4096
+
+    auth_userinfo_cache_enabled: bool = True
+    auth_userinfo_cache_ttl: int = 60
+    auth_userinfo_cache_max_entries: int = 10000
+    # Max size of a pickled userinfo, with the "shared" cache_backend.
+    auth_userinfo_cache_slot_size: int = 2048
+
     auth_cookie_max_age: Optional[int] = None
     auth_cookie_set_expires: bool = False
     auth_cookie_path: str = "/"
@@ -1,5 +1,8 @@
 from contextvars import ContextVar
 from typing import Any, Dict
 
-# TODO: Handle JWKs Cache properly
-jwks_cache: ContextVar[Dict[str, Any]] = ContextVar("jwks_cache", default={})
+# Dict of route name -> ApiAuthPolicy (None if auth is disabled for the route).
+# Compiled by JwtBearerAuth when routes are registered.
+api_auth_policies: ContextVar[Dict[str, Any]] = ContextVar(
+    "api_auth_policies", default={}
+)
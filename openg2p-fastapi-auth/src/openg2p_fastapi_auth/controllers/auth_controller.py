@@ -1,23 +1,33 @@
 import logging
 import secrets
 import urllib.parse
-from typing import Annotated, List, Union
+from typing import TYPE_CHECKING, Annotated, List, Union
 
-import httpx
 import orjson
 from fastapi import Depends, HTTPException, Response, status
 from fastapi.responses import RedirectResponse
-from jose import jwt
 from openg2p_fastapi_common.controller import BaseController
 from openg2p_fastapi_common.errors.http_exceptions import InternalServerError
+from openg2p_fastapi_common.response_cache import cache_response
+from openg2p_fastapi_common.utils.lazy_import import lazy_import
 
 from ..config import Settings
 from ..dependencies import JwtBearerAuth
 from ..models.credentials import AuthCredentials
-from ..models.login_provider import LoginProviderHttpResponse, LoginProviderResponse
-from ..models.orm.login_provider import LoginProvider, LoginProviderTypes
+from ..models.login_provider import (
+    LoginProviderHttpResponse,
+    LoginProviderResponse,
+    LoginProviderTypes,
+)
 from ..models.profile import BasicProfile
-from ..models.provider_auth_parameters import OauthProviderParameters
+from ..services.login_provider_registry import LoginProviderRegistry
+from ..services.provider_resilience import ProviderResilience
+from ..services.userinfo_cache import UserinfoCache
+
+if TYPE_CHECKING:
+    from ..models.orm.login_provider import LoginProvider
+
+jwt = lazy_import("jose.jwt")
 
 _config = Settings.get_config(strict=False)
 _logger = logging.getLogger(_config.logging_default_logger_name)
@@ -52,6 +62,32 @@ class AuthController(BaseController):
             methods=["GET"],
         )
 
+        self._userinfo_cache = UserinfoCache.get_component()
+        self._provider_resilience = ProviderResilience.get_component()
+        self._login_provider_registry = LoginProviderRegistry.get_component()
+
+    @property
+    def userinfo_cache(self) -> UserinfoCache:
+        if not self._userinfo_cache:
+            self._userinfo_cache = UserinfoCache.get_component() or UserinfoCache()
+        return self._userinfo_cache
+
+    @property
+    def provider_resilience(self) -> ProviderResilience:
+        if not self._provider_resilience:
+            self._provider_resilience = (
+                ProviderResilience.get_component() or ProviderResilience()
+            )
+        return self._provider_resilience
+
+    @property
+    def login_provider_registry(self) -> LoginProviderRegistry:
+        if not self._login_provider_registry:
+            self._login_provider_registry = (
+                LoginProviderRegistry.get_component() or LoginProviderRegistry()
+            )
+        return self._login_provider_registry
+
     async def get_profile(
         self,
         auth: Annotated[AuthCredentials, Depends(JwtBearerAuth())],
@@ -69,8 +105,11 @@ class AuthController(BaseController):
             if provider:
                 if provider.type == LoginProviderTypes.oauth2_auth_code:
                     return BasicProfile.model_validate(
-                        await self.get_oauth_validation_data(
-                            auth, iss=auth.iss, provider=provider, combine=True
+                        await self.userinfo_cache.get_or_fetch(
+                            auth,
+                            lambda: self.get_oauth_validation_data(
+                                auth, iss=auth.iss, provider=provider, combine=True
+                            ),
                         )
                     )
                 else:
@@ -85,6 +124,10 @@ class AuthController(BaseController):
         response.delete_cookie("X-Access-Token")
         response.delete_cookie("X-ID-Token")
 
+    @cache_response(
+        ttl=_config.auth_login_providers_response_cache_ttl,
+        name="auth_login_providers",
+    )
     async def get_login_providers(self):
         """
         Get available Login Providers List. Can also be used to display login providers on UI.
@@ -127,8 +170,8 @@ class AuthController(BaseController):
             )
 
         if login_provider.type == LoginProviderTypes.oauth2_auth_code:
-            auth_parameters = OauthProviderParameters.model_validate(
-                login_provider.authorization_parameters
+            auth_parameters = self.login_provider_registry.get_auth_parameters(
+                login_provider
             )
             authorize_query_params = {
                 "client_id": auth_parameters.client_id,
@@ -158,21 +201,21 @@ class AuthController(BaseController):
         else:
             raise NotImplementedError()
 
-    async def get_login_providers_db(self) -> List[LoginProvider]:
-        return await LoginProvider.get_all()
+    async def get_login_providers_db(self) -> List["LoginProvider"]:
+        return await self.login_provider_registry.get_all()
 
-    async def get_login_provider_db_by_id(self, id: int) -> LoginProvider:
-        return await LoginProvider.get_by_id(id)
+    async def get_login_provider_db_by_id(self, id: int) -> "LoginProvider":
+        return await self.login_provider_registry.get_by_id(id)
 
-    async def get_login_provider_db_by_iss(self, iss: str) -> LoginProvider:
-        return await LoginProvider.get_login_provider_from_iss(iss)
+    async def get_login_provider_db_by_iss(self, iss: str) -> "LoginProvider":
+        return await self.login_provider_registry.get_by_iss(iss)
 
     async def get_oauth_validation_data(
         self,
         auth: Union[str, AuthCredentials],
         id_token: str = None,
         iss: str = None,
-        provider: LoginProvider = None,
+        provider: "LoginProvider" = None,
         combine=True,
     ) -> dict:
         access_token = auth.credentials if isinstance(auth, AuthCredentials) else auth
@@ -185,19 +228,25 @@ class AuthController(BaseController):
                 )
             provider = await self.get_login_provider_db_by_iss(iss)
         # TODO: Check if provider is None
-        auth_params = OauthProviderParameters.model_validate(
-            provider.authorization_parameters
-        )
+        auth_params = self.login_provider_registry.get_auth_parameters(provider)
         try:
-            response = httpx.get(
+            hedge_delay = auth_params.userinfo_hedge_delay
+            if hedge_delay is None:
+                hedge_delay = _config.auth_provider_userinfo_hedge_delay
+            response = await self.provider_resilience.request(
+                provider.id,
+                "GET",
                 auth_params.validate_endpoint,
+                idempotent=True,
+                timeout=auth_params.request_timeout,
+                hedge_delay=hedge_delay,
                 headers={"Authorization": f"Bearer {access_token}"},
             )
             response.raise_for_status()
             if response.headers["content-type"].startswith("application/json"):
                 res = response.json()
             elif response.headers["content-type"].startswith("application/jwt"):
-                # jwks_cache.get().get(auth.iss),
+                # JwksManager.get_component().get_jwks(auth.iss),
                 # TODO: Skipping this jwt validation. Some errors.
                 res = jwt.get_unverified_claims(response.content)
             if combine:
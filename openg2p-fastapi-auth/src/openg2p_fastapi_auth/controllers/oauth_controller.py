@@ -1,22 +1,20 @@
 import logging
 from datetime import datetime, timedelta, timezone
 
-import httpx
 import orjson
 from fastapi import Request
 from fastapi.responses import RedirectResponse
-from jose import jwt
 from openg2p_fastapi_common.controller import BaseController
 from openg2p_fastapi_common.errors.http_exceptions import UnauthorizedError
+from openg2p_fastapi_common.utils.lazy_import import lazy_import
 
 from ..config import Settings
-from ..models.orm.login_provider import LoginProviderTypes
-from ..models.provider_auth_parameters import (
-    OauthClientAssertionType,
-    OauthProviderParameters,
-)
+from ..models.login_provider import LoginProviderTypes
+from ..models.provider_auth_parameters import OauthClientAssertionType
 from .auth_controller import AuthController
 
+jwt = lazy_import("jose.jwt")
+
 _config = Settings.get_config(strict=False)
 _logger = logging.getLogger(_config.logging_default_logger_name)
 
@@ -59,8 +57,10 @@ class OAuthController(BaseController):
         )
 
         if login_provider.type == LoginProviderTypes.oauth2_auth_code:
-            auth_parameters = OauthProviderParameters.model_validate(
-                login_provider.authorization_parameters
+            auth_parameters = (
+                self.auth_controller.login_provider_registry.get_auth_parameters(
+                    login_provider
+                )
             )
             token_request_data = {
                 "client_id": auth_parameters.client_id,
@@ -99,8 +99,12 @@ class OAuthController(BaseController):
             ):
                 token_auth = (auth_parameters.client_id, auth_parameters.client_secret)
             try:
-                res = httpx.post(
+                # Not retried. The authorization code can only be used once.
+                res = await self.auth_controller.provider_resilience.request(
+                    login_provider.id,
+                    "POST",
                     auth_parameters.token_endpoint,
+                    timeout=auth_parameters.request_timeout,
                     auth=token_auth,
                     data=orjson.loads(orjson.dumps(token_request_data)),
                 )
@@ -115,11 +119,10 @@ class OAuthController(BaseController):
                     message="Unauthorized. Failed to get token from Oauth Server"
                 ) from e
 
-            config_dict = _config.model_dump()
             access_token: str = res["access_token"]
             id_token: str = res["id_token"]
             expires_in = None
-            if config_dict.get("auth_cookie_set_expires", False):
+            if _config.auth_cookie_set_expires:
                 expires_in = res.get("expires_in", None)
                 if expires_in:
                     expires_in = datetime.now(tz=timezone.utc) + timedelta(
@@ -130,20 +133,20 @@ class OAuthController(BaseController):
             response.set_cookie(
                 "X-Access-Token",
                 access_token,
-                max_age=config_dict.get("auth_cookie_max_age", None),
+                max_age=_config.auth_cookie_max_age,
                 expires=expires_in,
-                path=config_dict.get("auth_cookie_path", "/"),
-                httponly=config_dict.get("auth_cookie_httponly", True),
-                secure=config_dict.get("auth_cookie_secure", True),
+                path=_config.auth_cookie_path,
+                httponly=_config.auth_cookie_httponly,
+                secure=_config.auth_cookie_secure,
             )
             response.set_cookie(
                 "X-ID-Token",
                 id_token,
-                max_age=config_dict.get("auth_cookie_max_age", None),
+                max_age=_config.auth_cookie_max_age,
                 expires=expires_in,
-                path=config_dict.get("auth_cookie_path", "/"),
-                httponly=config_dict.get("auth_cookie_httponly", True),
-                secure=config_dict.get("auth_cookie_secure", True),
+                path=_config.auth_cookie_path,
+                httponly=_config.auth_cookie_httponly,
+                secure=_config.auth_cookie_secure,
             )
 
             return response
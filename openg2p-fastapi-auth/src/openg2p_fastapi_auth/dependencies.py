@@ -1,47 +1,58 @@
-from typing import Optional
+from typing import Any, Optional, Tuple
 
-import httpx
 from fastapi import Request
+from fastapi.routing import APIRoute
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import jwt
-from openg2p_fastapi_common.errors.http_exceptions import (
-    ForbiddenError,
-    InternalServerError,
-    UnauthorizedError,
-)
+from openg2p_fastapi_common.errors.http_exceptions import UnauthorizedError
+from openg2p_fastapi_common.utils.lazy_import import lazy_import
 
 from .config import Settings
-from .context import jwks_cache
+from .context import api_auth_policies
+from .models.auth_policy import ApiAuthPolicy
 from .models.credentials import AuthCredentials
+from .services.jwks_manager import JwksManager
+from .services.token_cache import VerifiedTokenCache
+
+jwt = lazy_import("jose.jwt")
 
 _config = Settings.get_config(strict=False)
 
 
 class JwtBearerAuth(HTTPBearer):
-    async def __call__(
-        self, request: Request
-    ) -> Optional[HTTPAuthorizationCredentials]:
-        config_dict = _config.model_dump()
-        if not config_dict.get("auth_enabled", None):
-            return None
+    _jwks_manager: JwksManager = None
+    _token_cache: VerifiedTokenCache = None
+
+    @property
+    def jwks_manager(self) -> JwksManager:
+        if not self._jwks_manager:
+            self._jwks_manager = JwksManager.get_component() or JwksManager()
+        return self._jwks_manager
+
+    @property
+    def token_cache(self) -> VerifiedTokenCache:
+        if not self._token_cache:
+            self._token_cache = (
+                VerifiedTokenCache.get_component() or VerifiedTokenCache()
+            )
+        return self._token_cache
 
-        api_call_name = str(request.scope["route"].name)
+    def post_init_route(self, route: APIRoute):
+        api_auth_policies.get()[route.name] = ApiAuthPolicy.compile(route.name, _config)
 
-        api_auth_settings = config_dict.get("auth_api_" + api_call_name, {})
+    def get_policy(self, route_name: str) -> Optional[ApiAuthPolicy]:
+        policies = api_auth_policies.get()
+        if route_name not in policies:
+            # Route was not registered through BaseController.post_init
+            policies[route_name] = ApiAuthPolicy.compile(route_name, _config)
+        return policies[route_name]
 
-        if (not api_auth_settings) or (not api_auth_settings.get("enabled", None)):
+    async def __call__(
+        self, request: Request
+    ) -> Optional[HTTPAuthorizationCredentials]:
+        policy = self.get_policy(request.scope["route"].name)
+        if not policy:
             return None
 
-        issuers_list = api_auth_settings.get("issuers", None) or config_dict.get(
-            "auth_default_issuers", []
-        )
-        audiences_list = api_auth_settings.get("audiences", None) or config_dict.get(
-            "auth_default_audiences", []
-        )
-        jwks_urls_list = api_auth_settings.get("jwks_urls", None) or config_dict.get(
-            "auth_default_jwks_urls", []
-        )
-
         jwt_token = request.headers.get("Authorization", None) or request.cookies.get(
             "X-Access-Token", None
         )
@@ -52,6 +63,36 @@ class JwtBearerAuth(HTTPBearer):
         if not jwt_token:
             raise UnauthorizedError()
 
+        token_key = self.token_cache.get_key(
+            jwt_token, jwt_id_token, policy.id_token_verify_at_hash
+        )
+        # Memoized per request, so that stacked dependencies don't verify twice.
+        if getattr(request.state, "auth_token_key", None) == token_key:
+            verified = request.state.auth_verified_token
+        else:
+            verified = self.token_cache.get(token_key)
+            if not verified:
+                verified = await self.verify_tokens(
+                    jwt_token, jwt_id_token, token_key, policy
+                )
+            request.state.auth_token_key = token_key
+            request.state.auth_verified_token = verified
+        iss, aud, credentials = verified
+        request.state.auth_credentials = credentials
+
+        policy.check_issuer_and_audience(iss, aud)
+        if policy.claim_name:
+            policy.check_claims(getattr(credentials, policy.claim_name, None))
+
+        return credentials
+
+    async def verify_tokens(
+        self,
+        jwt_token: str,
+        jwt_id_token: Optional[str],
+        token_key: bytes,
+        policy: ApiAuthPolicy,
+    ) -> Tuple[str, Any, AuthCredentials]:
         try:
             unverified_payload = jwt.get_unverified_claims(jwt_token)
         except Exception as e:
@@ -60,40 +101,18 @@ class JwtBearerAuth(HTTPBearer):
             ) from e
         iss = unverified_payload["iss"]
         aud = unverified_payload.get("aud", None)
-        if iss not in issuers_list:
-            raise UnauthorizedError(message="Unauthorized. Unknown Issuer.")
-
-        if audiences_list:
-            if (
-                (not aud)
-                or (
-                    isinstance(aud, list)
-                    and not (set(audiences_list).issubset(set(aud)))
-                )
-                or (isinstance(aud, str) and aud not in audiences_list)
-            ):
-                raise UnauthorizedError(message="Unauthorized. Unknown Audience.")
-
-        jwks = jwks_cache.get().get(iss, None)
+        policy.check_issuer_and_audience(iss, aud)
+        expires_at = unverified_payload.get("exp", None)
 
-        if not jwks:
-            try:
-                jwks_list_index = list(issuers_list).index(iss)
-                jwks_url = (
-                    jwks_urls_list[jwks_list_index]
-                    if jwks_list_index < len(jwks_urls_list)
-                    else iss.rstrip("/") + "/.well-known/jwks.json"
-                )
-
-                res = httpx.get(jwks_url)
-                res.raise_for_status()
-                jwks = res.json()
-                jwks_cache.get()[iss] = jwks
-            except Exception as e:
-                raise InternalServerError(
-                    code="G2P-AUT-500",
-                    message=f"Something went wrong while trying to fetch Jwks. {repr(e)}",
-                ) from e
+        try:
+            kid = jwt.get_unverified_header(jwt_token).get("kid", None)
+        except Exception as e:
+            raise UnauthorizedError(
+                message=f"Unauthorized. Invalid Jwt. {repr(e)}"
+            ) from e
+        jwks = await self.jwks_manager.get_jwks(
+            iss, jwks_url=policy.jwks_urls[iss], kid=kid
+        )
 
         try:
             jwt.decode(
@@ -120,34 +139,22 @@ class JwtBearerAuth(HTTPBearer):
                         "verify_aud": False,
                         "verify_iss": False,
                         "verify_sub": False,
-                        "verify_at_hash": api_auth_settings.get(
-                            "id_token_verify_at_hash",
-                            config_dict.get("default_id_token_verify_at_hash", True),
-                        ),
+                        "verify_at_hash": policy.id_token_verify_at_hash,
                     },
                 )
+                if res.get("exp", None):
+                    expires_at = min(expires_at or res["exp"], res["exp"])
                 unverified_payload = self.combine_tokens(unverified_payload, res)
             except Exception as e:
                 raise UnauthorizedError(
                     message=f"Unauthorized. Invalid Jwt ID Token. {repr(e)}"
                 ) from e
 
-        claim_to_check = api_auth_settings.get("claim_name", None)
-        claim_values = api_auth_settings.get("claim_values", None)
-        if claim_to_check:
-            claims = unverified_payload.get(claim_to_check, None)
-            if not claims:
-                raise ForbiddenError(message="Forbidden. Claim(s) missing.")
-            if isinstance(claims, str):
-                if len(claim_values) != 1 or claim_values[0] != claims:
-                    raise ForbiddenError(message="Forbidden. Claim doesn't match.")
-            else:
-                if all(x in claims for x in claim_values):
-                    raise ForbiddenError(message="Forbidden. Claim(s) don't match.")
-
         unverified_payload["credentials"] = jwt_token
 
-        return AuthCredentials.model_validate(unverified_payload)
+        verified = (iss, aud, AuthCredentials.model_validate(unverified_payload))
+        self.token_cache.set(token_key, verified, expires_at)
+        return verified
 
     @classmethod
     def combine_token_dicts(cls, *token_dicts) -> dict:
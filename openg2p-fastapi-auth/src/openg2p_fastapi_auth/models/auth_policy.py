@@ -0,0 +1,85 @@
+from typing import Any, Dict, FrozenSet, Optional
+
+from openg2p_fastapi_common.errors.http_exceptions import (
+    ForbiddenError,
+    UnauthorizedError,
+)
+from pydantic import BaseModel, ConfigDict
+
+from ..config import ApiAuthSettings, Settings
+
+
+class ApiAuthPolicy(BaseModel):
+    """
+    Auth settings of one API, resolved once from auth_api_<route name>
+    and auth_default_* settings.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    route_name: str
+    issuers: FrozenSet[str] = frozenset()
+    audiences: FrozenSet[str] = frozenset()
+    jwks_urls: Dict[str, Optional[str]] = {}
+    id_token_verify_at_hash: bool = True
+    claim_name: Optional[str] = None
+    claim_values: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def compile(cls, route_name: str, config: Settings) -> Optional["ApiAuthPolicy"]:
+        """
+        Returns None if auth is not enabled for this API.
+        """
+        if not config.auth_enabled:
+            return None
+        api_auth_settings = getattr(config, f"auth_api_{route_name}", None)
+        if not api_auth_settings:
+            return None
+        api_auth_settings = ApiAuthSettings.model_validate(api_auth_settings)
+        if not api_auth_settings.enabled:
+            return None
+
+        issuers = api_auth_settings.issuers or config.auth_default_issuers
+        jwks_urls = api_auth_settings.jwks_urls or config.auth_default_jwks_urls
+        return cls(
+            route_name=route_name,
+            issuers=frozenset(issuers),
+            audiences=frozenset(
+                api_auth_settings.audiences or config.auth_default_audiences
+            ),
+            jwks_urls={
+                iss: jwks_urls[i] if i < len(jwks_urls) else None
+                for i, iss in reversed(list(enumerate(issuers)))
+            },
+            id_token_verify_at_hash=(
+                config.auth_default_id_token_verify_at_hash
+                if api_auth_settings.id_token_verify_at_hash is None
+                else api_auth_settings.id_token_verify_at_hash
+            ),
+            claim_name=api_auth_settings.claim_name,
+            claim_values=frozenset(api_auth_settings.claim_values or []),
+        )
+
+    def check_issuer_and_audience(self, iss: str, aud: Any):
+        if iss not in self.issuers:
+            raise UnauthorizedError(message="Unauthorized. Unknown Issuer.")
+
+        if self.audiences:
+            if (
+                (not aud)
+                or (isinstance(aud, list) and not self.audiences.issubset(aud))
+                or (isinstance(aud, str) and aud not in self.audiences)
+            ):
+                raise UnauthorizedError(message="Unauthorized. Unknown Audience.")
+
+    def check_claims(self, claims: Any):
+        if not self.claim_name:
+            return
+        if not claims:
+            raise ForbiddenError(message="Forbidden. Claim(s) missing.")
+        if isinstance(claims, str):
+            if len(self.claim_values) != 1 or claims not in self.claim_values:
+                raise ForbiddenError(message="Forbidden. Claim doesn't match.")
+        else:
+            if not self.claim_values.issubset(claims):
+                raise ForbiddenError(message="Forbidden. Claim(s) don't match.")
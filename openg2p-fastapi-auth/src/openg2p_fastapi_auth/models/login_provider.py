@@ -1,8 +1,11 @@
+from enum import Enum
 from typing import List, Union
 
 from pydantic import BaseModel
 
-from .orm.login_provider import LoginProviderTypes
+
+class LoginProviderTypes(Enum):
+    oauth2_auth_code = "oauth2_auth_code"
 
 
 class LoginProviderResponse(BaseModel):
@@ -1,4 +1,3 @@
-from enum import Enum
 from typing import Any, Dict, List, Optional
 
 from openg2p_fastapi_common.models import BaseORMModelWithTimes
@@ -7,12 +6,11 @@ from sqlalchemy import Enum as SaEnum
 from sqlalchemy.orm import Mapped, mapped_column
 
 from ...config import Settings
+from ..login_provider import LoginProviderTypes
 
 _config = Settings.get_config(strict=False)
 
-
-class LoginProviderTypes(Enum):
-    oauth2_auth_code = "oauth2_auth_code"
+__all__ = ["LoginProvider", "LoginProviderTypes"]
 
 
 class LoginProvider(BaseORMModelWithTimes):
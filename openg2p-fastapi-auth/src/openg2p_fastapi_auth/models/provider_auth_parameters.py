@@ -12,6 +12,7 @@ class OauthClientAssertionType(enum.Enum):
 
 
 class OauthProviderParameters(BaseModel):
+    issuer: Optional[str] = None
     authorize_endpoint: str
     token_endpoint: str
     validate_endpoint: str
@@ -34,6 +35,10 @@ class OauthProviderParameters(BaseModel):
     code_challenge_method: str = "S256"
     extra_authorize_parameters: dict = {}
 
+    # Override auth_provider_request_timeout and auth_provider_userinfo_hedge_delay
+    request_timeout: Optional[float] = None
+    userinfo_hedge_delay: Optional[float] = None
+
     @model_validator(mode="after")
     def code_challenge_validator(self) -> "OauthProviderParameters":
         self.code_challenge = (
@@ -0,0 +1,160 @@
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from openg2p_fastapi_common.cache import create_cache
+from openg2p_fastapi_common.errors.http_exceptions import InternalServerError
+from openg2p_fastapi_common.http_client import HttpClientPool
+from openg2p_fastapi_common.service import BaseService
+from openg2p_fastapi_common.utils.single_flight import SingleFlight
+
+from ..config import Settings
+
+if TYPE_CHECKING:
+    import httpx
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+class JwksCacheEntry:
+    __slots__ = ("jwks", "kids", "fetched_at", "expires_at")
+
+    def __init__(self, jwks: dict, fetched_at: float, expires_at: float):
+        self.jwks = jwks
+        self.kids = frozenset(
+            key.get("kid") for key in jwks.get("keys", []) if key.get("kid")
+        )
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+
+
+class JwksManager(BaseService):
+    """
+    Fetches and caches JWKS per issuer.
+    - Entries live for the max-age advertised by the JWKS endpoint,
+      clamped between auth_jwks_cache_min_ttl and auth_jwks_cache_max_ttl.
+    - A token signed with an unknown kid triggers a refresh, at most once every
+      auth_jwks_refresh_min_interval seconds per issuer.
+    - Concurrent fetches for the same issuer are coalesced into one request.
+    - If a refresh fails, the stale JWKS (if any) keeps being served.
+    - With cache_backend "shared", the workers of a server share the cache.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self._jwks_uri_cache: Dict[str, str] = {}
+        self._single_flight = SingleFlight()
+        # Dict of issuer -> JwksCacheEntry. Entries expire by their expires_at.
+        self.cache = create_cache(
+            "auth_jwks",
+            max_entries=_config.auth_jwks_cache_max_entries,
+            slot_size=_config.auth_jwks_cache_slot_size,
+        )
+        self._http_client = HttpClientPool.get_component()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def http_client(self) -> HttpClientPool:
+        if not self._http_client:
+            self._http_client = HttpClientPool.get_component() or HttpClientPool()
+        return self._http_client
+
+    async def get_jwks(
+        self, iss: str, jwks_url: Optional[str] = None, kid: Optional[str] = None
+    ) -> dict:
+        entry = self.cache.get(iss, None)
+        now = time.time()
+        if entry and now < entry.expires_at:
+            if (not kid) or (kid in entry.kids):
+                self.hits += 1
+                return entry.jwks
+            if now - entry.fetched_at < _config.auth_jwks_refresh_min_interval:
+                # Unknown kid, but refreshed too recently. Verification will fail.
+                self.hits += 1
+                return entry.jwks
+        self.misses += 1
+        return await self._single_flight.do(iss, self.refresh_jwks, iss, jwks_url)
+
+    async def refresh_jwks(self, iss: str, jwks_url: Optional[str] = None) -> dict:
+        stale_entry = self.cache.get(iss, None)
+        try:
+            jwks_url = jwks_url or await self.get_jwks_url(iss)
+            res = await self.http_client.get(
+                jwks_url, timeout=_config.auth_jwks_fetch_timeout
+            )
+            res.raise_for_status()
+            jwks = res.json()
+        except Exception as e:
+            if stale_entry:
+                _logger.warning(
+                    "Error refreshing Jwks of %s. Serving stale Jwks. %s", iss, repr(e)
+                )
+                stale_entry.fetched_at = time.time()
+                stale_entry.expires_at = (
+                    stale_entry.fetched_at + _config.auth_jwks_refresh_min_interval
+                )
+                self.cache.set(iss, stale_entry)
+                return stale_entry.jwks
+            raise InternalServerError(
+                code="G2P-AUT-500",
+                message=f"Something went wrong while trying to fetch Jwks. {repr(e)}",
+            ) from e
+
+        now = time.time()
+        self.cache.set(iss, JwksCacheEntry(jwks, now, now + self.get_cache_ttl(res)))
+        return jwks
+
+    async def get_jwks_url(self, iss: str) -> str:
+        if not _config.auth_jwks_discovery_enabled:
+            return iss.rstrip("/") + "/.well-known/jwks.json"
+        jwks_url = self._jwks_uri_cache.get(iss, None)
+        if not jwks_url:
+            res = await self.http_client.get(
+                iss.rstrip("/") + "/.well-known/openid-configuration",
+                timeout=_config.auth_jwks_fetch_timeout,
+            )
+            res.raise_for_status()
+            jwks_url = res.json()["jwks_uri"]
+            self._jwks_uri_cache[iss] = jwks_url
+        return jwks_url
+
+    def get_cache_ttl(self, res: "httpx.Response") -> int:
+        ttl = _config.auth_jwks_cache_default_ttl
+        directives = [
+            directive.strip().lower()
+            for directive in res.headers.get("cache-control", "").split(",")
+        ]
+        if "no-cache" in directives or "no-store" in directives:
+            ttl = 0
+        else:
+            for directive in directives:
+                if directive.startswith("max-age="):
+                    try:
+                        ttl = int(directive.removeprefix("max-age=")) - int(
+                            res.headers.get("age", 0)
+                        )
+                    except ValueError:
+                        pass
+        return min(
+            max(ttl, _config.auth_jwks_cache_min_ttl), _config.auth_jwks_cache_max_ttl
+        )
+
+    def invalidate(self, iss: Optional[str] = None):
+        if iss:
+            self.cache.pop(iss, None)
+            self._jwks_uri_cache.pop(iss, None)
+        else:
+            self.cache.clear()
+            self._jwks_uri_cache.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            # size, max_entries, and shared (size isn't summed across workers)
+            **self.cache.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from openg2p_fastapi_common.response_cache import invalidate_response_cache
+from openg2p_fastapi_common.service import BaseService
+from openg2p_fastapi_common.utils.single_flight import SingleFlight
+
+from ..config import Settings
+from ..models.login_provider import LoginProviderTypes
+from ..models.provider_auth_parameters import OauthProviderParameters
+
+if TYPE_CHECKING:
+    from ..models.orm.login_provider import LoginProvider
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+class LoginProviderRegistry(BaseService):
+    """
+    In-memory copy of the active login providers, indexed by id and by issuer,
+    with their authorization parameters parsed ahead of time.
+    Loaded on first use, refreshed every auth_login_provider_refresh_interval seconds
+    in the background (when started) and reloaded after invalidate().
+    Each worker keeps its own copy; they are not shared through cache_backend.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self._loaded = False
+        self._providers: List["LoginProvider"] = []
+        self._by_id: Dict[int, "LoginProvider"] = {}
+        self._by_iss: Dict[str, "LoginProvider"] = {}
+        self._auth_parameters: Dict[int, OauthProviderParameters] = {}
+        self._single_flight = SingleFlight()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def normalize_iss(cls, iss: str) -> str:
+        return iss.rstrip("/")
+
+    async def load(self):
+        await self._single_flight.do("load", self._load)
+
+    async def _load(self):
+        # Imported here, so that importing the app doesn't load the ORM.
+        from ..models.orm.login_provider import LoginProvider
+
+        providers: List[LoginProvider] = await LoginProvider.get_all()
+        by_id, by_iss, auth_parameters = {}, {}, {}
+        for lp in providers:
+            by_id[lp.id] = lp
+            if lp.type == LoginProviderTypes.oauth2_auth_code:
+                try:
+                    params = OauthProviderParameters.model_validate(
+                        lp.authorization_parameters
+                    )
+                except Exception:
+                    _logger.exception("Invalid authorization parameters. Id: %s", lp.id)
+                    continue
+                auth_parameters[lp.id] = params
+                if params.issuer:
+                    by_iss.setdefault(self.normalize_iss(params.issuer), lp)
+        (
+            self._providers,
+            self._by_id,
+            self._by_iss,
+            self._auth_parameters,
+        ) = (providers, by_id, by_iss, auth_parameters)
+        self._loaded = True
+        invalidate_response_cache("auth_login_providers")
+
+    async def ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    def invalidate(self):
+        self._loaded = False
+        invalidate_response_cache("auth_login_providers")
+
+    async def get_all(self) -> List["LoginProvider"]:
+        await self.ensure_loaded()
+        return self._providers
+
+    async def get_by_id(self, id: int) -> Optional["LoginProvider"]:
+        await self.ensure_loaded()
+        return self._by_id.get(id, None)
+
+    async def get_by_iss(self, iss: str) -> Optional["LoginProvider"]:
+        await self.ensure_loaded()
+        iss = self.normalize_iss(iss)
+        lp = self._by_iss.get(iss, None)
+        if lp:
+            return lp
+        # Providers without an explicit issuer are matched against their token endpoint.
+        for lp_id, params in self._auth_parameters.items():
+            if (not params.issuer) and iss in params.token_endpoint:
+                lp = self._by_id[lp_id]
+                self._by_iss[iss] = lp
+                return lp
+        return None
+
+    def get_auth_parameters(
+        self, login_provider: "LoginProvider"
+    ) -> OauthProviderParameters:
+        params = self._auth_parameters.get(login_provider.id, None)
+        if not params:
+            params = OauthProviderParameters.model_validate(
+                login_provider.authorization_parameters
+            )
+        return params
+
+    def start_background_refresh(self):
+        if _config.auth_login_provider_refresh_interval and not self._refresh_task:
+            self._refresh_task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop_background_refresh(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(_config.auth_login_provider_refresh_interval)
+            try:
+                await self.load()
+            except Exception:
+                _logger.exception("Error refreshing login providers.")
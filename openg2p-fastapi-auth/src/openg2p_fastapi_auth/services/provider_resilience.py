@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from openg2p_fastapi_common.http_client import HttpClientPool
+from openg2p_fastapi_common.metrics import Metrics
+from openg2p_fastapi_common.service import BaseService
+from openg2p_fastapi_common.utils.lazy_import import lazy_import
+from openg2p_fastapi_common.utils.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    hedged,
+    jittered_backoff,
+)
+
+from ..config import Settings
+
+httpx = lazy_import("httpx")
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+class ProviderResilience(BaseService):
+    """
+    Makes the calls to login providers (token, userinfo), with per provider:
+    - A deadline for the whole call, retries included
+      (auth_provider_request_timeout, or the provider's request_timeout).
+    - A circuit breaker, failing calls right away with CircuitOpenError while
+      the provider keeps failing (transport errors, timeouts, 5xx and 429).
+    - Retries with jittered exponential backoff, for idempotent calls only,
+      within a retry budget shared by the calls to the provider.
+    - Optionally, hedging of idempotent calls after hedge_delay seconds,
+      also within the retry budget.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self._http_client = HttpClientPool.get_component()
+        # login provider id -> CircuitBreaker / RetryBudget
+        self.circuit_breakers: Dict[int, CircuitBreaker] = {}
+        self.retry_budgets: Dict[int, RetryBudget] = {}
+        metrics = Metrics.get_component()
+        if metrics:
+            metrics.add_collector(self.collect)
+
+    @property
+    def http_client(self) -> HttpClientPool:
+        if not self._http_client:
+            self._http_client = HttpClientPool.get_component() or HttpClientPool()
+        return self._http_client
+
+    def get_circuit_breaker(self, provider_id: int) -> CircuitBreaker:
+        breaker = self.circuit_breakers.get(provider_id, None)
+        if breaker is None:
+            breaker = self.circuit_breakers[provider_id] = CircuitBreaker(
+                _config.auth_provider_circuit_failure_threshold,
+                _config.auth_provider_circuit_reset_timeout,
+            )
+        return breaker
+
+    def get_retry_budget(self, provider_id: int) -> RetryBudget:
+        budget = self.retry_budgets.get(provider_id, None)
+        if budget is None:
+            budget = self.retry_budgets[provider_id] = RetryBudget(
+                _config.auth_provider_retry_budget_ratio,
+                _config.auth_provider_retry_budget_min,
+                _config.auth_provider_retry_budget_interval,
+            )
+        return budget
+
+    async def request(
+        self,
+        provider_id: int,
+        method: str,
+        url: str,
+        idempotent=False,
+        timeout: Optional[float] = None,
+        hedge_delay: Optional[float] = None,
+        **kwargs,
+    ) -> "httpx.Response":
+        """
+        Returns the last response (possibly 5xx), or raises the last error.
+        """
+        breaker = self.get_circuit_breaker(provider_id)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for login provider {provider_id}")
+        budget = self.get_retry_budget(provider_id)
+        budget.record_request()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or _config.auth_provider_request_timeout)
+
+        def call():
+            return self.http_client.request(method, url, **kwargs)
+
+        attempt = 0
+        while True:
+            res, error = None, None
+            try:
+                if idempotent and hedge_delay is not None:
+                    coro = hedged(call, hedge_delay, budget.try_spend)
+                else:
+                    coro = call()
+                res = await asyncio.wait_for(coro, deadline - loop.time())
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                error = e
+            if error is None and res.status_code < 500 and res.status_code != 429:
+                breaker.record_success()
+                return res
+
+            delay = jittered_backoff(
+                attempt,
+                _config.auth_provider_retry_backoff,
+                _config.auth_provider_retry_max_backoff,
+            )
+            if (
+                idempotent
+                and attempt < _config.auth_provider_max_retries
+                and loop.time() + delay < deadline
+                and budget.try_spend()
+            ):
+                attempt += 1
+                _logger.info(
+                    "Retrying %s %s (attempt %s). %s",
+                    method,
+                    url,
+                    attempt,
+                    repr(error) if error else res.status_code,
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            breaker.record_failure()
+            if error:
+                raise error
+            return res
+
+    def collect(self) -> Dict[str, tuple]:
+        circuit_open, rejected, retries = [], [], []
+        for provider_id, breaker in self.circuit_breakers.items():
+            labels = (("provider", str(provider_id)),)
+            circuit_open.append(("", labels, int(breaker.is_open)))
+            rejected.append(("", labels, breaker.rejected))
+        for provider_id, budget in self.retry_budgets.items():
+            labels = (("provider", str(provider_id)),)
+            retries.append(("", labels, budget.retries_total))
+        return {
+            "auth_provider_circuit_open": (
+                "gauge",
+                "1 if calls to the login provider are failing fast.",
+                circuit_open,
+            ),
+            "auth_provider_circuit_rejected_total": (
+                "counter",
+                "Calls to the login provider failed fast.",
+                rejected,
+            ),
+            "auth_provider_retries_total": (
+                "counter",
+                "Retries and hedged calls to the login provider.",
+                retries,
+            ),
+        }
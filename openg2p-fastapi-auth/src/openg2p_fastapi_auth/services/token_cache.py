@@ -0,0 +1,63 @@
+import hashlib
+import time
+from typing import Any, Optional, Tuple
+
+from openg2p_fastapi_common.cache import create_cache
+from openg2p_fastapi_common.service import BaseService
+
+from ..config import Settings
+from ..models.credentials import AuthCredentials
+
+_config = Settings.get_config(strict=False)
+
+
+class VerifiedTokenCache(BaseService):
+    """
+    Holds AuthCredentials of already verified (access token, id token) pairs
+    until the earliest expiry of the tokens, so that a repeated token skips
+    signature verification. Entries are (iss, aud, AuthCredentials) tuples, where
+    iss and aud are taken from the access token.
+    The cached AuthCredentials are shared between requests; treat them as read-only.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self.cache = create_cache(
+            "auth_token",
+            max_entries=_config.auth_token_cache_max_entries,
+            ttl=_config.auth_token_cache_max_ttl,
+            slot_size=_config.auth_token_cache_slot_size,
+        )
+
+    @classmethod
+    def get_key(
+        cls, access_token: str, id_token: Optional[str] = None, verify_at_hash=True
+    ) -> bytes:
+        return hashlib.sha256(
+            f"{access_token}\x00{id_token or ''}\x00{int(bool(verify_at_hash))}".encode()
+        ).digest()
+
+    def get(self, key: bytes) -> Optional[Tuple[str, Any, AuthCredentials]]:
+        if not _config.auth_token_cache_enabled:
+            return None
+        return self.cache.get(key)
+
+    def set(
+        self,
+        key: bytes,
+        entry: Tuple[str, Any, AuthCredentials],
+        expires_at: float = None,
+    ):
+        if not (_config.auth_token_cache_enabled and expires_at):
+            # Tokens without expiry are not cached.
+            return
+        ttl = expires_at - time.time()
+        if _config.auth_token_cache_max_ttl:
+            ttl = min(ttl, _config.auth_token_cache_max_ttl)
+        self.cache.set(key, entry, ttl=ttl)
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return self.cache.stats()
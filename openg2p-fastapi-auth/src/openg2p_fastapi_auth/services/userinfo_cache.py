@@ -0,0 +1,62 @@
+import hashlib
+import time
+from typing import Awaitable, Callable
+
+from openg2p_fastapi_common.cache import create_cache
+from openg2p_fastapi_common.service import BaseService
+from openg2p_fastapi_common.utils.single_flight import SingleFlight
+
+from ..config import Settings
+from ..models.credentials import AuthCredentials
+
+_config = Settings.get_config(strict=False)
+
+
+class UserinfoCache(BaseService):
+    """
+    Caches userinfo responses per (subject, access token), for at most
+    auth_userinfo_cache_ttl seconds and never beyond the token's exp.
+    Concurrent misses for the same token are coalesced into one userinfo call.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self.cache = create_cache(
+            "auth_userinfo",
+            max_entries=_config.auth_userinfo_cache_max_entries,
+            slot_size=_config.auth_userinfo_cache_slot_size,
+        )
+        self._single_flight = SingleFlight()
+
+    @classmethod
+    def get_key(cls, auth: AuthCredentials) -> tuple:
+        return (auth.sub, hashlib.sha256(auth.credentials.encode()).digest())
+
+    async def get_or_fetch(
+        self, auth: AuthCredentials, fetch: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        if not _config.auth_userinfo_cache_enabled:
+            return await fetch()
+        key = self.get_key(auth)
+        res = self.cache.get(key)
+        if res is None:
+            res = await self._single_flight.do(
+                key, self._fetch_and_set, key, auth, fetch
+            )
+        return res
+
+    async def _fetch_and_set(
+        self, key: tuple, auth: AuthCredentials, fetch: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        res = await fetch()
+        ttl = _config.auth_userinfo_cache_ttl
+        if auth.exp:
+            ttl = min(ttl, auth.exp.timestamp() - time.time())
+        self.cache.set(key, res, ttl=ttl)
+        return res
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return self.cache.stats()
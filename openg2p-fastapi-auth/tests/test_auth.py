@@ -5,3 +5,484 @@ from openg2p_fastapi_common.app import Initializer
 def test_auth_initializer():
     Initializer()
     AuthInitializer()
+
+
+def test_jwks_cache_ttl():
+    import httpx
+    from openg2p_fastapi_auth.services.jwks_manager import JwksManager
+
+    manager = JwksManager()
+    assert (
+        manager.get_cache_ttl(
+            httpx.Response(200, headers={"cache-control": "max-age=600"})
+        )
+        == 600
+    )
+    assert (
+        manager.get_cache_ttl(
+            httpx.Response(200, headers={"cache-control": "no-store"})
+        )
+        == 60
+    )
+    assert manager.get_cache_ttl(httpx.Response(200)) == 3600
+
+
+def test_api_auth_policy_claims():
+    import pytest
+    from openg2p_fastapi_auth.config import ApiAuthSettings, Settings
+    from openg2p_fastapi_auth.models.auth_policy import ApiAuthPolicy
+    from openg2p_fastapi_common.errors.http_exceptions import ForbiddenError
+
+    config = Settings.get_config(strict=False)
+    config.auth_api_test_route = ApiAuthSettings(
+        enabled=True, issuers=["iss1"], claim_name="roles", claim_values=["admin"]
+    )
+    policy = ApiAuthPolicy.compile("test_route", config)
+    assert policy.jwks_urls == {"iss1": None}
+    policy.check_claims(["admin", "user"])
+    policy.check_claims("admin")
+    with pytest.raises(ForbiddenError):
+        policy.check_claims(["user"])
+    assert ApiAuthPolicy.compile("unknown_route", config) is None
+
+
+def test_app_import_defers_orm():
+    import subprocess
+    import sys
+
+    res = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, openg2p_fastapi_auth.app; "
+            "print(sorted(m for m in sys.modules if m.startswith("
+            "('sqlalchemy', 'openg2p_fastapi_auth.models.orm', "
+            "'openg2p_fastapi_common.models'))))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert res.stdout.strip() == "[]"
+
+
+def test_lifespan_runs_common_hooks_once(monkeypatch):
+    import asyncio
+
+    from openg2p_fastapi_auth.services.login_provider_registry import (
+        LoginProviderRegistry,
+    )
+    from openg2p_fastapi_common.context import component_registry
+    from openg2p_fastapi_common.registry import Registry
+
+    calls = []
+
+    async def common_startup(self, app):
+        calls.append("common_startup")
+
+    async def common_shutdown(self, app):
+        calls.append("common_shutdown")
+
+    async def stop_background_refresh(self):
+        calls.append("auth_shutdown")
+
+    monkeypatch.setattr(Initializer, "fastapi_app_startup", common_startup)
+    monkeypatch.setattr(Initializer, "fastapi_app_shutdown", common_shutdown)
+    monkeypatch.setattr(
+        LoginProviderRegistry,
+        "start_background_refresh",
+        lambda self: calls.append("auth_startup"),
+    )
+    monkeypatch.setattr(
+        LoginProviderRegistry, "stop_background_refresh", stop_background_refresh
+    )
+
+    token = component_registry.set(Registry())
+    try:
+        # Registered like Initializer() and AuthInitializer() would be.
+        common, auth = Initializer.__new__(Initializer), AuthInitializer.__new__(
+            AuthInitializer
+        )
+        component_registry.get().extend([common, auth])
+        LoginProviderRegistry()
+
+        async def run():
+            async with common.fastapi_app_lifespan(None):
+                pass
+
+        asyncio.run(run())
+    finally:
+        component_registry.reset(token)
+    assert sorted(calls) == [
+        "auth_shutdown",
+        "auth_startup",
+        "common_shutdown",
+        "common_startup",
+    ]
+
+
+class FakeHttpClient:
+    """
+    Returns the queued responses (or raises the queued errors) in order,
+    after delay seconds, recording the urls requested.
+    """
+
+    def __init__(self, *responses, delay=0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.urls = []
+
+    async def get(self, url, **kwargs):
+        import asyncio
+
+        import httpx
+
+        self.urls.append(url)
+        await asyncio.sleep(self.delay)
+        res = self.responses.pop(0)
+        if isinstance(res, Exception):
+            raise res
+        status_code, body = res
+        return httpx.Response(status_code, json=body, request=httpx.Request("GET", url))
+
+
+def test_jwks_manager(tmp_path, monkeypatch):
+    import asyncio
+
+    import httpx
+    import pytest
+    from openg2p_fastapi_auth.services import jwks_manager as jwks_module
+    from openg2p_fastapi_auth.services.jwks_manager import JwksManager
+    from openg2p_fastapi_common.errors.http_exceptions import InternalServerError
+
+    monkeypatch.setattr(jwks_module._config, "auth_jwks_refresh_min_interval", 30)
+    iss, url = "https://iss", "https://iss/jwks"
+    jwks1 = {"keys": [{"kid": "k1"}]}
+    jwks2 = {"keys": [{"kid": "k1"}, {"kid": "k2"}]}
+    manager = JwksManager()
+    manager._http_client = FakeHttpClient((200, jwks1), delay=0.05)
+
+    async def run():
+        # Concurrent misses make one request.
+        results = await asyncio.gather(
+            *(manager.get_jwks(iss, url, kid="k1") for _ in range(5))
+        )
+        assert results == [jwks1] * 5 and len(manager._http_client.urls) == 1
+        # Unknown kid, but the JWKS was fetched too recently to refresh.
+        assert await manager.get_jwks(iss, url, kid="k2") == jwks1
+        assert len(manager._http_client.urls) == 1
+
+        # Unknown kid, once the min interval has passed, refreshes.
+        manager.cache.get(iss).fetched_at -= 31
+        manager._http_client.responses.append((200, jwks2))
+        assert await manager.get_jwks(iss, url, kid="k2") == jwks2
+        assert len(manager._http_client.urls) == 2
+        assert await manager.get_jwks(iss, url, kid="k2") == jwks2
+        assert len(manager._http_client.urls) == 2
+
+        # A failed refresh serves the stale JWKS, and retries only after the
+        # min interval.
+        entry = manager.cache.get(iss)
+        entry.fetched_at -= 31
+        manager._http_client.responses.append(httpx.ConnectError("down"))
+        assert await manager.get_jwks(iss, url, kid="k3") == jwks2
+        assert await manager.get_jwks(iss, url, kid="k3") == jwks2
+        assert len(manager._http_client.urls) == 3
+        entry = manager.cache.get(iss)
+        assert entry.expires_at - entry.fetched_at == 30
+
+        # Without a stale JWKS, a failed fetch is an error.
+        manager.invalidate(iss)
+        manager._http_client.responses.append((500, {}))
+        with pytest.raises(InternalServerError):
+            await manager.get_jwks(iss, url)
+
+    asyncio.run(run())
+    stats = manager.stats()
+    assert stats["max_entries"] == 64 and not stats.get("shared", False)
+
+    # The size of a shared cache is not summed across workers by Metrics.
+    from openg2p_fastapi_common import cache
+
+    monkeypatch.setattr(cache, "_shared_cache_dir", str(tmp_path))
+    monkeypatch.setattr(cache._config, "cache_backend", "shared")
+    assert JwksManager().stats()["shared"] is True
+
+
+def test_verified_token_cache(monkeypatch):
+    import time
+
+    import pytest
+    from openg2p_fastapi_auth.models.credentials import AuthCredentials
+    from openg2p_fastapi_auth.services import token_cache as token_cache_module
+    from openg2p_fastapi_auth.services.token_cache import VerifiedTokenCache
+
+    monkeypatch.setattr(token_cache_module._config, "auth_token_cache_max_ttl", None)
+    cache = VerifiedTokenCache()
+    key = cache.get_key("access", "id")
+    assert key != cache.get_key("access") != cache.get_key("access", "id", False)
+    entry = ("iss1", None, AuthCredentials(credentials="access"))
+
+    # Tokens without expiry, or already expired, are not cached.
+    cache.set(key, entry)
+    cache.set(key, entry, expires_at=time.time() - 1)
+    assert cache.get(key) is None
+    cache.set(key, entry, expires_at=time.time() + 60)
+    assert cache.get(key) == entry
+    # Kept until the token expires.
+    assert cache.cache._data[key][0] - time.monotonic() == pytest.approx(60, abs=1)
+
+    monkeypatch.setattr(token_cache_module._config, "auth_token_cache_max_ttl", 5)
+    cache.set(key, entry, expires_at=time.time() + 60)
+    assert cache.cache._data[key][0] - time.monotonic() == pytest.approx(5, abs=1)
+
+    monkeypatch.setattr(token_cache_module._config, "auth_token_cache_enabled", False)
+    assert cache.get(key) is None
+
+
+def test_jwt_bearer_auth_cache_hit_checks(monkeypatch):
+    import asyncio
+    import base64
+    import time
+
+    import httpx
+    from fastapi import Depends, FastAPI
+    from jose import jwt
+    from openg2p_fastapi_auth import dependencies
+    from openg2p_fastapi_auth.config import ApiAuthSettings
+    from openg2p_fastapi_auth.dependencies import JwtBearerAuth
+    from openg2p_fastapi_auth.services.token_cache import VerifiedTokenCache
+
+    config = dependencies._config
+    for route, settings in {
+        "admin_route": {"issuers": ["iss1"], "claim_values": ["admin"]},
+        "super_route": {"issuers": ["iss1"], "claim_values": ["superadmin"]},
+        "other_issuer_route": {"issuers": ["iss2"], "claim_values": ["admin"]},
+    }.items():
+        monkeypatch.setattr(
+            config,
+            f"auth_api_{route}",
+            ApiAuthSettings(enabled=True, claim_name="roles", **settings),
+            raising=False,
+        )
+
+    secret = b"test-secret-of-at-least-32-bytes"
+    jwks = {
+        "keys": [
+            {
+                "kty": "oct",
+                "kid": "k1",
+                "alg": "HS256",
+                "k": base64.urlsafe_b64encode(secret).rstrip(b"=").decode(),
+            }
+        ]
+    }
+    token = jwt.encode(
+        {"iss": "iss1", "sub": "user1", "roles": ["admin"], "exp": time.time() + 60},
+        secret,
+        algorithm="HS256",
+        headers={"kid": "k1"},
+    )
+
+    fetches = []
+
+    class FakeJwksManager:
+        async def get_jwks(self, iss, jwks_url=None, kid=None):
+            fetches.append(iss)
+            return jwks
+
+    auth = JwtBearerAuth()
+    auth._jwks_manager = FakeJwksManager()
+    auth._token_cache = VerifiedTokenCache()
+
+    async def admin_route(credentials=Depends(auth)):
+        return credentials.sub
+
+    async def super_route(credentials=Depends(auth)):
+        return credentials.sub
+
+    async def other_issuer_route(credentials=Depends(auth)):
+        return credentials.sub
+
+    app = FastAPI()
+    for route in (admin_route, super_route, other_issuer_route):
+        app.add_api_route(f"/{route.__name__}", route)
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            headers = {"Authorization": f"Bearer {token}"}
+            for _ in range(2):
+                res = await client.get("/admin_route", headers=headers)
+                assert res.status_code == 200 and res.json() == "user1"
+            assert fetches == ["iss1"]
+            # Cache hits still check the issuer, audience and claims of the route.
+            res = await client.get("/super_route", headers=headers)
+            assert res.status_code == 403
+            res = await client.get("/other_issuer_route", headers=headers)
+            assert res.status_code == 401
+            assert fetches == ["iss1"]
+
+    asyncio.run(run())
+
+
+def test_userinfo_cache(monkeypatch):
+    import asyncio
+    import time
+    from datetime import datetime, timezone
+
+    import pytest
+    from openg2p_fastapi_auth.models.credentials import AuthCredentials
+    from openg2p_fastapi_auth.services import userinfo_cache as userinfo_module
+    from openg2p_fastapi_auth.services.userinfo_cache import UserinfoCache
+
+    monkeypatch.setattr(userinfo_module._config, "auth_userinfo_cache_ttl", 60)
+    cache = UserinfoCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"sub": "user1", "name": "User"}
+
+    def expiring_in(seconds):
+        return AuthCredentials(
+            credentials=f"token-{seconds}",
+            sub="user1",
+            exp=datetime.fromtimestamp(time.time() + seconds, tz=timezone.utc),
+        )
+
+    async def run():
+        auth = expiring_in(3600)
+        # Concurrent misses make one userinfo call.
+        results = await asyncio.gather(
+            *(cache.get_or_fetch(auth, fetch) for _ in range(5))
+        )
+        assert results == [{"sub": "user1", "name": "User"}] * 5 and len(calls) == 1
+        await cache.get_or_fetch(auth, fetch)
+        assert len(calls) == 1
+        expires_at, _ = cache.cache._data[cache.get_key(auth)]
+        assert expires_at - time.monotonic() == pytest.approx(60, abs=1)
+
+        # Not kept beyond the token's exp.
+        auth = expiring_in(10)
+        await cache.get_or_fetch(auth, fetch)
+        expires_at, _ = cache.cache._data[cache.get_key(auth)]
+        assert expires_at - time.monotonic() == pytest.approx(10, abs=1)
+        # Nor at all for an expired token.
+        auth = expiring_in(-10)
+        await cache.get_or_fetch(auth, fetch)
+        await cache.get_or_fetch(auth, fetch)
+        assert len(calls) == 4
+
+        monkeypatch.setattr(
+            userinfo_module._config, "auth_userinfo_cache_enabled", False
+        )
+        await cache.get_or_fetch(expiring_in(3600), fetch)
+        assert len(calls) == 5
+
+    asyncio.run(run())
+
+
+def test_provider_resilience(monkeypatch):
+    import asyncio
+
+    import httpx
+    import pytest
+    from openg2p_fastapi_auth.services import provider_resilience as resilience_module
+    from openg2p_fastapi_auth.services.provider_resilience import ProviderResilience
+    from openg2p_fastapi_common.context import component_registry
+    from openg2p_fastapi_common.http_client import HttpClientPool
+    from openg2p_fastapi_common.registry import Registry
+    from openg2p_fastapi_common.utils.resilience import CircuitOpenError
+
+    config = resilience_module._config
+    monkeypatch.setattr(config, "auth_provider_max_retries", 2)
+    monkeypatch.setattr(config, "auth_provider_retry_backoff", 0.001)
+    monkeypatch.setattr(config, "auth_provider_retry_max_backoff", 0.001)
+    monkeypatch.setattr(config, "auth_provider_circuit_failure_threshold", 2)
+    monkeypatch.setattr(config, "auth_provider_circuit_reset_timeout", 60)
+
+    # Per path, the queued (delay, status or error) of each call, in order.
+    script = {}
+    requests = []
+
+    async def handler(request: httpx.Request):
+        requests.append((request.method, request.url.path))
+        delay, result = script[request.url.path].pop(0)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return httpx.Response(result, json={})
+
+    token = component_registry.set(Registry())
+    try:
+        pool = HttpClientPool()
+        resilience = ProviderResilience()
+    finally:
+        component_registry.reset(token)
+    pool.create_client = lambda url: httpx.AsyncClient(
+        transport=httpx.MockTransport(handler)
+    )
+    resilience._http_client = pool
+    down = httpx.ConnectError("down")
+
+    def userinfo(provider_id, path, **kwargs):
+        return resilience.request(
+            provider_id, "GET", f"https://idp{path}", idempotent=True, **kwargs
+        )
+
+    def token(provider_id, path, **kwargs):
+        return resilience.request(provider_id, "POST", f"https://idp{path}", **kwargs)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+
+        # Userinfo is retried, on 5xx and transport errors.
+        script["/userinfo"] = [(0, 503), (0, down), (0, 200)]
+        assert (await userinfo(1, "/userinfo")).status_code == 200
+        assert len(requests) == 3
+        # Up to auth_provider_max_retries times, then the last response is returned.
+        script["/userinfo"] = [(0, 503)] * 3
+        assert (await userinfo(1, "/userinfo")).status_code == 503
+        assert len(requests) == 6
+
+        # Userinfo is hedged: a slow call is raced by a second one.
+        requests.clear()
+        script["/slow"] = [(1, 200), (0, 201)]
+        start = loop.time()
+        res = await userinfo(2, "/slow", hedge_delay=0.05)
+        assert res.status_code == 201 and loop.time() - start < 0.5
+        assert len(requests) == 2
+
+        # The token request is never retried, whether it failed or not.
+        requests.clear()
+        script["/token"] = [(0, 503)]
+        assert (await token(3, "/token")).status_code == 503
+        script["/token"] = [(0, down)]
+        with pytest.raises(httpx.ConnectError):
+            await token(3, "/token")
+        assert len(requests) == 2
+
+        # Two failed calls open the breaker, which then fails calls right away.
+        with pytest.raises(CircuitOpenError):
+            await token(3, "/token")
+        with pytest.raises(CircuitOpenError):
+            await userinfo(3, "/userinfo")
+        assert len(requests) == 2
+        assert resilience.circuit_breakers[3].rejected == 2
+        # Other providers are not affected.
+        script["/userinfo"] = [(0, 200)]
+        assert (await userinfo(4, "/userinfo")).status_code == 200
+
+        # The deadline covers the whole call, retries included.
+        requests.clear()
+        script["/hang"] = [(1, 200)] * 3
+        start = loop.time()
+        with pytest.raises(asyncio.TimeoutError):
+            await userinfo(5, "/hang", timeout=0.1)
+        assert loop.time() - start < 0.5
+        assert len(requests) == 1
+
+    asyncio.run(run())
@@ -1,40 +1,100 @@
 """Module containing initialization instructions and FastAPI app"""
 import argparse
+import contextlib
+import io
 import logging
+import os
 import sys
 from contextlib import asynccontextmanager
+from typing import List, Optional
 
-import json_logging
 import orjson
-import uvicorn
 from fastapi import FastAPI
-from sqlalchemy.ext.asyncio import create_async_engine
 
 from .component import BaseComponent
 from .config import Settings, WorkerType
-from .context import app_registry, component_registry, dbengine
+from .context import (
+    app_registry,
+    component_registry,
+    config_registry,
+    dbengine,
+    dbengine_registry,
+    dbsession_maker,
+    startup_timings,
+)
+from .db import init_db_engines
 from .exception import BaseExceptionHandler
+from .http_client import HttpClientPool
+from .log_queue import CorrelationIdFilter, QueueLogHandler
+from .metrics import Metrics
+from .metrics_controller import MetricsController
+from .middleware import (
+    AdmissionControlMiddleware,
+    CompressionMiddleware,
+    RequestContextMiddleware,
+)
+from .openapi_controller import OpenAPIController, generate_openapi
+from .utils.lazy_import import lazy_import
+from .utils.profiling import get_import_times, timed_phase
+from .utils.worker_id import (
+    claim_worker_id,
+    export_worker_slot_dir,
+    remove_worker_slot_dir,
+)
+
+# Imported on first use; not needed by every command or logging mode.
+json_logging = lazy_import("json_logging")
+uvicorn = lazy_import("uvicorn")
 
 _config = Settings.get_config(strict=False)
 _logger = logging.getLogger(_config.logging_default_logger_name)
 
 
 class Initializer(BaseComponent):
-    def __init__(self, name="", **kwargs):
+    def __init__(self, name="", command: Optional[str] = None, **kwargs):
+        """
+        command is the main() command this process runs, like "getOpenAPI".
+        Defaults to the one parsed from the command line, if any.
+        """
         super().__init__(name=name, **kwargs)
-        self.initialize()
+        self.command = command if command is not None else self.parse_command()
+        with timed_phase(f"initialize:{type(self).__module__}"):
+            self.initialize()
 
     def initialize(self):
         """
         Initializes all components
         """
-        self.init_logger()
-        self.init_app()
-        self.init_db()
+        with timed_phase("init_logger"):
+            self.init_logger()
+        with timed_phase("init_app"):
+            self.init_app()
+        # getOpenAPI only needs the routes.
+        if self.command != "getOpenAPI":
+            if _config.metrics_enabled:
+                Metrics()
+            with timed_phase("init_db"):
+                self.init_db()
+            HttpClientPool()
 
         BaseExceptionHandler()
+        if _config.metrics_enabled:
+            MetricsController().post_init()
+        if app_registry.get().openapi_url:
+            OpenAPIController().post_init()
 
     def init_logger(self):
+        if _config.logging_queue_enabled:
+            handler = QueueLogHandler(
+                QueueLogHandler.open_streams(_config.logging_file_name),
+                max_size=_config.logging_queue_max_size,
+                batch_size=_config.logging_queue_batch_size,
+                flush_interval=_config.logging_queue_flush_interval,
+            )
+            handler.addFilter(CorrelationIdFilter())
+            _logger.setLevel(getattr(logging, _config.logging_level))
+            _logger.addHandler(handler)
+            return _logger
         json_logging.init_fastapi(enable_json=True)
         json_logging.JSON_SERIALIZER = lambda log: orjson.dumps(log).decode("utf-8")
         _logger.setLevel(getattr(logging, _config.logging_level))
@@ -45,11 +105,7 @@ class Initializer(BaseComponent):
         return _logger
 
     def init_db(self):
-        if _config.db_datasource:
-            db_engine = create_async_engine(
-                _config.db_datasource, echo=_config.db_logging
-            )
-            dbengine.set(db_engine)
+        init_db_engines()
 
     def init_app(self):
         app = FastAPI(
@@ -67,7 +123,18 @@ class Initializer(BaseComponent):
             lifespan=self.fastapi_app_lifespan,
             root_path=_config.openapi_root_path if _config.openapi_root_path else "",
         )
-        json_logging.init_request_instrument(app)
+        # Last added runs first.
+        if _config.compression_enabled:
+            app.add_middleware(CompressionMiddleware)
+        if (
+            _config.admission_max_concurrency > 0
+            or _config.admission_route_max_concurrency
+        ):
+            app.add_middleware(AdmissionControlMiddleware)
+        if _config.logging_queue_enabled:
+            app.add_middleware(RequestContextMiddleware)
+        else:
+            json_logging.init_request_instrument(app)
         app_registry.set(app)
         _logger.info(
             "Worker ID - %s. Docker Pod ID - %s",
@@ -79,9 +146,24 @@ class Initializer(BaseComponent):
     def return_app(self):
         return app_registry.get()
 
-    def main(self):
+    def parse_command(self, argv: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Returns the command main() would run with argv (default sys.argv[1:]),
+        or None if argv is not a valid command line of main(), like when the app
+        is imported by gunicorn or uvicorn.
+        """
+        try:
+            with contextlib.redirect_stderr(io.StringIO()):
+                args, _ = self.get_parser().parse_known_args(argv)
+        except SystemExit:
+            return None
+        return args.command
+
+    def get_parser(self) -> argparse.ArgumentParser:
         parser = argparse.ArgumentParser(description="FastApi Common Server")
-        subparsers = parser.add_subparsers(help="List Commands.", required=True)
+        subparsers = parser.add_subparsers(
+            help="List Commands.", dest="command", required=True
+        )
         run_subparser = subparsers.add_parser("run", help="Run API Server.")
         run_subparser.set_defaults(func=self.run_server)
         migrate_subparser = subparsers.add_parser(
@@ -95,31 +177,66 @@ class Initializer(BaseComponent):
             "filepath", help="Path of the Output OpenAPI Json File."
         )
         openapi_subparser.set_defaults(func=self.get_openapi)
-        args = parser.parse_args()
+        profile_subparser = subparsers.add_parser(
+            "profile-startup", help="Print startup and import timings as Json."
+        )
+        profile_subparser.add_argument(
+            "--module",
+            default=_config.server_app.split(":")[0],
+            help="Module to profile imports of. Defaults to module of server_app.",
+        )
+        profile_subparser.add_argument(
+            "--top", type=int, default=20, help="Number of slowest imports to list."
+        )
+        profile_subparser.set_defaults(func=self.profile_startup)
+        return parser
+
+    def main(self, argv: Optional[List[str]] = None):
+        args = self.get_parser().parse_args(argv)
+        self.command = args.command
         args.func(args)
 
     def run_server(self, args):
         app = self.return_app()
+        openapi_controller = OpenAPIController.get_component()
+        if openapi_controller:
+            with timed_phase("openapi"):
+                openapi_controller.load()
         if _config.worker_type == WorkerType.gunicorn:
-            import subprocess
+            from .server import GunicornServer
 
-            subprocess.run(
-                f'gunicorn "main:app" --workers {_config.no_of_workers} --worker-class uvicorn.workers.UvicornWorker --bind {_config.host}:{_config.port}',
-                shell=True,
-            )
+            GunicornServer(app).run()
         if _config.worker_type == WorkerType.uvicorn:
-            import subprocess
+            from .server import get_event_loop_type, get_http_protocol_type
 
-            subprocess.run(
-                f'uvicorn "main:app" --workers {_config.no_of_workers} --host {_config.host} --port {_config.port}',
-                shell=True,
-            )
+            # Keyed by this process, which is also the worker with a single worker.
+            slot_dir = export_worker_slot_dir(_config.worker_slot_dir)
+            for config in config_registry.get():
+                config.worker_slot_dir = slot_dir
+            try:
+                uvicorn.run(
+                    _config.server_app,
+                    host=_config.host,
+                    port=_config.port,
+                    workers=_config.no_of_workers,
+                    loop=get_event_loop_type(),
+                    http=get_http_protocol_type(),
+                    limit_max_requests=_config.server_max_requests or None,
+                    timeout_keep_alive=_config.server_keepalive,
+                    timeout_graceful_shutdown=_config.server_graceful_timeout,
+                )
+            finally:
+                remove_worker_slot_dir()
         if _config.worker_type == WorkerType.local:
+            from .server import get_event_loop_type, get_http_protocol_type
+
             uvicorn.run(
                 app,
                 host=_config.host,
                 port=_config.port,
                 access_log=False,
+                loop=get_event_loop_type(),
+                http=get_http_protocol_type(),
                 # The following is not possible
                 # workers=_config.no_of_workers
             )
@@ -131,18 +248,62 @@ class Initializer(BaseComponent):
     def get_openapi(self, args):
         app = self.return_app()
         with open(args.filepath, "wb+") as f:
-            f.write(orjson.dumps(app.openapi(), option=orjson.OPT_INDENT_2))
+            f.write(orjson.dumps(generate_openapi(app), option=orjson.OPT_INDENT_2))
             f.write(b"\n")
 
+    def profile_startup(self, args):
+        app = self.return_app()
+        with timed_phase("openapi"):
+            generate_openapi(app)
+        res = {
+            "phases_ms": startup_timings.get(),
+            "imports_ms": [
+                {"module": module, "self": self_ms, "cumulative": cumulative_ms}
+                for module, self_ms, cumulative_ms in get_import_times(
+                    args.module, args.top
+                )
+            ],
+        }
+        sys.stdout.buffer.write(orjson.dumps(res, option=orjson.OPT_INDENT_2) + b"\n")
+
+    def init_worker_id(self):
+        """
+        Claims a worker slot, if the worker id isn't set already. Done at startup,
+        which runs in the workers only, so that a master that loads the app
+        (gunicorn with preload_app) doesn't claim one.
+        """
+        if _config.worker_type == WorkerType.local or _config.worker_id >= 0:
+            return
+        worker_id = claim_worker_id(_config.worker_slot_dir)
+        for config in config_registry.get():
+            config.worker_id = worker_id
+            config.worker_pid = os.getpid()
+        _logger.info("Worker ID - %s. PID - %s", worker_id, os.getpid())
+
     async def fastapi_app_startup(self, app: FastAPI):
         # Overload this method to execute something on startup
-        pass
+        self.init_worker_id()
+        openapi_controller = OpenAPIController.get_component()
+        if openapi_controller:
+            # When not already loaded before the workers were started
+            openapi_controller.load()
+        metrics = Metrics.get_component()
+        if metrics:
+            metrics.start_snapshot_writer()
 
     async def fastapi_app_shutdown(self, app: FastAPI):
         # Overload this method to execute something on shutdown
-        if dbengine.get():
-            await dbengine.get().dispose()
+        metrics = Metrics.get_component()
+        if metrics:
+            await metrics.stop_snapshot_writer()
+        if dbengine_registry.get():
+            await dbengine_registry.get().dispose()
+            dbengine_registry.set(None)
             dbengine.set(None)
+            dbsession_maker.set(None)
+        http_client_pool = HttpClientPool.get_component()
+        if http_client_pool:
+            await http_client_pool.aclose()
 
     @asynccontextmanager
     async def fastapi_app_lifespan(self, app: FastAPI):
@@ -0,0 +1,98 @@
+"""Module containing the factory of the caches used by this library"""
+
+import atexit
+import logging
+import os
+import shutil
+import stat
+import tempfile
+from typing import Optional
+
+from .config import Settings
+from .utils.cache_backend import CacheBackend
+from .utils.ttl_cache import TTLCache
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+_shared_cache_dir: Optional[str] = None
+
+
+def get_shared_cache_dir() -> str:
+    """
+    cache_shared_dir, else a private (0700) directory created for this server, on
+    first use. Its path is passed on, through the environment, to the workers,
+    forked or spawned, so that they all open the same cache files. The process that
+    creates the directory removes it on exit.
+    Cache files hold pickles, so a given directory must be owned by the current
+    user and not writable by others (see check_shared_cache_dir).
+    """
+    global _shared_cache_dir
+    if _shared_cache_dir:
+        return _shared_cache_dir
+    shared_dir = _config.cache_shared_dir or os.environ.get(
+        "common_cache_shared_dir", None
+    )
+    if shared_dir:
+        os.makedirs(shared_dir, mode=0o700, exist_ok=True)
+        check_shared_cache_dir(shared_dir)
+    else:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        shared_dir = tempfile.mkdtemp(prefix="openg2p-cache-", dir=base)
+        os.environ["common_cache_shared_dir"] = shared_dir
+        owner_pid = os.getpid()
+        atexit.register(
+            lambda: os.getpid() == owner_pid
+            and shutil.rmtree(shared_dir, ignore_errors=True)
+        )
+    _shared_cache_dir = shared_dir
+    return shared_dir
+
+
+def check_shared_cache_dir(path: str):
+    """
+    Raises PermissionError unless path is a directory (not a symlink) owned by the
+    current user and not writable by group or others.
+    """
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"Shared cache directory {path} is not a directory")
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"Shared cache directory {path} is owned by another user")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(
+            f"Shared cache directory {path} is writable by group or others"
+        )
+
+
+def create_cache(
+    name: str,
+    max_entries: int = 1024,
+    ttl: Optional[float] = None,
+    backend: Optional[str] = None,
+    slot_size: Optional[int] = None,
+) -> CacheBackend:
+    """
+    Returns a cache of the given backend (default cache_backend):
+    - "memory": TTLCache, in process memory.
+    - "shared": SharedMemoryCache, shared by all workers on the host,
+      with values of up to slot_size (default cache_shared_slot_size) bytes.
+      Falls back to "memory" if the cache file can't be set up.
+    """
+    backend = backend or _config.cache_backend
+    if backend == "shared":
+        slot_size = slot_size or _config.cache_shared_slot_size
+        try:
+            from .utils.shared_memory_cache import SharedMemoryCache
+
+            path = os.path.join(
+                get_shared_cache_dir(), f"{name}-{max_entries}-{slot_size}.cache"
+            )
+            return SharedMemoryCache(
+                path, max_entries=max_entries, ttl=ttl, slot_size=slot_size
+            )
+        except (ImportError, OSError) as e:
+            _logger.warning(
+                "Shared cache %s unavailable. Using memory cache. %s", name, repr(e)
+            )
+    return TTLCache(max_entries=max_entries, ttl=ttl)
@@ -1,28 +1,48 @@
 """Module from initializing Component Class"""
 
+from typing import Callable, Dict, Tuple
+
+from fastapi import Depends, Request
+
 from .context import component_registry
+from .registry import Scope, building_request_scoped
+
+# (component class, name) -> fastapi dependency callable
+_dependencies: Dict[Tuple[type, str], Callable] = {}
 
 
 class BaseComponent:
     def __init__(self, name=""):
         self.name = name
-        component_registry.get().append(self)
+        # Request scoped instances live in the request, not in the registry.
+        if not building_request_scoped.get():
+            component_registry.get().append(self)
 
     @classmethod
     def get_component(cls, name="", strict=False):
-        for component in component_registry.get():
-            result = None
-            if strict:
-                if cls is type(component):
-                    result = component
-            else:
-                if isinstance(component, cls):
-                    result = component
-
-            if result:
-                if name:
-                    if name == result.name:
-                        return result
-                else:
-                    return result
-        return None
+        return component_registry.get().get(cls, name=name, strict=strict)
+
+    @classmethod
+    def register_factory(
+        cls, factory: Callable, scope: Scope = Scope.singleton, name=""
+    ):
+        """
+        Singleton factories are called on the first get_component that finds nothing.
+        Request scoped factories are called once per request that depends() on them.
+        """
+        component_registry.get().add_factory(cls, factory, scope=scope, name=name)
+
+    @classmethod
+    def depends(cls, name=""):
+        """
+        FastAPI dependency that resolves this component.
+        Example: service: MyService = MyService.depends()
+        """
+        key = (cls, name)
+        if key not in _dependencies:
+
+            async def resolve_component(request: Request):
+                return await component_registry.get().resolve(cls, name, request)
+
+            _dependencies[key] = resolve_component
+        return Depends(_dependencies[key])
@@ -2,13 +2,15 @@
 import os
 from enum import Enum
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from . import __version__
 from .context import config_registry
+from .utils.profiling import timed_phase
+from .utils.resources import get_auto_worker_count
 
 
 class WorkerType(Enum):
@@ -25,16 +27,66 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
 
+    # 0 or less: one worker per CPU, limited by memory (see server_worker_memory_mb)
     no_of_workers: int = 1
     worker_id: int = -1
     worker_pid: int = -1
     worker_type: WorkerType = WorkerType.local
     docker_pod_id: str = ""
     docker_pod_name: str = ""
+    # Directory holding worker slot lock files. Defaults to a temp directory
+    # specific to the server's master process (set by run_server, else the parent
+    # process of the worker), removed when it exits.
+    worker_slot_dir: Optional[str] = None
+
+    # Import string of the app, used by uvicorn worker type (which can't preload)
+    server_app: str = "main:app"
+    server_worker_memory_mb: int = 512
+    server_max_requests: int = 0
+    server_max_requests_jitter: int = 0
+    server_timeout: int = 60
+    server_graceful_timeout: int = 30
+    server_keepalive: int = 5
 
     logging_default_logger_name: str = "app"
     logging_level: str = "INFO"
     logging_file_name: Optional[Path] = None
+    # Queue mode: records are written by a background thread, in batches,
+    # instead of by json_logging handlers on the event loop thread.
+    logging_queue_enabled: bool = False
+    logging_queue_max_size: int = 10000
+    logging_queue_batch_size: int = 500
+    logging_queue_flush_interval: float = 0.5
+    # Access logs and correlation ids (queue mode only)
+    logging_access_log_enabled: bool = True
+    logging_access_log_sample_rate: float = 1.0
+    logging_correlation_id_header: str = "X-Correlation-ID"
+
+    # Streamed responses (BaseController.stream_response) are sent in chunks of about this size
+    response_stream_chunk_size: int = 65536
+
+    # Backend of the auth and ORM caches: "memory" (per process) or "shared"
+    # (memory mapped files shared by the workers on a host). See cache.create_cache
+    cache_backend: str = "memory"
+    # Directory of the shared cache files. Defaults to a private directory per
+    # server. If set, it must be owned by the server's user and not writable by
+    # group or others, or the shared cache is not used.
+    cache_shared_dir: Optional[str] = None
+    # Default max size of a pickled value. A shared cache takes
+    # max_entries * (slot_size + 32) bytes of the tmpfs; it falls back to the memory
+    # backend if that isn't free. Keep the total within the tmpfs size (docker's
+    # /dev/shm is 64 MB by default): running out of it kills the worker (SIGBUS).
+    cache_shared_slot_size: int = 4096
+
+    # Defaults of response_cache.cache_response
+    response_cache_default_ttl: float = 60
+    response_cache_max_entries: int = 1024
+
+    exception_4xx_log_level: str = "INFO"
+    exception_4xx_log_sample_rate: float = 1.0
+    # Max 4xx logs per error code per interval. 0 means no limit.
+    exception_4xx_log_rate_limit: int = 10
+    exception_4xx_log_rate_limit_interval: float = 60
 
     openapi_title: str = "Common"
     openapi_description: str = """
@@ -51,6 +103,44 @@ class Settings(BaseSettings):
     openapi_license_url: str = "https://www.mozilla.org/en-US/MPL/2.0/"
     openapi_root_path: str = ""
     openapi_common_api_prefix: str = ""
+    # Document written by getOpenAPI at build time. Served instead of generating it.
+    openapi_schema_file: Optional[Path] = None
+
+    # Response compression (CompressionMiddleware). Brotli needs the brotli extra.
+    compression_enabled: bool = False
+    compression_minimum_size: int = 1024
+    compression_content_types: List[str] = [
+        "application/json",
+        "application/x-ndjson",
+        "text/",
+    ]
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+
+    # Admission control (AdmissionControlMiddleware). A limit of 0 disables it.
+    admission_max_concurrency: int = 0
+    # Path prefix -> max concurrent requests. Example: {"/auth/": 50}
+    admission_route_max_concurrency: Dict[str, int] = {}
+    admission_max_queue: int = 100
+    admission_queue_timeout: float = 1
+    admission_retry_after: int = 1
+    admission_exempt_paths: List[str] = ["/ping", "/health"]
+
+    http_client_connect_timeout: float = 5
+    http_client_read_timeout: float = 30
+    http_client_write_timeout: float = 30
+    http_client_pool_timeout: float = 5
+    http_client_max_connections: int = 100
+    http_client_max_keepalive_connections: int = 20
+    http_client_keepalive_expiry: float = 30
+    http_client_http2: bool = False
+
+    # /metrics is not authenticated. Keep it off public ingresses when enabled.
+    metrics_enabled: bool = False
+    metrics_path: str = "/metrics"
+    # Directory shared by the workers of a pod, to aggregate metrics across workers.
+    metrics_multiprocess_dir: Optional[str] = None
+    metrics_snapshot_interval: float = 5
 
     # If empty will be constructed like this
     # f"{db_driver}://{db_username}:{db_password}@{db_hostname}:{db_port}/{db_dbname}"
@@ -63,6 +153,27 @@ class Settings(BaseSettings):
     db_dbname: Optional[str] = None
     db_logging: Optional[bool] = False
 
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    # Max connections that all workers of this pod together may open.
+    # If set, pool size + max overflow of each worker is capped at budget / workers
+    # (no_of_workers, or one per CPU if that is 0 or less; 1 with the local
+    # worker_type).
+    db_connection_budget: Optional[int] = None
+    # asyncpg only. Set these to 0 when behind pgbouncer in transaction mode.
+    db_statement_cache_size: Optional[int] = None
+    db_prepared_statement_cache_size: Optional[int] = None
+    db_bulk_batch_size: int = 1000
+    # Rows fetched per round trip by stream_all (server side cursor)
+    db_stream_fetch_size: int = 1000
+
+    # Read replicas. Read-only queries are sent round-robin to healthy replicas.
+    db_read_datasources: List[str] = []
+    db_replica_unhealthy_cooldown: int = 30
+
     @model_validator(mode="after")
     def validate_db_datasource(self) -> "Settings":
         if self.db_datasource:
@@ -85,49 +196,27 @@ class Settings(BaseSettings):
 
     @model_validator(mode="after")
     def validate_worker_ids_and_pod_ids(self) -> "Settings":
+        if self.no_of_workers <= 0:
+            self.no_of_workers = get_auto_worker_count(self.server_worker_memory_mb)
         self.set_current_worker_id()
         self.set_current_docker_pod_id()
         return self
 
     @classmethod
     def get_config(cls, strict=True):
-        result = None
-        for config in config_registry.get():
-            if strict:
-                if cls is type(config):
-                    result = config
-                    break
-            else:
-                if isinstance(config, cls):
-                    result = config
-                    break
+        result = config_registry.get().get(cls, strict=strict)
         if not result:
-            result = cls()
+            with timed_phase(f"config:{cls.__name__}"):
+                result = cls()
             config_registry.get().append(result)
         return result
 
     def set_current_worker_id(self):
         if self.worker_type == WorkerType.local:
             return
-        try:
-            self.worker_pid = os.getpid()
-            import subprocess
-
-            pid_arr = sorted(
-                [
-                    int(a)
-                    for a in str(
-                        subprocess.check_output(
-                            ["pgrep", "-f", self.worker_type.value]
-                        ),
-                        "UTF-8",
-                    ).split("\n")
-                    if a
-                ]
-            )
-            self.worker_id = pid_arr.index(self.worker_pid) - 1
-        except Exception:
-            pass
+        self.worker_pid = os.getpid()
+        # worker_id is set explicitly (through env), by the gunicorn master, or
+        # claimed by the worker at startup. See Initializer.init_worker_id.
 
     def set_current_docker_pod_id(self):
         self.docker_pod_id = str(self.docker_pod_name.split("-")[-1])
@@ -1,19 +1,52 @@
 """Module for initializing Contexts"""
 
 from contextvars import ContextVar
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
 from fastapi import FastAPI
-from pydantic_settings import BaseSettings
-from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .registry import Registry
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
 
 app_registry: ContextVar[Optional[FastAPI]] = ContextVar("app_registry", default=None)
 
-config_registry: ContextVar[List[BaseSettings]] = ContextVar(
-    "config_registry", default=[]
+# Registries are process wide, so they are the defaults rather than set per context.
+config_registry: ContextVar[Registry] = ContextVar(
+    "config_registry", default=Registry()
+)
+
+# Registry of BaseComponents
+component_registry: ContextVar[Registry] = ContextVar(
+    "component_registry", default=Registry()
+)
+
+dbengine: ContextVar["AsyncEngine"] = ContextVar("dbengine", default=None)
+
+dbsession_maker: ContextVar["async_sessionmaker"] = ContextVar(
+    "dbsession_maker", default=None
 )
 
-# The following is a list of BaseComponents
-component_registry: ContextVar[List] = ContextVar("component_registry", default=[])
+# DbEngineRegistry of primary and read replica engines
+dbengine_registry: ContextVar[Any] = ContextVar("dbengine_registry", default=None)
 
-dbengine: ContextVar[AsyncEngine] = ContextVar("dbengine", default=None)
+# Dict of ORM model class -> read-through cache of the model. See BaseORMModelWithId.__cache__
+orm_cache_registry: ContextVar[Dict[type, Any]] = ContextVar(
+    "orm_cache_registry", default={}
+)
+
+# Dict of name -> ResponseCache of an endpoint. See response_cache.cache_response
+response_cache_registry: ContextVar[Dict[str, Any]] = ContextVar(
+    "response_cache_registry", default={}
+)
+
+# Correlation id of the request being served. Set by RequestContextMiddleware
+request_correlation_id: ContextVar[Optional[str]] = ContextVar(
+    "request_correlation_id", default=None
+)
+
+# Phase name -> time taken in ms, during startup. See utils.profiling.timed_phase
+startup_timings: ContextVar[Dict[str, float]] = ContextVar(
+    "startup_timings", default={}
+)
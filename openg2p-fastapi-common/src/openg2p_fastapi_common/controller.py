@@ -1,13 +1,20 @@
 """Module from initializing base controllers"""
 
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Optional
+
+import orjson
 from fastapi.datastructures import Default
-from fastapi.responses import ORJSONResponse
-from fastapi.routing import APIRouter
+from fastapi.dependencies.models import Dependant
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.routing import APIRoute, APIRouter
+from pydantic import BaseModel
 
 from .component import BaseComponent
 from .config import Settings
 from .context import app_registry
 from .errors import ErrorListResponse
+from .routing import BaseAPIRoute
+from .utils.profiling import timed_phase
 
 _config = Settings.get_config(strict=False)
 
@@ -17,6 +24,8 @@ class BaseController(BaseComponent):
         super().__init__(name=name)
         if "default_response_class" not in kwargs:
             kwargs["default_response_class"] = Default(ORJSONResponse)
+        if "route_class" not in kwargs:
+            kwargs["route_class"] = BaseAPIRoute
         self.router = APIRouter(**kwargs)
         self.router.responses = {
             401: {"model": ErrorListResponse},
@@ -28,5 +37,81 @@ class BaseController(BaseComponent):
             self.router.prefix = _config.openapi_common_api_prefix
 
     def post_init(self):
-        app_registry.get().include_router(self.router)
+        with timed_phase(f"router:{type(self).__name__}"):
+            app_registry.get().include_router(self.router)
+            for route in self.router.routes:
+                if isinstance(route, APIRoute):
+                    self.post_init_route(route, route.dependant)
         return self
+
+    def post_init_route(self, route: APIRoute, dependant: Dependant):
+        # Dependencies (like JwtBearerAuth) can implement post_init_route(route)
+        # to precompute their per-route state at startup instead of per request.
+        for dependency in dependant.dependencies:
+            if dependency.call and not isinstance(dependency.call, type):
+                hook = getattr(dependency.call, "post_init_route", None)
+                if callable(hook):
+                    hook(route)
+            self.post_init_route(route, dependency)
+
+    def stream_response(
+        self,
+        rows: AsyncIterable[Any],
+        ndjson=True,
+        serialize: Optional[Callable[[Any], Any]] = None,
+        **kwargs,
+    ) -> StreamingResponse:
+        """
+        Streams rows, like from BaseORMModelWithId.stream_all, as NDJSON (one json
+        document per line) or, with ndjson=False, as a json array.
+        Rows are encoded with orjson as they arrive, after serialize if given.
+        Pydantic models and ORM models (their columns) are encoded as objects.
+        About response_stream_chunk_size bytes are sent at a time, and the next rows
+        are only read once the client has taken the previous chunk.
+        kwargs are passed to StreamingResponse.
+        """
+        return StreamingResponse(
+            self.encode_stream(rows, ndjson, serialize),
+            media_type="application/x-ndjson" if ndjson else "application/json",
+            **kwargs,
+        )
+
+    async def encode_stream(
+        self,
+        rows: AsyncIterable[Any],
+        ndjson=True,
+        serialize: Optional[Callable[[Any], Any]] = None,
+    ) -> AsyncIterator[bytes]:
+        chunk_size = _config.response_stream_chunk_size
+        separator = b"\n" if ndjson else b","
+        buffer = bytearray() if ndjson else bytearray(b"[")
+        first = True
+        try:
+            async for row in rows:
+                if serialize:
+                    row = serialize(row)
+                if not ndjson and not first:
+                    buffer += separator
+                buffer += orjson.dumps(row, default=_encode_default)
+                if ndjson:
+                    buffer += separator
+                first = False
+                if len(buffer) >= chunk_size:
+                    yield bytes(buffer)
+                    buffer.clear()
+        finally:
+            aclose = getattr(rows, "aclose", None)
+            if aclose:
+                await aclose()
+        if not ndjson:
+            buffer += b"]"
+        if buffer:
+            yield bytes(buffer)
+
+
+def _encode_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json", by_alias=True)
+    if hasattr(obj, "to_snapshot"):
+        return obj.to_snapshot()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
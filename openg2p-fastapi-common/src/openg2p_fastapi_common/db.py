@@ -0,0 +1,198 @@
+"""Module containing DB engine and session helpers"""
+
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+
+from .config import Settings, WorkerType
+from .context import dbengine, dbengine_registry, dbsession_maker
+from .metrics import Metrics
+from .utils.lazy_import import lazy_import
+from .utils.resources import get_auto_worker_count
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import URL
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+# Loaded with the first engine, so that importing the app doesn't load them.
+sa_engine = lazy_import("sqlalchemy.engine")
+sa_asyncio = lazy_import("sqlalchemy.ext.asyncio")
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+def create_db_engine(datasource: str) -> "AsyncEngine":
+    url = sa_engine.make_url(datasource)
+    if (
+        url.get_driver_name() == "asyncpg"
+        and _config.db_prepared_statement_cache_size is not None
+    ):
+        url = url.update_query_dict(
+            {
+                "prepared_statement_cache_size": str(
+                    _config.db_prepared_statement_cache_size
+                )
+            }
+        )
+    return sa_asyncio.create_async_engine(url, **get_db_engine_options(url))
+
+
+def get_worker_count() -> int:
+    """
+    Workers of this pod that each open their own pool.
+    """
+    if _config.worker_type == WorkerType.local:
+        return 1
+    if _config.no_of_workers <= 0:
+        # One per CPU, if not already resolved by the Settings validator.
+        return get_auto_worker_count(_config.server_worker_memory_mb)
+    return _config.no_of_workers
+
+
+def get_db_engine_options(url: "URL") -> dict:
+    options = {"echo": _config.db_logging, "pool_pre_ping": _config.db_pool_pre_ping}
+    if not url.get_backend_name() == "sqlite":
+        pool_size = _config.db_pool_size
+        max_overflow = _config.db_max_overflow
+        if _config.db_connection_budget:
+            per_worker = max(1, _config.db_connection_budget // get_worker_count())
+            pool_size = min(pool_size, per_worker)
+            max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+        options.update(
+            {
+                "pool_size": pool_size,
+                "max_overflow": max_overflow,
+                "pool_timeout": _config.db_pool_timeout,
+                "pool_recycle": _config.db_pool_recycle,
+            }
+        )
+    if (
+        url.get_driver_name() == "asyncpg"
+        and _config.db_statement_cache_size is not None
+    ):
+        options["connect_args"] = {
+            "statement_cache_size": _config.db_statement_cache_size
+        }
+    return options
+
+
+class DbEngineRegistry:
+    """
+    Named engines. "primary" is the read-write engine. Engines registered with
+    read_only=True are read replicas, picked round-robin for read-only queries.
+    A replica that fails to connect is skipped for db_replica_unhealthy_cooldown seconds.
+    """
+
+    PRIMARY = "primary"
+
+    def __init__(self):
+        self._engines: Dict[str, "AsyncEngine"] = {}
+        self._session_makers: Dict[str, "async_sessionmaker"] = {}
+        self._replicas: List[str] = []
+        self._unhealthy_until: Dict[str, float] = {}
+        self._replica_counter = itertools.count()
+
+    def register(self, name: str, engine: "AsyncEngine", read_only=False):
+        self._engines[name] = engine
+        self._session_makers[name] = sa_asyncio.async_sessionmaker(
+            engine, expire_on_commit=False
+        )
+        if read_only and name not in self._replicas:
+            self._replicas.append(name)
+
+    def get(self, name: str = PRIMARY) -> Optional["AsyncEngine"]:
+        return self._engines.get(name, None)
+
+    def get_session_maker(self, name: str = PRIMARY) -> Optional["async_sessionmaker"]:
+        return self._session_makers.get(name, None)
+
+    def get_read_replica(self) -> Optional[str]:
+        """
+        Returns name of the next healthy replica, or None if there is none.
+        """
+        now = time.monotonic()
+        for _ in range(len(self._replicas)):
+            name = self._replicas[next(self._replica_counter) % len(self._replicas)]
+            if self._unhealthy_until.get(name, 0) <= now:
+                return name
+        return None
+
+    def mark_unhealthy(self, name: str):
+        self._unhealthy_until[name] = (
+            time.monotonic() + _config.db_replica_unhealthy_cooldown
+        )
+
+    def items(self):
+        return self._engines.items()
+
+    async def dispose(self):
+        for engine in self._engines.values():
+            await engine.dispose()
+
+
+def init_db_engines() -> DbEngineRegistry:
+    registry = DbEngineRegistry()
+    if _config.db_datasource:
+        registry.register(
+            DbEngineRegistry.PRIMARY, create_db_engine(_config.db_datasource)
+        )
+    for i, datasource in enumerate(_config.db_read_datasources):
+        registry.register(f"replica_{i}", create_db_engine(datasource), read_only=True)
+    metrics = Metrics.get_component()
+    if metrics:
+        for name, engine in registry.items():
+            metrics.instrument_engine(name, engine)
+    dbengine_registry.set(registry)
+    dbengine.set(registry.get())
+    dbsession_maker.set(registry.get_session_maker())
+    return registry
+
+
+def get_session_maker() -> "async_sessionmaker":
+    session_maker = dbsession_maker.get()
+    if session_maker is None:
+        session_maker = sa_asyncio.async_sessionmaker(
+            dbengine.get(), expire_on_commit=False
+        )
+        dbsession_maker.set(session_maker)
+    return session_maker
+
+
+@asynccontextmanager
+async def db_session(
+    session: Optional["AsyncSession"] = None, read_only=False
+) -> AsyncIterator["AsyncSession"]:
+    """
+    Yields the given session if any (so that the caller's unit of work is used),
+    else a new session from the shared session factory.
+    With read_only, the session is bound to a healthy read replica if any are configured,
+    falling back to the primary.
+    """
+    if session is not None:
+        yield session
+        return
+
+    registry = dbengine_registry.get()
+    replica = registry.get_read_replica() if (read_only and registry) else None
+    if replica:
+        replica_session = registry.get_session_maker(replica)()
+        try:
+            await replica_session.connection()
+        except Exception as e:
+            await replica_session.close()
+            registry.mark_unhealthy(replica)
+            _logger.warning(
+                "Read replica %s unavailable. Using primary. %s", replica, repr(e)
+            )
+        else:
+            # Read by BaseORMModelWithId.can_fill_cache
+            replica_session.info["read_replica"] = replica
+            async with replica_session:
+                yield replica_session
+            return
+
+    async with get_session_maker()() as session:
+        yield session
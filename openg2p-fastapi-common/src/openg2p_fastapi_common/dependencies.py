@@ -0,0 +1,25 @@
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
+
+from .db import get_session_maker
+
+
+async def get_db_session(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    One session per request, inside a transaction.
+    Committed by BaseAPIRoute (see routing.commit_request_db_session) once the
+    endpoint returns and before the response is sent, so that a failed commit
+    fails the request. Rolled back if the request raised.
+    With other route classes, committed when the dependency exits, which on this
+    FastAPI version is after the response is sent.
+    """
+    async with get_session_maker()() as session:
+        request.state.db_session = session
+        try:
+            yield session
+        except BaseException:
+            await session.rollback()
+            raise
+        await session.commit()
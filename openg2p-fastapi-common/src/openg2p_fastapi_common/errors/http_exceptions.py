@@ -35,7 +35,7 @@ class MethodNotAllowedError(BaseAppException):
         code="G2P-REQ-405",
         message="Method Not Allowed",
         http_status_code=405,
-        **kwargs
+        **kwargs,
     ):
         super().__init__(code, message, http_status_code, **kwargs)
 
@@ -46,6 +46,17 @@ class InternalServerError(BaseAppException):
         code="G2P-REQ-500",
         message="Internal Server Error",
         http_status_code=500,
-        **kwargs
+        **kwargs,
+    ):
+        super().__init__(code, message, http_status_code, **kwargs)
+
+
+class ServiceUnavailableError(BaseAppException):
+    def __init__(
+        self,
+        code="G2P-REQ-503",
+        message="Service Unavailable",
+        http_status_code=503,
+        **kwargs,
     ):
         super().__init__(code, message, http_status_code, **kwargs)
@@ -1,5 +1,10 @@
 import logging
+import random
+import time
+from typing import Dict, Tuple, Type
 
+import orjson
+from fastapi import Response
 from fastapi.exceptions import RequestValidationError, ResponseValidationError
 from fastapi.responses import ORJSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
@@ -14,6 +19,7 @@ from .errors.http_exceptions import (
     InternalServerError,
     MethodNotAllowedError,
     NotFoundError,
+    ServiceUnavailableError,
     UnauthorizedError,
 )
 
@@ -22,9 +28,46 @@ _logger = logging.getLogger(_config.logging_default_logger_name)
 
 
 class BaseExceptionHandler(BaseComponent):
+    """
+    Renders errors as ErrorListResponse.
+    - Bodies of the standard http_exceptions (with their default messages) are
+      serialized ahead of time. Others, often with dynamic messages, are built per
+      error.
+    - 5xx errors are logged with traceback. 4xx errors are logged without traceback,
+      at exception_4xx_log_level, sampled at exception_4xx_log_sample_rate and limited
+      to exception_4xx_log_rate_limit logs per error code per
+      exception_4xx_log_rate_limit_interval seconds.
+    """
+
+    standard_exceptions = (
+        BadRequestError,
+        UnauthorizedError,
+        ForbiddenError,
+        NotFoundError,
+        MethodNotAllowedError,
+        InternalServerError,
+        ServiceUnavailableError,
+    )
+
     def __init__(self, name="", **kwargs):
         super().__init__(name=name)
 
+        # status code -> standard exception class, used by map_http_to_base_exception
+        self.http_errors: Dict[int, Type[BaseAppException]] = {}
+        # (code, message) -> body of the standard exception
+        self.standard_error_bodies: Dict[Tuple[str, str], bytes] = {}
+        for exc_class in self.standard_exceptions:
+            exc = exc_class()
+            self.http_errors[exc.status_code] = exc_class
+            self.standard_error_bodies[(exc.code, exc.message)] = self.build_error_body(
+                exc.code, exc.message
+            )
+        self.log_level_4xx = logging.getLevelName(
+            _config.exception_4xx_log_level.upper()
+        )
+        # error code -> [window start, logs in window, suppressed in window]
+        self._log_windows: Dict[str, list] = {}
+
         app = app_registry.get()
         app.add_exception_handler(StarletteHTTPException, self.http_exception_handler)
         app.add_exception_handler(BaseAppException, self.base_exception_handler)
@@ -37,13 +80,10 @@ class BaseExceptionHandler(BaseComponent):
         app.add_exception_handler(Exception, self.unknown_exception_handler)
 
     async def base_exception_handler(self, request, exc: BaseAppException):
-        _logger.exception(f"Received Exception: {exc}")
+        self.log_error(exc.status_code, exc.code, "Received Exception: %s", exc)
         # TODO: Handle multiple exceptions
-        res = ErrorListResponse(
-            errors=[ErrorResponse(code=exc.code, message=exc.message)]
-        )
-        return ORJSONResponse(
-            content=res.model_dump(), status_code=exc.status_code, headers=exc.headers
+        return self.get_error_response(
+            exc.code, exc.message, exc.status_code, exc.headers
         )
 
     async def http_exception_handler(self, request, exc: StarletteHTTPException):
@@ -54,12 +94,13 @@ class BaseExceptionHandler(BaseComponent):
     async def request_validation_exception_handler(
         self, request, exc: RequestValidationError
     ):
-        _logger.error(
+        self.log_error(
+            400,
+            "G2P-REQ-102",
             "Received exception: %s",
             repr(exc),
             extra={"props": {"exc_info": exc.errors()}},
         )
-        # _logger.exception("Received exception: %s", repr(exc))
         errors = []
         for err in exc.errors():
             err_msg = err.get("msg")
@@ -93,24 +134,69 @@ class BaseExceptionHandler(BaseComponent):
         else:
             code = "G2P-REQ-100"
             message = exc_split[0]
-        res = ErrorListResponse(errors=[ErrorResponse(code=code, message=message)])
-        return ORJSONResponse(content=res.model_dump(), status_code=500)
+        return self.get_error_response(code, message, 500)
+
+    def get_error_body(self, code: str, message: str) -> bytes:
+        body = self.standard_error_bodies.get((code, message), None)
+        if body is None:
+            body = self.build_error_body(code, message)
+        return body
+
+    def build_error_body(self, code: str, message: str) -> bytes:
+        return orjson.dumps(
+            ErrorListResponse(
+                errors=[ErrorResponse(code=code, message=message)]
+            ).model_dump()
+        )
+
+    def get_error_response(
+        self, code: str, message: str, status_code: int, headers=None
+    ) -> Response:
+        return Response(
+            content=self.get_error_body(code, message),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/json",
+        )
+
+    def log_error(self, status_code: int, code: str, msg: str, *args, **kwargs):
+        if status_code >= 500:
+            _logger.exception(msg, *args, **kwargs)
+            return
+        if not _logger.isEnabledFor(self.log_level_4xx):
+            return
+        if (
+            _config.exception_4xx_log_sample_rate < 1
+            and random.random() >= _config.exception_4xx_log_sample_rate
+        ):
+            return
+        if _config.exception_4xx_log_rate_limit:
+            now = time.monotonic()
+            window = self._log_windows.get(code, None)
+            if (
+                window is None
+                or now - window[0] >= _config.exception_4xx_log_rate_limit_interval
+            ):
+                if window and window[2]:
+                    _logger.log(
+                        self.log_level_4xx,
+                        "Suppressed %s logs of error code %s.",
+                        window[2],
+                        code,
+                    )
+                window = self._log_windows[code] = [now, 0, 0]
+            if window[1] >= _config.exception_4xx_log_rate_limit:
+                window[2] += 1
+                return
+            window[1] += 1
+        _logger.log(self.log_level_4xx, msg, *args, **kwargs)
 
     def map_http_to_base_exception(
         self, exc: StarletteHTTPException
     ) -> BaseAppException:
-        if exc.status_code == 400:
-            final_exc = BadRequestError(headers=exc.headers)
-        elif exc.status_code == 401:
-            final_exc = UnauthorizedError(headers=exc.headers)
-        elif exc.status_code == 403:
-            final_exc = ForbiddenError(headers=exc.headers)
-        elif exc.status_code == 404:
-            final_exc = NotFoundError(headers=exc.headers)
-        elif exc.status_code == 405:
-            final_exc = MethodNotAllowedError(headers=exc.headers)
-        elif exc.status_code == 500:
-            final_exc = InternalServerError(headers=exc.headers)
+        exc_class = self.http_errors.get(exc.status_code, None)
+        if exc_class:
+            final_exc = exc_class(headers=exc.headers)
         else:
             final_exc = BaseAppException(
                 code="G2P-REQ-100",
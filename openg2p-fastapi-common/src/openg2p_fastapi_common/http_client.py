@@ -0,0 +1,94 @@
+"""Module for initializing shared outbound HTTP client pool"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Tuple
+
+from .component import BaseComponent
+from .config import Settings
+from .metrics import Metrics
+from .utils.lazy_import import lazy_import
+
+httpx = lazy_import("httpx")
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+class HttpClientPool(BaseComponent):
+    """
+    Holds one httpx.AsyncClient (with keep-alive connection pool) per upstream host.
+    Clients are created lazily on the running event loop and closed on app shutdown.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        # (scheme, host, port) -> (client, event loop it was created on)
+        self._clients: Dict[Tuple[str, str, int], Tuple["httpx.AsyncClient", Any]] = {}
+        self.http2 = _config.http_client_http2
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                _logger.warning("http2 enabled but h2 is not installed. Using http1.")
+                self.http2 = False
+
+    def get_client(self, url) -> "httpx.AsyncClient":
+        url = httpx.URL(url)
+        key = (url.scheme, url.host, url.port)
+        client, client_loop = self._clients.get(key, (None, None))
+        loop = asyncio.get_running_loop()
+        if client is None or client.is_closed or client_loop is not loop:
+            # Connections can't be shared across event loops.
+            client = self.create_client(url)
+            self._clients[key] = (client, loop)
+        return client
+
+    def create_client(self, url: "httpx.URL") -> "httpx.AsyncClient":
+        return httpx.AsyncClient(
+            http2=self.http2,
+            timeout=httpx.Timeout(
+                connect=_config.http_client_connect_timeout,
+                read=_config.http_client_read_timeout,
+                write=_config.http_client_write_timeout,
+                pool=_config.http_client_pool_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=_config.http_client_max_connections,
+                max_keepalive_connections=_config.http_client_max_keepalive_connections,
+                keepalive_expiry=_config.http_client_keepalive_expiry,
+            ),
+        )
+
+    async def request(self, method: str, url, **kwargs) -> "httpx.Response":
+        metrics = Metrics.get_component()
+        if not metrics:
+            return await self.get_client(url).request(method, url, **kwargs)
+        status_code = "error"
+        start = time.perf_counter()
+        try:
+            res = await self.get_client(url).request(method, url, **kwargs)
+            status_code = str(res.status_code)
+            return res
+        finally:
+            metrics.http_client_request_duration_seconds.observe(
+                httpx.URL(url).host,
+                method,
+                status_code,
+                value=time.perf_counter() - start,
+            )
+
+    async def get(self, url, **kwargs) -> "httpx.Response":
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs) -> "httpx.Response":
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        loop = asyncio.get_running_loop()
+        for client, client_loop in clients:
+            if client_loop is loop:
+                await client.aclose()
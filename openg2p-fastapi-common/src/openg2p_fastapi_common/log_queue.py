@@ -0,0 +1,140 @@
+"""Module containing the queue based logging handler"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+import traceback
+from datetime import datetime, timezone
+from typing import BinaryIO, List, Optional
+
+import orjson
+
+from .context import request_correlation_id
+
+_STOP = object()
+
+
+class CorrelationIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = request_correlation_id.get()
+        return True
+
+
+class QueueLogHandler(logging.Handler):
+    """
+    Enqueues records on the calling thread and leaves formatting and writing to
+    a background thread, which serializes records with orjson and writes them
+    in batches of up to batch_size, at least every flush_interval seconds.
+    When the queue is full, records are dropped and counted in dropped.
+    """
+
+    def __init__(
+        self,
+        streams: List[BinaryIO],
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+    ):
+        super().__init__()
+        self.streams = streams
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.dropped = 0
+        self._start()
+        # Threads don't survive fork (like into preloaded gunicorn workers).
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_size)
+        self._flushed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            # Resolve the message now, since args may be mutated by the caller later.
+            record.msg = record.getMessage()
+            record.args = None
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stop = True
+            self.write(batch)
+        self._flushed.set()
+
+    def write(self, records: List[logging.LogRecord]):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.serialize(record))
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        data = b"".join(lines)
+        for stream in self.streams:
+            try:
+                stream.write(data)
+                stream.flush()
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+
+    @classmethod
+    def serialize(cls, record: logging.LogRecord) -> bytes:
+        log = {
+            "written_at": datetime.fromtimestamp(record.created, timezone.utc),
+            "written_ts": int(record.created * 1e9),
+            "type": getattr(record, "type", "log"),
+            "logger": record.name,
+            "thread": record.threadName,
+            "level": record.levelname,
+            "module": record.module,
+            "line_no": record.lineno,
+            "msg": record.msg,
+            "correlation_id": getattr(record, "correlation_id", None),
+        }
+        if record.exc_info:
+            log["exc_info"] = "".join(traceback.format_exception(*record.exc_info))
+        props = getattr(record, "props", None)
+        if props:
+            log.update(props)
+        return orjson.dumps(log, default=str, option=orjson.OPT_APPEND_NEWLINE)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._flushed.wait(timeout=5)
+        for stream in self.streams[1:]:
+            stream.close()
+        super().close()
+
+    @classmethod
+    def open_streams(cls, file_name: Optional[str] = None) -> List[BinaryIO]:
+        # stdout first. Other streams are closed along with the handler.
+        streams = [sys.stdout.buffer]
+        if file_name:
+            streams.append(open(os.fspath(file_name), "ab"))
+        return streams
@@ -0,0 +1,462 @@
+"""Module containing in-process metrics and their Prometheus text exposition"""
+
+import asyncio
+import bisect
+import fcntl
+import glob
+import logging
+import math
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+
+from .component import BaseComponent
+from .config import Settings
+from .context import (
+    dbengine_registry,
+    orm_cache_registry,
+    response_cache_registry,
+)
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# A sample is (name suffix, labels, value). A family is (type, help, samples).
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self) -> List[Sample]:
+        return [
+            ("", tuple(zip(self.labelnames, labels)), value)
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels, value: float = 1):
+        self.inc(*labels, value=-value)
+
+    def set(self, *labels, value: float):
+        self._values[labels] = value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per bucket counts (last one is +Inf), sum]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, *labels, value: float):
+        item = self._values.get(labels, None)
+        if item is None:
+            item = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        item[0][bisect.bisect_left(self.buckets, value)] += 1
+        item[1] += value
+
+    def samples(self) -> List[Sample]:
+        result = []
+        for labels, (counts, total) in self._values.items():
+            labels = tuple(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                result.append(("_bucket", labels + (("le", le),), cumulative))
+            result.append(("_sum", labels, total))
+            result.append(("_count", labels, cumulative))
+        return result
+
+
+class Metrics(BaseComponent):
+    """
+    Registry of counters, gauges and histograms, plus collectors that are called
+    at scrape time (for values that are cheaper to read than to track, like pool usage).
+
+    With multiple workers, set metrics_multiprocess_dir to a directory shared by the
+    workers of one pod. Each worker writes a snapshot of its metrics there every
+    metrics_snapshot_interval seconds, and a scrape served by any worker sums up
+    the snapshots of all live workers. Counters and histograms of exited workers
+    are folded into an aggregate file, so totals don't go down when workers are
+    recycled. Samples marked shared (see mark_shared) read state shared by the
+    workers, like the size of a shared cache, and are not summed.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], Dict[str, tuple]]] = []
+        self._caches: Dict[str, Callable[[], dict]] = {}
+        # (family name, labels) of samples reading state shared by all workers
+        self._shared_samples: set = set()
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+        self.http_requests_in_flight = self.gauge(
+            "http_requests_in_flight", "Requests being served.", ["method", "route"]
+        )
+        self.http_request_duration_seconds = self.histogram(
+            "http_request_duration_seconds",
+            "Request latency.",
+            ["method", "route", "status"],
+        )
+        self.db_pool_connections_opened_total = self.counter(
+            "db_pool_connections_opened_total",
+            "DB connections opened by the pool.",
+            ["engine"],
+        )
+        self.db_pool_connection_hold_seconds = self.histogram(
+            "db_pool_connection_hold_seconds",
+            "Time a connection was checked out of the DB pool for.",
+            ["engine"],
+        )
+        self.http_client_request_duration_seconds = self.histogram(
+            "http_client_request_duration_seconds",
+            "Outbound HTTP request latency.",
+            ["host", "method", "status"],
+        )
+        self.add_collector(self.collect_db_pools)
+        self.add_collector(self.collect_caches)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name, None)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], Dict[str, tuple]]):
+        """
+        collector returns {name: (type, help, samples)}, evaluated at scrape time.
+        """
+        self._collectors.append(collector)
+
+    def register_cache(self, name: str, stats: Callable[[], dict]):
+        """
+        stats returns a dict with hits, misses and size, like TTLCache.stats().
+        """
+        self._caches[name] = stats
+
+    def mark_shared(self, name: str, labels: tuple):
+        """
+        Marks a sample whose value is the same in all workers (it reads shared
+        state), so that merged metrics take it once instead of summing it.
+        """
+        self._shared_samples.add((name, labels))
+
+    def collect(self) -> Dict[str, tuple]:
+        families = {
+            metric.name: (metric.type, metric.help, metric.samples())
+            for metric in self._metrics.values()
+        }
+        for collector in self._collectors:
+            try:
+                families.update(collector())
+            except Exception:
+                _logger.exception("Error collecting metrics.")
+        return families
+
+    def collect_db_pools(self) -> Dict[str, tuple]:
+        registry = dbengine_registry.get()
+        checked_out, size, overflow = [], [], []
+        for name, engine in registry.items() if registry else ():
+            pool = engine.sync_engine.pool
+            if not hasattr(pool, "checkedout"):
+                continue
+            labels = (("engine", name),)
+            checked_out.append(("", labels, pool.checkedout()))
+            size.append(("", labels, pool.size()))
+            overflow.append(("", labels, max(0, pool.overflow())))
+        return {
+            "db_pool_checked_out": (
+                "gauge",
+                "DB connections in use.",
+                checked_out,
+            ),
+            "db_pool_size": ("gauge", "DB pool size.", size),
+            "db_pool_overflow": ("gauge", "DB connections beyond pool size.", overflow),
+        }
+
+    def collect_caches(self) -> Dict[str, tuple]:
+        caches = dict(self._caches)
+        for model, cache in orm_cache_registry.get().items():
+            caches[f"orm:{model.__name__}"] = cache.stats
+        for name, response_cache in response_cache_registry.get().items():
+            caches[f"response:{name}"] = response_cache.stats
+        hits, misses, size, oversized = [], [], [], []
+        for name, stats in caches.items():
+            stats = stats()
+            labels = (("cache", name),)
+            hits.append(("", labels, stats.get("hits", 0)))
+            misses.append(("", labels, stats.get("misses", 0)))
+            size.append(("", labels, stats.get("size", 0)))
+            if "oversized" in stats:
+                oversized.append(("", labels, stats["oversized"]))
+            if stats.get("shared", False):
+                self.mark_shared("cache_size", labels)
+        return {
+            "cache_hits_total": ("counter", "Cache hits.", hits),
+            "cache_misses_total": ("counter", "Cache misses.", misses),
+            "cache_size": ("gauge", "Entries in cache.", size),
+            "cache_oversized_total": (
+                "counter",
+                "Values not cached for being larger than the cache's slot size.",
+                oversized,
+            ),
+        }
+
+    def instrument_engine(self, name: str, engine):
+        """
+        Records the connections opened by the pool of the given engine, and how
+        long each checkout holds its connection, with pool events. The listeners
+        carry over to the new pool that engine.dispose() creates.
+        """
+        from sqlalchemy import event
+
+        def on_connect(dbapi_connection, connection_record):
+            self.db_pool_connections_opened_total.inc(name)
+
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            connection_record.info["checked_out_at"] = time.perf_counter()
+
+        def on_checkin(dbapi_connection, connection_record):
+            # No record for connections that were invalidated.
+            start = connection_record and connection_record.info.pop(
+                "checked_out_at", None
+            )
+            if start:
+                self.db_pool_connection_hold_seconds.observe(
+                    name, value=time.perf_counter() - start
+                )
+
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "connect", on_connect)
+        event.listen(sync_engine, "checkout", on_checkout)
+        event.listen(sync_engine, "checkin", on_checkin)
+
+    def render(self) -> bytes:
+        if _config.metrics_multiprocess_dir:
+            families = self.merge_snapshots()
+        else:
+            families = self.collect()
+        lines = []
+        for name, (metric_type, help, samples) in sorted(families.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for suffix, labels, value in samples:
+                if labels:
+                    label_str = ",".join(
+                        f'{k}="{self.escape_label(v)}"' for k, v in labels
+                    )
+                    lines.append(f"{name}{suffix}{{{label_str}}} {value}")
+                else:
+                    lines.append(f"{name}{suffix} {value}")
+        lines.append("")
+        return "\n".join(lines).encode()
+
+    @classmethod
+    def escape_label(cls, value) -> str:
+        return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+    def get_snapshot_path(self, pid: int = None) -> str:
+        return os.path.join(
+            _config.metrics_multiprocess_dir, f"metrics_{pid or os.getpid()}.json"
+        )
+
+    def write_snapshot(self):
+        path = self.get_snapshot_path()
+        snapshot = {
+            "families": self.collect(),
+            "shared": [[name, labels] for name, labels in self._shared_samples],
+        }
+        self._write_json(path, snapshot)
+
+    @classmethod
+    def _write_json(cls, path: str, data):
+        with open(path + ".tmp", "wb") as f:
+            f.write(orjson.dumps(data))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def _read_json(cls, path: str):
+        try:
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+    def merge_snapshots(self) -> Dict[str, tuple]:
+        """
+        Sums up the samples of the live workers' snapshots and of the aggregate of
+        exited workers. Shared samples are taken once (the max), not summed.
+        """
+        self.write_snapshot()
+        self.fold_exited_snapshots()
+        merged: Dict[str, tuple] = {}
+        snapshots = []
+        pattern = os.path.join(_config.metrics_multiprocess_dir, "metrics_*.json")
+        for path in glob.glob(pattern):
+            pid = os.path.basename(path)[len("metrics_") : -len(".json")]
+            if pid.isdigit() and self.is_pid_alive(int(pid)):
+                snapshots.append(self._read_json(path))
+        snapshots.append(self._read_json(self.get_aggregate_path()))
+        for snapshot in snapshots:
+            if not snapshot:
+                continue
+            shared = {
+                (name, tuple(tuple(label) for label in labels))
+                for name, labels in snapshot["shared"]
+            }
+            for name, (metric_type, help, samples) in snapshot["families"].items():
+                _, _, merged_samples = merged.setdefault(name, (metric_type, help, {}))
+                for suffix, labels, value in samples:
+                    labels = tuple(tuple(label) for label in labels)
+                    key = (suffix, labels)
+                    if (name, labels) in shared:
+                        merged_samples[key] = max(merged_samples.get(key, value), value)
+                    else:
+                        merged_samples[key] = merged_samples.get(key, 0) + value
+        return {
+            name: (
+                metric_type,
+                help,
+                [
+                    (suffix, labels, value)
+                    for (suffix, labels), value in samples.items()
+                ],
+            )
+            for name, (metric_type, help, samples) in merged.items()
+        }
+
+    def get_aggregate_path(self) -> str:
+        return os.path.join(_config.metrics_multiprocess_dir, "metrics_aggregate.json")
+
+    def fold_exited_snapshots(self):
+        pattern = os.path.join(_config.metrics_multiprocess_dir, "metrics_*.json")
+        paths = []
+        for path in glob.glob(pattern):
+            pid = os.path.basename(path)[len("metrics_") : -len(".json")]
+            if pid.isdigit() and not self.is_pid_alive(int(pid)):
+                paths.append(path)
+        if paths:
+            self.fold_snapshots(paths)
+
+    def fold_snapshots(self, paths: List[str]):
+        """
+        Adds the counters and histograms of the given snapshots to the aggregate
+        file, and removes the snapshots. Their gauges are dropped.
+        Holds a lock on the directory, so a snapshot is folded once.
+        """
+        lock_path = os.path.join(_config.metrics_multiprocess_dir, "metrics.lock")
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            aggregate_path = self.get_aggregate_path()
+            aggregate = self._read_json(aggregate_path) or {"families": {}}
+            families = aggregate["families"]
+            for path in paths:
+                snapshot = self._read_json(path)
+                if snapshot is None:
+                    # Already folded by another worker.
+                    continue
+                for name, (metric_type, help, samples) in snapshot["families"].items():
+                    if metric_type not in ("counter", "histogram"):
+                        continue
+                    family = families.setdefault(name, [metric_type, help, []])
+                    totals = {
+                        (suffix, tuple(tuple(label) for label in labels)): value
+                        for suffix, labels, value in family[2]
+                    }
+                    for suffix, labels, value in samples:
+                        key = (suffix, tuple(tuple(label) for label in labels))
+                        totals[key] = totals.get(key, 0) + value
+                    family[2] = [
+                        [suffix, labels, value]
+                        for (suffix, labels), value in totals.items()
+                    ]
+            self._write_json(aggregate_path, {"families": families, "shared": []})
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def is_pid_alive(cls, pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def start_snapshot_writer(self):
+        if _config.metrics_multiprocess_dir and not self._snapshot_task:
+            os.makedirs(_config.metrics_multiprocess_dir, exist_ok=True)
+            self._snapshot_task = asyncio.create_task(self._write_periodically())
+
+    async def stop_snapshot_writer(self):
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+            # Folded rather than removed, so that the totals of this worker
+            # remain after it exits (like when it is recycled).
+            try:
+                self.write_snapshot()
+                self.fold_snapshots([self.get_snapshot_path()])
+            except OSError:
+                _logger.exception("Error writing final metrics snapshot.")
+
+    async def _write_periodically(self):
+        while True:
+            try:
+                self.write_snapshot()
+            except Exception:
+                _logger.exception("Error writing metrics snapshot.")
+            await asyncio.sleep(_config.metrics_snapshot_interval)
@@ -0,0 +1,33 @@
+"""Module containing the controller that exposes metrics"""
+
+from fastapi import Response
+
+from .config import Settings
+from .controller import BaseController
+from .metrics import Metrics
+
+_config = Settings.get_config(strict=False)
+
+
+class MetricsController(BaseController):
+    def __init__(self, name="", **kwargs):
+        super().__init__(name, **kwargs)
+
+        self.router.tags += ["metrics"]
+
+        self.router.add_api_route(
+            _config.metrics_path,
+            self.get_metrics,
+            methods=["GET"],
+            include_in_schema=False,
+        )
+
+    async def get_metrics(self):
+        """
+        Returns all metrics in Prometheus text format.
+        """
+        metrics = Metrics.get_component() or Metrics()
+        return Response(
+            content=metrics.render(),
+            media_type="text/plain; version=0.0.4; charset=utf-8",
+        )
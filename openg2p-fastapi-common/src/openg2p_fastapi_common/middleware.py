@@ -0,0 +1,321 @@
+"""Module containing pure ASGI middlewares"""
+
+import logging
+import random
+import time
+import uuid
+from typing import Dict, Optional
+
+import orjson
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import Settings
+from .context import request_correlation_id
+from .errors import ErrorListResponse, ErrorResponse
+from .errors.http_exceptions import ServiceUnavailableError
+from .metrics import Metrics
+from .utils.compression import StreamCompressor, compress, select_encoding
+from .utils.concurrency_limiter import ConcurrencyLimiter
+from .utils.etag import weaken_etag
+
+_config = Settings.get_config(strict=False)
+_access_logger = logging.getLogger(_config.logging_default_logger_name).getChild(
+    "access"
+)
+
+
+class RequestContextMiddleware:
+    """
+    Sets the correlation id of the request (taken from the
+    logging_correlation_id_header request header, or generated) for the duration
+    of the request, echoes it in the response, and writes an access log entry.
+    Access logs of successful requests are sampled at logging_access_log_sample_rate.
+    Errors (status >= 400) are always logged.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.header_name = _config.logging_correlation_id_header.lower().encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        correlation_id = None
+        for name, value in scope["headers"]:
+            if name == self.header_name:
+                correlation_id = value.decode("latin-1")
+                break
+        if not correlation_id:
+            correlation_id = uuid.uuid4().hex
+        token = request_correlation_id.set(correlation_id)
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (self.header_name, correlation_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if _config.logging_access_log_enabled and (
+                status_code >= 400
+                or random.random() < _config.logging_access_log_sample_rate
+            ):
+                self.log_access(scope, status_code, time.perf_counter() - start)
+            request_correlation_id.reset(token)
+
+    def log_access(self, scope: Scope, status_code: int, duration: float):
+        _access_logger.info(
+            "%s %s %s",
+            scope["method"],
+            scope["path"],
+            status_code,
+            extra={
+                "type": "request",
+                "props": {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "response_time_ms": round(duration * 1000, 3),
+                    "remote_ip": scope["client"][0] if scope.get("client") else None,
+                },
+            },
+        )
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with brotli (if installed) or gzip, whichever the client
+    accepts, in that order. Only responses whose content type starts with one of
+    compression_content_types, that are not already encoded, and that are at least
+    compression_minimum_size bytes (or are streamed, without Content-Length) are
+    compressed.
+    Streamed responses are compressed chunk by chunk.
+    A strong ETag of a compressed response is weakened, as the bytes differ from
+    the uncompressed ones (and it still matches those with If-None-Match).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.minimum_size = _config.compression_minimum_size
+        self.content_types = tuple(_config.compression_content_types)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = select_encoding(value.decode("latin-1"))
+                break
+        if not encoding:
+            return await self.app(scope, receive, send)
+        level = (
+            _config.compression_brotli_quality
+            if encoding == "br"
+            else _config.compression_gzip_level
+        )
+
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or (
+                start_message is None and compressor is None
+            ):
+                # Passed through, or not a body.
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                start, start_message = start_message, None
+                size = len(body) if not more_body else headers.get("content-length")
+                if not self.is_compressible(headers) or (
+                    size is not None and int(size) < self.minimum_size
+                ):
+                    await send(start)
+                    return await send(message)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers:
+                    headers["ETag"] = weaken_etag(headers["etag"])
+                if not more_body:
+                    body = compress(body, encoding, level)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    return await send({**message, "body": body})
+                del headers["Content-Length"]
+                compressor = StreamCompressor(encoding, level)
+                await send(start)
+
+            body = compressor.compress(body)
+            if not more_body:
+                body += compressor.finish()
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def is_compressible(self, headers: MutableHeaders) -> bool:
+        if "content-encoding" in headers:
+            return False
+        return headers.get("content-type", "").startswith(self.content_types)
+
+
+class AdmissionControlMiddleware:
+    """
+    Limits concurrent requests, globally (admission_max_concurrency) and per path
+    prefix (admission_route_max_concurrency, longest prefix wins). Requests beyond
+    a limit wait in a queue of at most admission_max_queue, for at most
+    admission_queue_timeout seconds, and are otherwise rejected right away with
+    503 and Retry-After.
+    admission_exempt_paths (and the metrics path), with or without
+    openapi_common_api_prefix, and their subpaths are not limited. The request's
+    root_path is ignored when matching.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.global_limiter = self.create_limiter(_config.admission_max_concurrency)
+        self.route_limiters = [
+            (prefix, self.create_limiter(limit))
+            for prefix, limit in sorted(
+                _config.admission_route_max_concurrency.items(),
+                key=lambda item: len(item[0]),
+                reverse=True,
+            )
+            if limit > 0
+        ]
+        exempt_paths = set()
+        for exempt_path in _config.admission_exempt_paths + [_config.metrics_path]:
+            exempt_path = "/" + exempt_path.strip("/")
+            exempt_paths.add(exempt_path)
+            if _config.openapi_common_api_prefix:
+                exempt_paths.add(
+                    "/" + _config.openapi_common_api_prefix.strip("/") + exempt_path
+                )
+        self.exempt_paths = frozenset(exempt_paths)
+        self.exempt_prefixes = tuple(path + "/" for path in exempt_paths)
+
+        exc = ServiceUnavailableError()
+        body = orjson.dumps(
+            ErrorListResponse(
+                errors=[ErrorResponse(code=exc.code, message=exc.message)]
+            ).model_dump()
+        )
+        self.reject_start = {
+            "type": "http.response.start",
+            "status": exc.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(_config.admission_retry_after).encode()),
+            ],
+        }
+        self.reject_body = {"type": "http.response.body", "body": body}
+
+        self.metrics = Metrics.get_component()
+        if self.metrics:
+            self.queued_total = self.metrics.counter(
+                "admission_queued_total", "Requests queued for admission.", ["limit"]
+            )
+            self.rejected_total = self.metrics.counter(
+                "admission_rejected_total",
+                "Requests rejected by admission control.",
+                ["limit", "reason"],
+            )
+            self.queue_wait_seconds = self.metrics.histogram(
+                "admission_queue_wait_seconds",
+                "Time spent queued for admission.",
+                ["limit"],
+            )
+            self.metrics.add_collector(self.collect)
+
+    @classmethod
+    def create_limiter(cls, limit: int) -> Optional[ConcurrencyLimiter]:
+        if limit <= 0:
+            return None
+        return ConcurrencyLimiter(
+            limit, _config.admission_max_queue, _config.admission_queue_timeout
+        )
+
+    def is_exempt(self, scope: Scope) -> bool:
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path) :]
+        return path in self.exempt_paths or path.startswith(self.exempt_prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.is_exempt(scope):
+            return await self.app(scope, receive, send)
+
+        limits = []
+        path = scope["path"]
+        for prefix, limiter in self.route_limiters:
+            if path.startswith(prefix):
+                limits.append((prefix, limiter))
+                break
+        if self.global_limiter:
+            # After the route limit, so that requests queued for a route
+            # don't hold global slots.
+            limits.append(("global", self.global_limiter))
+
+        acquired = []
+        try:
+            for name, limiter in limits:
+                if not await self.admit(name, limiter):
+                    await send(self.reject_start)
+                    return await send(self.reject_body)
+                acquired.append(limiter)
+            await self.app(scope, receive, send)
+        finally:
+            for limiter in acquired:
+                limiter.release()
+
+    async def admit(self, name: str, limiter: ConcurrencyLimiter) -> bool:
+        if limiter.try_acquire():
+            return True
+        queue_full = limiter.queued >= limiter.max_queue
+        start = time.perf_counter()
+        admitted = await limiter.acquire()
+        if self.metrics:
+            if not queue_full:
+                self.queued_total.inc(name)
+                self.queue_wait_seconds.observe(name, value=time.perf_counter() - start)
+            if not admitted:
+                self.rejected_total.inc(name, "queue_full" if queue_full else "timeout")
+        return admitted
+
+    def collect(self) -> Dict[str, tuple]:
+        limiters = list(self.route_limiters)
+        if self.global_limiter:
+            limiters.append(("global", self.global_limiter))
+        in_flight, queued = [], []
+        for name, limiter in limiters:
+            labels = (("limit", name),)
+            in_flight.append(("", labels, limiter.in_flight))
+            queued.append(("", labels, limiter.queued))
+        return {
+            "admission_in_flight": (
+                "gauge",
+                "Requests admitted and being served.",
+                in_flight,
+            ),
+            "admission_queue_length": ("gauge", "Requests queued.", queued),
+        }
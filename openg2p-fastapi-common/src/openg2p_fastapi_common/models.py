@@ -1,13 +1,35 @@
 """Module containing base models"""
 
+import copy
+import logging
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Union
 
-from sqlalchemy import DateTime, select
-from sqlalchemy.ext.asyncio import async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import DateTime, event, insert, inspect, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    Session,
+    make_transient_to_detached,
+    mapped_column,
+)
 
-from .context import dbengine
+from .cache import create_cache
+from .config import Settings
+from .context import dbengine, orm_cache_registry
+from .db import db_session
+from .utils.cache_backend import CacheBackend
+from .utils.iter_utils import batched
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+# Key of Session.info holding {model class: cache keys to drop, or None for all}
+# until the session commits. See _collect_orm_cache_invalidations.
+_CACHE_PENDING_INVALIDATIONS = "orm_cache_pending_invalidations"
 
 
 class BaseORMModel(DeclarativeBase):
@@ -23,32 +45,343 @@ class BaseORMModel(DeclarativeBase):
 class BaseORMModelWithId(BaseORMModel):
     __abstract__ = True
 
+    # Reads go to a read replica when configured (see db_read_datasources),
+    # unless use_primary=True or a session is given.
+    # Opt-in read-through cache for get_by_id and get_all.
+    # Example: __cache__ = {"ttl": 300, "max_entries": 1000}
+    # "backend" and "slot_size" override cache_backend and cache_shared_slot_size.
+    # Entries are dropped when a session that wrote the model commits. The cache
+    # is filled only from primary reads, in sessions without pending writes.
+    # Cached rows hold columns only, so models with relationships are not cached.
+    __cache__ = None
+
     id: Mapped[int] = mapped_column(primary_key=True)
     active: Mapped[bool] = mapped_column()
 
     @classmethod
-    async def get_by_id(cls, id: int, active=True) -> "BaseORMModelWithId":
+    async def get_by_id(
+        cls,
+        id: int,
+        active=True,
+        session: Optional[AsyncSession] = None,
+        use_primary=False,
+    ) -> "BaseORMModelWithId":
+        cache = cls.get_cache()
+        if cache is not None:
+            snapshot = cache.get(("id", id))
+            if snapshot is not None:
+                result = cls.from_snapshot(snapshot)
+                return result if result.active == active else None
+
         result = None
-        async_session_maker = async_sessionmaker(dbengine.get())
-        async with async_session_maker() as session:
+        async with db_session(session, read_only=not use_primary) as session:
             result = await session.get(cls, id)
-            if result.active != active:
+            if result and cache is not None and cls.can_fill_cache(session):
+                cache.set(("id", id), result.to_snapshot())
+            if result and result.active != active:
                 result = None
 
         return result
 
     @classmethod
-    async def get_all(cls, active=True) -> List["BaseORMModelWithId"]:
+    async def get_all(
+        cls,
+        active=True,
+        session: Optional[AsyncSession] = None,
+        use_primary=False,
+    ) -> List["BaseORMModelWithId"]:
+        cache = cls.get_cache()
+        if cache is not None:
+            snapshots = cache.get(("all", active))
+            if snapshots is not None:
+                return [cls.from_snapshot(snapshot) for snapshot in snapshots]
+
         response = []
-        async_session_maker = async_sessionmaker(dbengine.get())
-        async with async_session_maker() as session:
+        async with db_session(session, read_only=not use_primary) as session:
             stmt = select(cls).where(cls.active == active).order_by(cls.id.asc())
 
             result = await session.execute(stmt)
 
             response = list(result.scalars())
+            if cache is not None and cls.can_fill_cache(session):
+                cache.set(("all", active), [row.to_snapshot() for row in response])
         return response
 
+    @classmethod
+    async def stream_all(
+        cls,
+        active=True,
+        session: Optional[AsyncSession] = None,
+        use_primary=False,
+        fetch_size: Optional[int] = None,
+    ) -> AsyncIterator["BaseORMModelWithId"]:
+        """
+        Like get_all, but yields rows as they are fetched from a server side cursor,
+        fetch_size (default db_stream_fetch_size) rows per round trip.
+        The cache is not used. The session is held until the iteration ends.
+        """
+        fetch_size = fetch_size or _config.db_stream_fetch_size
+        async with db_session(session, read_only=not use_primary) as session:
+            stmt = (
+                select(cls)
+                .where(cls.active == active)
+                .order_by(cls.id.asc())
+                .execution_options(yield_per=fetch_size)
+            )
+            result = await session.stream_scalars(stmt)
+            try:
+                async for row in result:
+                    yield row
+            finally:
+                await result.close()
+
+    @classmethod
+    async def get_by_ids(
+        cls,
+        ids: List[int],
+        active=True,
+        session: Optional[AsyncSession] = None,
+        use_primary=False,
+    ) -> List[Optional["BaseORMModelWithId"]]:
+        """
+        Returns rows in the same order as the given ids, with None for missing ids.
+        """
+        found = {}
+        cache = cls.get_cache()
+        if cache is not None:
+            for id in ids:
+                snapshot = cache.get(("id", id))
+                if snapshot is not None:
+                    found[id] = cls.from_snapshot(snapshot)
+
+        missing_ids = list({id for id in ids if id not in found})
+        if missing_ids:
+            async with db_session(session, read_only=not use_primary) as session:
+                fill_cache = cache is not None and cls.can_fill_cache(session)
+                for batch in batched(missing_ids, _config.db_bulk_batch_size):
+                    stmt = select(cls).where(cls.id.in_(batch))
+                    for row in (await session.execute(stmt)).scalars():
+                        found[row.id] = row
+                        if fill_cache:
+                            cache.set(("id", row.id), row.to_snapshot())
+
+        result = []
+        for id in ids:
+            row = found.get(id, None)
+            result.append(row if row is not None and row.active == active else None)
+        return result
+
+    @classmethod
+    async def bulk_create(
+        cls,
+        rows: List[Union[dict, "BaseORMModelWithId"]],
+        session: Optional[AsyncSession] = None,
+    ) -> int:
+        """
+        Inserts rows in batches of db_bulk_batch_size with executemany.
+        Commits if no session is given, else leaves it to the caller.
+        """
+        rows = cls.prepare_bulk_rows(rows)
+        async with db_session(session) as bulk_session:
+            for batch in batched(rows, _config.db_bulk_batch_size):
+                await bulk_session.execute(insert(cls), batch)
+            cls.cache_invalidate_on_commit(bulk_session)
+            if session is None:
+                await bulk_session.commit()
+        return len(rows)
+
+    @classmethod
+    async def bulk_upsert(
+        cls,
+        rows: List[Union[dict, "BaseORMModelWithId"]],
+        index_elements: Optional[List[str]] = None,
+        update_columns: Optional[List[str]] = None,
+        session: Optional[AsyncSession] = None,
+    ) -> int:
+        """
+        INSERT ... ON CONFLICT (index_elements) DO UPDATE, in batches of
+        db_bulk_batch_size with executemany. PostgreSQL (and SQLite) only.
+        By default all given columns, other than index_elements, are updated on conflict.
+        index_elements and update_columns are attribute names.
+        Commits if no session is given, else leaves it to the caller.
+        """
+        index_elements = index_elements or ["id"]
+        rows = cls.prepare_bulk_rows(rows)
+        if not rows:
+            return 0
+        if update_columns is None:
+            update_columns = cls.get_upsert_update_columns(rows, index_elements)
+        async with db_session(session) as bulk_session:
+            dialect_name = bulk_session.bind.dialect.name
+            if dialect_name == "postgresql":
+                stmt = postgresql_insert(cls)
+            elif dialect_name == "sqlite":
+                stmt = sqlite_insert(cls)
+            else:
+                raise NotImplementedError(
+                    f"bulk_upsert not supported on {dialect_name}"
+                )
+            index_columns = cls.get_column_names(index_elements)
+            if update_columns:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=index_columns,
+                    set_={
+                        name: stmt.excluded[name]
+                        for name in cls.get_column_names(update_columns)
+                    },
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=index_columns)
+            for batch in batched(rows, _config.db_bulk_batch_size):
+                await bulk_session.execute(stmt, batch)
+            cls.cache_invalidate_on_commit(bulk_session)
+            if session is None:
+                await bulk_session.commit()
+        return len(rows)
+
+    @classmethod
+    def get_column_names(cls, keys: List[str]) -> List[str]:
+        """
+        Column names of the given attribute names (which can differ).
+        """
+        column_attrs = inspect(cls).column_attrs
+        return [
+            column_attrs[key].columns[0].name if key in column_attrs else key
+            for key in keys
+        ]
+
+    @classmethod
+    def prepare_bulk_rows(
+        cls, rows: List[Union[dict, "BaseORMModelWithId"]]
+    ) -> List[dict]:
+        column_keys = {attr.key for attr in inspect(cls).column_attrs}
+        return [
+            row
+            if isinstance(row, dict)
+            else {k: v for k, v in row.__dict__.items() if k in column_keys}
+            for row in rows
+        ]
+
+    @classmethod
+    def get_upsert_update_columns(
+        cls, rows: List[dict], index_elements: List[str]
+    ) -> List[str]:
+        keys = {}
+        for row in rows:
+            keys.update(dict.fromkeys(row))
+        return [key for key in keys if key not in index_elements and key != "id"]
+
+    @classmethod
+    def get_cache(cls) -> Optional[CacheBackend]:
+        if not cls.__cache__:
+            return None
+        cache = orm_cache_registry.get().get(cls, None)
+        if cache is None:
+            if inspect(cls).relationships:
+                _logger.warning("%s has relationships. Not caching it.", cls.__name__)
+                cls.__cache__ = None
+                return None
+            cache = create_cache(
+                f"orm_{cls.__tablename__}",
+                max_entries=cls.__cache__.get("max_entries", 1024),
+                ttl=cls.__cache__.get("ttl", None),
+                backend=cls.__cache__.get("backend", None),
+                slot_size=cls.__cache__.get("slot_size", None),
+            )
+            orm_cache_registry.get()[cls] = cache
+        return cache
+
+    @classmethod
+    def cache_invalidate(cls, keys: Optional[set] = None):
+        """
+        Drops the given cache keys, or all entries.
+        """
+        cache = orm_cache_registry.get().get(cls, None)
+        if cache is None:
+            return
+        if keys is None:
+            cache.clear()
+        else:
+            for key in keys:
+                cache.pop(key, None)
+
+    @classmethod
+    def can_fill_cache(cls, session: AsyncSession) -> bool:
+        """
+        False for sessions on a read replica (which may lag) and for sessions with
+        writes not yet committed (which may be rolled back).
+        """
+        return not (
+            session.info.get("read_replica", None)
+            or session.info.get(_CACHE_PENDING_INVALIDATIONS, None)
+            or session.new
+            or session.dirty
+            or session.deleted
+        )
+
+    @classmethod
+    def cache_invalidate_on_commit(
+        cls, session: Union[AsyncSession, Session], keys: Optional[set] = None
+    ):
+        """
+        Drops the given cache keys (or all entries) once the session commits.
+        """
+        if not cls.__cache__:
+            return
+        pending = session.info.setdefault(_CACHE_PENDING_INVALIDATIONS, {})
+        if keys is None or (cls in pending and pending[cls] is None):
+            pending[cls] = None
+        else:
+            pending.setdefault(cls, set()).update(keys)
+
+    @classmethod
+    def cache_stats(cls) -> Optional[dict]:
+        cache = orm_cache_registry.get().get(cls, None)
+        return cache.stats() if cache is not None else None
+
+    def to_snapshot(self) -> dict:
+        return {
+            attr.key: getattr(self, attr.key)
+            for attr in inspect(type(self)).column_attrs
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "BaseORMModelWithId":
+        """
+        Returns a new detached instance, as if freshly loaded and expunged from a session.
+        """
+        obj = cls(
+            **{
+                k: copy.deepcopy(v) if isinstance(v, (dict, list)) else v
+                for k, v in snapshot.items()
+            }
+        )
+        make_transient_to_detached(obj)
+        return obj
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_orm_cache_invalidations(session: Session, flush_context):
+    # Invalidated after commit, not at flush, so that a read in between (of the
+    # rows as last committed) can't put the old rows back in the cache.
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, BaseORMModelWithId):
+            type(obj).cache_invalidate_on_commit(
+                session, {("id", obj.id), ("all", True), ("all", False)}
+            )
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_orm_cache(session: Session):
+    pending = session.info.pop(_CACHE_PENDING_INVALIDATIONS, None)
+    for cls, keys in (pending or {}).items():
+        cls.cache_invalidate(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_orm_cache_invalidations(session: Session):
+    session.info.pop(_CACHE_PENDING_INVALIDATIONS, None)
+
 
 class BaseORMModelWithTimes(BaseORMModelWithId):
     __abstract__ = True
@@ -57,3 +390,23 @@ class BaseORMModelWithTimes(BaseORMModelWithId):
     updated_at: Mapped[Optional[datetime]] = mapped_column(
         DateTime(), default=datetime.utcnow
     )
+
+    @classmethod
+    def prepare_bulk_rows(
+        cls, rows: List[Union[dict, "BaseORMModelWithTimes"]]
+    ) -> List[dict]:
+        now = datetime.utcnow()
+        rows = super().prepare_bulk_rows(rows)
+        for i, row in enumerate(rows):
+            rows[i] = {"created_at": now, **row, "updated_at": now}
+        return rows
+
+    @classmethod
+    def get_upsert_update_columns(
+        cls, rows: List[dict], index_elements: List[str]
+    ) -> List[str]:
+        return [
+            key
+            for key in super().get_upsert_update_columns(rows, index_elements)
+            if key != "created_at"
+        ]
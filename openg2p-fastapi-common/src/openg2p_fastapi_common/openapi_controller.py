@@ -0,0 +1,136 @@
+"""Module containing the controller that serves the OpenAPI document"""
+
+import hashlib
+import logging
+from typing import Dict, Optional
+
+import orjson
+from fastapi import FastAPI, Request, Response
+from fastapi.openapi.utils import get_openapi
+from starlette.routing import Route
+
+from .config import Settings
+from .context import app_registry
+from .controller import BaseController
+from .utils.compression import compress, get_available_encodings, select_encoding
+from .utils.etag import encoding_etag, if_none_match
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+def generate_openapi(app: FastAPI) -> dict:
+    """
+    Same document as app.openapi(), without caching it on the app.
+    The app's root_path is added to the servers, like FastAPI's openapi route does
+    with the request's root_path.
+    """
+    servers = app.servers
+    root_path = app.root_path.rstrip("/")
+    if (
+        root_path
+        and app.root_path_in_servers
+        and root_path not in [server.get("url") for server in servers]
+    ):
+        servers = [{"url": root_path}, *servers]
+    return get_openapi(
+        title=app.title,
+        version=app.version,
+        openapi_version=app.openapi_version,
+        summary=app.summary,
+        description=app.description,
+        terms_of_service=app.terms_of_service,
+        contact=app.contact,
+        license_info=app.license_info,
+        routes=app.routes,
+        webhooks=app.webhooks.routes,
+        tags=app.openapi_tags,
+        servers=servers,
+        separate_input_output_schemas=app.separate_input_output_schemas,
+    )
+
+
+class OpenAPIController(BaseController):
+    """
+    Serves the OpenAPI document at the app's openapi_url, in place of FastAPI's
+    route, from memory. The document is generated once (or read from
+    openapi_schema_file, written by getOpenAPI at build time), serialized once,
+    and compressed once with gzip (and brotli, if installed). Each encoding has its
+    own strong ETag.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name, **kwargs)
+        self.router.prefix = ""
+
+        self.body: Optional[bytes] = None
+        self.encoded_bodies: Dict[str, bytes] = {}
+        self.etag: Optional[str] = None
+        # encoding (None for identity) -> ETag
+        self.etags: Dict[Optional[str], str] = {}
+
+        self.router.add_api_route(
+            app_registry.get().openapi_url,
+            self.get_openapi,
+            methods=["GET"],
+            include_in_schema=False,
+        )
+
+    def post_init(self):
+        app = app_registry.get()
+        app.router.routes = [
+            route
+            for route in app.router.routes
+            if not (
+                isinstance(route, Route)
+                and route.path == app.openapi_url
+                and route.endpoint.__module__ == "fastapi.applications"
+            )
+        ]
+        return super().post_init()
+
+    def load(self):
+        """
+        Generates and compresses the document, if not done already.
+        Run before forking workers, so they share it.
+        """
+        if self.body is not None:
+            return
+        app = app_registry.get()
+        if _config.openapi_schema_file:
+            with open(_config.openapi_schema_file, "rb") as f:
+                app.openapi_schema = orjson.loads(f.read())
+        elif not app.openapi_schema:
+            app.openapi_schema = generate_openapi(app)
+        self.body = orjson.dumps(app.openapi_schema)
+        self.encoded_bodies = {
+            # One time cost, so maximum compression.
+            encoding: compress(self.body, encoding, 11 if encoding == "br" else 9)
+            for encoding in get_available_encodings()
+        }
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.etags = {
+            encoding: encoding_etag(self.etag, encoding)
+            for encoding in [None, *self.encoded_bodies]
+        }
+
+    async def get_openapi(self, request: Request):
+        self.load()
+        encoding = select_encoding(
+            request.headers.get("accept-encoding", ""), self.encoded_bodies
+        )
+        headers = {
+            "ETag": self.etags[encoding],
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        # Any encoding the client holds is current.
+        if if_none_match(
+            request.headers.get("if-none-match", ""), *self.etags.values()
+        ):
+            return Response(status_code=304, headers=headers)
+        body = self.body
+        if encoding:
+            body = self.encoded_bodies[encoding]
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,158 @@
+"""Module containing the indexed registry of components and configs"""
+
+import inspect
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# True while a request scoped factory runs. Components built by it are not
+# registered process wide (see BaseComponent.__init__).
+building_request_scoped: ContextVar[bool] = ContextVar(
+    "building_request_scoped", default=False
+)
+
+
+class Scope(Enum):
+    singleton = "singleton"
+    request = "request"
+
+
+class Registry:
+    """
+    Ordered collection of objects (components or configs), indexed by exact type,
+    by every class in the type's MRO and by name, so lookups are dictionary hits.
+    Lookups return the first registered match, same as a linear isinstance scan would.
+
+    Factories can also be registered for a type. Singleton factories are called
+    once, on first lookup, and their result is registered. Request scoped factories
+    are called once per request, see resolve(), and their results are not registered.
+
+    Supports the list operations callers used on the plain lists it replaced
+    (iteration, len, indexing, in, append, extend, remove).
+    """
+
+    def __init__(self, items: Optional[List] = None):
+        self._items: List = []
+        self._by_type: Dict[type, List] = {}
+        self._by_mro: Dict[type, List] = {}
+        self._by_name: Dict[Tuple[type, str, bool], List] = {}
+        # (type, name) -> (factory, scope)
+        self._factories: Dict[Tuple[type, str], Tuple[Callable, Scope]] = {}
+        for item in items or []:
+            self.append(item)
+
+    def append(self, item):
+        self._items.append(item)
+        cls = type(item)
+        name = getattr(item, "name", "")
+        self._by_type.setdefault(cls, []).append(item)
+        if name:
+            self._by_name.setdefault((cls, name, True), []).append(item)
+        for base in cls.__mro__:
+            self._by_mro.setdefault(base, []).append(item)
+            if name:
+                self._by_name.setdefault((base, name, False), []).append(item)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def remove(self, item):
+        """
+        Removes the given object (compared by identity). Raises ValueError if absent.
+        """
+        if not self._remove_from(self._items, item):
+            raise ValueError("Registry.remove(x): x not in registry")
+        cls = type(item)
+        name = getattr(item, "name", "")
+        self._remove_from(self._by_type, item, cls)
+        if name:
+            self._remove_from(self._by_name, item, (cls, name, True))
+        for base in cls.__mro__:
+            self._remove_from(self._by_mro, item, base)
+            if name:
+                self._remove_from(self._by_name, item, (base, name, False))
+
+    @classmethod
+    def _remove_from(cls, container, item, key=None) -> bool:
+        items = container if key is None else container.get(key, None)
+        if not items:
+            return False
+        for index, existing in enumerate(items):
+            if existing is item:
+                del items[index]
+                if key is not None and not items:
+                    del container[key]
+                return True
+        return False
+
+    def clear(self):
+        self._items.clear()
+        self._by_type.clear()
+        self._by_mro.clear()
+        self._by_name.clear()
+        self._factories.clear()
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._items))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __contains__(self, item) -> bool:
+        return any(existing is item for existing in self._items)
+
+    def get(self, cls: type, name: str = "", strict=False) -> Any:
+        """
+        strict matches the exact type only, else subclasses match too.
+        """
+        if name:
+            items = self._by_name.get((cls, name, strict), None)
+        elif strict:
+            items = self._by_type.get(cls, None)
+        else:
+            items = self._by_mro.get(cls, None)
+        if items:
+            return items[0]
+        factory, scope = self._factories.get((cls, name), (None, None))
+        if factory and scope == Scope.singleton:
+            result = factory()
+            # Components register themselves on init.
+            if result not in self:
+                self.append(result)
+            return result
+        return None
+
+    def add_factory(
+        self,
+        cls: type,
+        factory: Callable[[], Any],
+        scope: Scope = Scope.singleton,
+        name: str = "",
+    ):
+        self._factories[(cls, name)] = (factory, scope)
+
+    async def resolve(self, cls: type, name: str = "", request=None) -> Any:
+        """
+        Like get, but also creates request scoped instances, once per request.
+        """
+        factory, scope = self._factories.get((cls, name), (None, None))
+        if scope != Scope.request:
+            return self.get(cls, name)
+        scoped = getattr(request.state, "scoped_components", None)
+        if scoped is None:
+            scoped = request.state.scoped_components = {}
+        key = (cls, name)
+        if key not in scoped:
+            token = building_request_scoped.set(True)
+            try:
+                result = factory()
+                if inspect.isawaitable(result):
+                    result = await result
+            finally:
+                building_request_scoped.reset(token)
+            scoped[key] = result
+        return scoped[key]
@@ -0,0 +1,222 @@
+"""Module containing the in-memory response cache of controller routes"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import logging
+from typing import Any, Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.dependencies.utils import (
+    get_typed_return_annotation,
+    get_typed_signature,
+)
+from fastapi.exceptions import ResponseValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from starlette.responses import StreamingResponse
+
+from .config import Settings
+from .context import response_cache_registry
+from .routing import get_type_adapter
+from .utils.etag import if_none_match
+from .utils.ttl_cache import TTLCache
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+class ResponseCache:
+    """
+    Serialized 200 responses of one endpoint, keyed by path and query string
+    (and the auth subject, with vary_on_auth; requests without one are not
+    cached), with an ETag per body.
+    Return values are validated against and dumped with response_model, if given,
+    like FastAPI does. Without it, only Responses and pydantic models are cached.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        vary_on_auth=False,
+        cache_control: Optional[str] = None,
+        response_model: Any = None,
+    ):
+        self.name = name
+        self.response_adapter = (
+            TypeAdapter(response_model) if response_model is not None else None
+        )
+        self.vary_on_auth = vary_on_auth
+        self.warned_no_auth = False
+        self.cache_control = cache_control or (
+            "private, no-cache" if vary_on_auth else "no-cache"
+        )
+        self.cache = TTLCache(
+            max_entries=max_entries or _config.response_cache_max_entries,
+            ttl=ttl if ttl is not None else _config.response_cache_default_ttl,
+        )
+
+    def get_key(self, request: Request) -> Optional[tuple]:
+        """
+        Returns None, meaning the response is not cached, if vary_on_auth is set
+        but the request has no authenticated subject (like when the auth
+        dependency didn't run before the endpoint).
+        """
+        key = (request.url.path, request.url.query)
+        if self.vary_on_auth:
+            credentials = getattr(request.state, "auth_credentials", None)
+            sub = getattr(credentials, "sub", None)
+            if sub is None:
+                if not self.warned_no_auth:
+                    self.warned_no_auth = True
+                    _logger.warning(
+                        "Response cache %s varies on auth, but the request has no "
+                        "auth credentials. Not caching.",
+                        self.name,
+                    )
+                return None
+            key += (getattr(credentials, "iss", None), sub)
+        return key
+
+    async def get_response(
+        self, request: Request, call: Callable, args: tuple, kwargs: dict
+    ) -> Response:
+        key = self.get_key(request)
+        if key is None:
+            return await call(*args, **kwargs)
+        entry = self.cache.get(key)
+        if entry is None:
+            result = await call(*args, **kwargs)
+            entry = self.make_entry(result)
+            if entry is None:
+                return result
+            self.cache.set(key, entry)
+        body, media_type, etag = entry
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if if_none_match(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    def make_entry(self, result) -> Optional[tuple]:
+        """
+        Returns (body, media_type, etag), or None if the result is not cacheable.
+        """
+        if isinstance(result, Response):
+            if result.status_code != 200 or isinstance(result, StreamingResponse):
+                return None
+            body = result.body
+            media_type = result.headers.get("content-type", result.media_type)
+        elif self.response_adapter:
+            try:
+                value = self.response_adapter.validate_python(
+                    result, from_attributes=True
+                )
+            except ValidationError as e:
+                raise ResponseValidationError(
+                    errors=[
+                        {**error, "loc": ("response", *error["loc"])}
+                        for error in e.errors(include_url=False)
+                    ],
+                    body=result,
+                ) from e
+            body = self.response_adapter.dump_json(value, by_alias=True)
+            media_type = "application/json"
+        elif isinstance(result, BaseModel):
+            body = get_type_adapter(type(result)).dump_json(result, by_alias=True)
+            media_type = "application/json"
+        else:
+            return None
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        return body, media_type, etag
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+def cache_response(
+    ttl: Optional[float] = None,
+    max_entries: Optional[int] = None,
+    vary_on_auth=False,
+    cache_control: Optional[str] = None,
+    name: Optional[str] = None,
+    response_model: Any = None,
+):
+    """
+    Decorator of controller endpoints, caching their serialized responses.
+    See ResponseCache. ttl and max_entries default to response_cache_default_ttl
+    and response_cache_max_entries. response_model defaults to the endpoint's
+    return annotation; pass it here if the route is given a different one, since
+    cached bodies are served as is. The Request is injected into the endpoint's
+    signature.
+
+    Invalidate with invalidate_response_cache(name); name defaults to the
+    endpoint's qualified name, like "AuthController.get_login_providers".
+    """
+
+    def decorator(func: Callable) -> Callable:
+        model = response_model
+        if model is None:
+            model = get_typed_return_annotation(func)
+            if inspect.isclass(model) and issubclass(model, Response):
+                model = None
+        response_cache = ResponseCache(
+            name or func.__qualname__,
+            ttl=ttl,
+            max_entries=max_entries,
+            vary_on_auth=vary_on_auth,
+            cache_control=cache_control,
+            response_model=model,
+        )
+        response_cache_registry.get()[response_cache.name] = response_cache
+
+        signature = get_typed_signature(func)
+        parameters = list(signature.parameters.values())
+        request_param = next(
+            (p.name for p in parameters if p.annotation is Request), None
+        )
+        if not request_param:
+            request_param = "_response_cache_request"
+            new_param = inspect.Parameter(
+                request_param, inspect.Parameter.KEYWORD_ONLY, annotation=Request
+            )
+            if parameters and parameters[-1].kind == inspect.Parameter.VAR_KEYWORD:
+                parameters.insert(-1, new_param)
+            else:
+                parameters.append(new_param)
+        is_coroutine = asyncio.iscoroutinefunction(func)
+
+        async def call(*args, **kwargs):
+            if is_coroutine:
+                return await func(*args, **kwargs)
+            return await run_in_threadpool(func, *args, **kwargs)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = kwargs[request_param]
+            if request_param == "_response_cache_request":
+                del kwargs[request_param]
+            return await response_cache.get_response(request, call, args, kwargs)
+
+        wrapper.__signature__ = signature.replace(
+            parameters=parameters,
+            return_annotation=get_typed_return_annotation(func),
+        )
+        wrapper.response_cache = response_cache
+        return wrapper
+
+    return decorator
+
+
+def invalidate_response_cache(name: Optional[str] = None):
+    """
+    Clears the response cache of the given name, or all response caches.
+    """
+    for cache_name, response_cache in response_cache_registry.get().items():
+        if name is None or cache_name == name:
+            response_cache.invalidate()
@@ -0,0 +1,206 @@
+"""Module containing the APIRoute classes used by controllers"""
+
+import asyncio
+import copy
+import functools
+import time
+from typing import Any, Callable, Coroutine
+
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.exceptions import RequestValidationError, ResponseValidationError
+from fastapi.routing import APIRoute, get_request_handler
+from fastapi.utils import is_body_allowed_for_status_code
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import Message, Receive, Scope, Send
+
+from .metrics import Metrics
+
+
+def commit_request_db_session(
+    handler: Callable[[Request], Coroutine[Any, Any, Response]]
+) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+    """
+    Wraps a route handler to commit the session of dependencies.get_db_session,
+    if the request has one, after the endpoint returns and before the response is sent.
+    """
+
+    @functools.wraps(handler)
+    async def app(request: Request) -> Response:
+        response = await handler(request)
+        session = getattr(request.state, "db_session", None)
+        if session is not None and session.in_transaction():
+            await session.commit()
+        return response
+
+    return app
+
+
+class BaseAPIRoute(APIRoute):
+    """
+    APIRoute that records in-flight requests and latency per route in Metrics,
+    and commits the request's DB session before the response is sent.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        return commit_request_db_session(super().get_route_handler())
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send) -> None:
+        metrics = Metrics.get_component()
+        if not metrics:
+            return await super().handle(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        metrics.http_requests_in_flight.inc(method, self.path)
+        start = time.perf_counter()
+        try:
+            await super().handle(scope, receive, send_wrapper)
+        except RequestValidationError:
+            status_code = 400
+            raise
+        except Exception as e:
+            # Exception handlers send the response after this returns.
+            status_code = getattr(e, "status_code", 500)
+            raise
+        finally:
+            metrics.http_requests_in_flight.dec(method, self.path)
+            metrics.http_request_duration_seconds.observe(
+                method, self.path, str(status_code), value=time.perf_counter() - start
+            )
+
+
+def trusted_response(endpoint: Callable) -> Callable:
+    """
+    Marks an endpoint whose return value already matches its response_model,
+    so PydanticJSONAPIRoute serializes it without validating it again.
+    """
+    endpoint.trusted_response = True
+    return endpoint
+
+
+class PydanticJSONAPIRoute(BaseAPIRoute):
+    """
+    BaseAPIRoute that serializes return values straight to json bytes with
+    pydantic-core (TypeAdapter.dump_json), instead of validating and dumping them
+    to python objects (or jsonable_encoder) and then encoding those with orjson.
+    - With a response_model, the return value is validated against it (unless the
+      endpoint is marked with trusted_response) and dumped with the route's
+      response_model_* options.
+    - Without a response_model, pydantic models are dumped by their own type, and
+      other values go through FastAPI's usual path.
+    Select per controller with BaseController(route_class=PydanticJSONAPIRoute).
+    """
+
+    _sub_response_param = "_pydantic_json_sub_response"
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        if not issubclass(response_class, JSONResponse):
+            return super().get_route_handler()
+
+        self.response_adapter = (
+            TypeAdapter(self.response_model) if self.response_field else None
+        )
+        self.skip_response_validation = getattr(
+            self.endpoint, "trusted_response", False
+        )
+        dependant = copy.copy(self.dependant)
+        dependant.call = self.wrap_endpoint(self.dependant.call)
+        if not dependant.response_param_name:
+            # Sub response carries the status code, headers and cookies that
+            # the endpoint or its dependencies set.
+            dependant.response_param_name = self._sub_response_param
+        handler = get_request_handler(
+            dependant=dependant,
+            body_field=self.body_field,
+            status_code=self.status_code,
+            response_class=self.response_class,
+            response_field=self.secure_cloned_response_field,
+            response_model_include=self.response_model_include,
+            response_model_exclude=self.response_model_exclude,
+            response_model_by_alias=self.response_model_by_alias,
+            response_model_exclude_unset=self.response_model_exclude_unset,
+            response_model_exclude_defaults=self.response_model_exclude_defaults,
+            response_model_exclude_none=self.response_model_exclude_none,
+            dependency_overrides_provider=self.dependency_overrides_provider,
+        )
+        return commit_request_db_session(handler)
+
+    def wrap_endpoint(self, call: Callable) -> Callable:
+        response_param = self.dependant.response_param_name
+
+        def get_sub_response(values: dict) -> Response:
+            if response_param:
+                return values[response_param]
+            return values.pop(self._sub_response_param)
+
+        if asyncio.iscoroutinefunction(call):
+
+            @functools.wraps(call)
+            async def endpoint(**values):
+                sub_response = get_sub_response(values)
+                return self.serialize(await call(**values), sub_response)
+
+        else:
+
+            @functools.wraps(call)
+            def endpoint(**values):
+                sub_response = get_sub_response(values)
+                return self.serialize(call(**values), sub_response)
+
+        return endpoint
+
+    def serialize(self, value: Any, sub_response: Response) -> Any:
+        if isinstance(value, Response):
+            return value
+        if self.response_adapter:
+            adapter = self.response_adapter
+            if not self.skip_response_validation:
+                try:
+                    value = adapter.validate_python(value, from_attributes=True)
+                except ValidationError as e:
+                    raise ResponseValidationError(
+                        errors=[
+                            {**error, "loc": ("response", *error["loc"])}
+                            for error in e.errors(include_url=False)
+                        ],
+                        body=value,
+                    ) from e
+            body = adapter.dump_json(
+                value,
+                include=self.response_model_include,
+                exclude=self.response_model_exclude,
+                by_alias=self.response_model_by_alias,
+                exclude_unset=self.response_model_exclude_unset,
+                exclude_defaults=self.response_model_exclude_defaults,
+                exclude_none=self.response_model_exclude_none,
+            )
+        elif isinstance(value, BaseModel):
+            body = get_type_adapter(type(value)).dump_json(value, by_alias=True)
+        else:
+            return value
+
+        status_code = sub_response.status_code or self.status_code or 200
+        response = Response(
+            content=body if is_body_allowed_for_status_code(status_code) else b"",
+            status_code=status_code,
+            media_type="application/json",
+        )
+        response.headers.raw.extend(sub_response.headers.raw)
+        return response
+
+
+@functools.lru_cache(maxsize=None)
+def get_type_adapter(cls: type) -> TypeAdapter:
+    return TypeAdapter(cls)
@@ -0,0 +1,87 @@
+"""Module containing the gunicorn based multi worker server"""
+
+import gc
+import importlib.util
+import logging
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from .config import Settings
+from .context import config_registry
+from .utils.worker_id import remove_worker_slot_dir, set_worker_id
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+def get_event_loop_type() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def get_http_protocol_type() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+class AppUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": get_event_loop_type(),
+        "http": get_http_protocol_type(),
+        "lifespan": "on",
+    }
+
+
+class GunicornServer(BaseApplication):
+    """
+    Runs the given, already initialized, app with gunicorn and uvicorn workers.
+    The app is loaded once in the master and inherited by the forked workers
+    (gc.freeze before fork keeps the inherited objects shared, copy-on-write).
+    Worker ids (0 to no_of_workers - 1) are assigned by the master, and a restarted
+    worker gets the id of the worker it replaces.
+    SIGHUP gracefully restarts the workers. With server_max_requests, each worker is
+    recycled after that many requests (plus up to server_max_requests_jitter more).
+    """
+
+    def __init__(self, app, **options):
+        self.application = app
+        self.options = {
+            "bind": f"{_config.host}:{_config.port}",
+            "workers": _config.no_of_workers,
+            "worker_class": f"{__name__}.AppUvicornWorker",
+            "preload_app": True,
+            "max_requests": _config.server_max_requests,
+            "max_requests_jitter": _config.server_max_requests_jitter,
+            "timeout": _config.server_timeout,
+            "graceful_timeout": _config.server_graceful_timeout,
+            "keepalive": _config.server_keepalive,
+            "pre_fork": self.pre_fork,
+            "post_fork": self.post_fork,
+            "on_exit": self.on_exit,
+            **options,
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key.lower(), value)
+
+    def load(self):
+        return self.application
+
+    def pre_fork(self, server, worker):
+        used_ids = {getattr(w, "worker_id", None) for w in server.WORKERS.values()}
+        worker.worker_id = next(
+            i for i in range(len(used_ids) + 1) if i not in used_ids
+        )
+        gc.freeze()
+
+    def post_fork(self, server, worker):
+        set_worker_id(worker.worker_id)
+        for config in config_registry.get():
+            config.worker_id = worker.worker_id
+            config.worker_pid = worker.pid
+        _logger.info("Worker ID - %s. PID - %s", worker.worker_id, worker.pid)
+
+    def on_exit(self, server):
+        remove_worker_slot_dir()
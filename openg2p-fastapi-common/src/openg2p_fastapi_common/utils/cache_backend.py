@@ -0,0 +1,38 @@
+from abc import ABC, abstractmethod
+from typing import Any, Hashable, Optional
+
+
+class CacheBackend(ABC):
+    """
+    Interface of the caches of this library (see TTLCache, SharedMemoryCache).
+    ttl is in seconds; None means no expiry, and ttl <= 0 means don't cache.
+    """
+
+    @abstractmethod
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        pass
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """
+        Returns a dict with at least size, hits and misses.
+        """
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, None) is not None
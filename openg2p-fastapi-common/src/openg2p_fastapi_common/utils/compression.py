@@ -0,0 +1,74 @@
+import zlib
+from typing import Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    # Optional. pip install openg2p_fastapi_common[brotli]
+    brotli = None
+
+
+def get_available_encodings() -> tuple:
+    return ("br", "gzip") if brotli else ("gzip",)
+
+
+def select_encoding(
+    accept_encoding: str, encodings: Optional[Iterable[str]] = None
+) -> Optional[str]:
+    """
+    Returns the first of encodings (default: br, if available, then gzip) that the
+    Accept-Encoding header value accepts, or None.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings or get_available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """
+    level is the gzip compression level (1-9) or the brotli quality (0-11).
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class StreamCompressor:
+    """
+    Incremental compressor. Each compress() returns data that is decodable by
+    the client as soon as it is received (the compressor is flushed).
+    """
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
@@ -0,0 +1,62 @@
+import asyncio
+import collections
+from typing import Deque
+
+
+class ConcurrencyLimiter:
+    """
+    Admits up to limit concurrent holders. Callers beyond that wait in a FIFO
+    queue of at most max_queue, for at most timeout seconds.
+    acquire() returns False if the queue is full or the wait timed out;
+    otherwise release() must be called once done.
+    """
+
+    def __init__(self, limit: int, max_queue: int = 0, timeout: float = 0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def try_acquire(self) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        return False
+
+    async def acquire(self) -> bool:
+        if self.try_acquire():
+            return True
+        if len(self._waiters) >= self.max_queue or self.timeout <= 0:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed over a slot, but cancelled before getting it.
+                self.release()
+            raise
+        finally:
+            if not future.done() or future.cancelled():
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+
+    def release(self):
+        # The slot passes on to the first waiter still waiting, if any.
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
@@ -0,0 +1,39 @@
+import re
+from typing import List, Optional
+
+_etag_re = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+def parse_etags(header: str) -> List[str]:
+    """
+    Returns the entity tags of an If-None-Match / If-Match header value, in
+    order, like ['"abc"', 'W/"def"'], or ["*"].
+    """
+    return _etag_re.findall(header or "")
+
+
+def if_none_match(header: str, *etags: str) -> bool:
+    """
+    True if the If-None-Match header value matches any of etags (like the ETags of
+    the encodings of a resource), with the weak comparison of RFC 9110
+    (W/ prefixes ignored).
+    """
+    etags = {etag.removeprefix("W/") for etag in etags}
+    for tag in parse_etags(header):
+        if tag == "*" or tag.removeprefix("W/") in etags:
+            return True
+    return False
+
+
+def encoding_etag(etag: str, encoding: Optional[str]) -> str:
+    """
+    ETag of a content encoding of the representation with etag, like '"abc-gzip"'.
+    A strong ETag must differ whenever the bytes do.
+    """
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def weaken_etag(etag: str) -> str:
+    return etag if etag.startswith("W/") else f"W/{etag}"
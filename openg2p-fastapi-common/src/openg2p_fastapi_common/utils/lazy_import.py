@@ -0,0 +1,25 @@
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module until one of its attributes is first accessed,
+    at which point the module is imported and its attributes copied over,
+    so that later accesses cost the same as on the module itself.
+    """
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Use like: httpx = lazy_import("httpx").
+    Annotations that reference the module get evaluated at definition time
+    (and so import it), unless quoted.
+    """
+    return sys.modules.get(name, None) or LazyModule(name)
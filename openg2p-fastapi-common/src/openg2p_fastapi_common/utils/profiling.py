@@ -0,0 +1,44 @@
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from ..context import startup_timings
+
+
+@contextmanager
+def timed_phase(name: str):
+    """
+    Records the time taken (in ms) by the block in startup_timings, under name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = startup_timings.get()
+        timings[name] = timings.get(name, 0) + (time.perf_counter() - start) * 1000
+
+
+def get_import_times(module: str, top: int = 20) -> List[Tuple[str, float, float]]:
+    """
+    Imports the module in a fresh interpreter with -X importtime and returns
+    the top (module, self ms, cumulative ms) entries by cumulative time.
+    """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    result = []
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        result.append((parts[2].strip(), self_us / 1000, cumulative_us / 1000))
+    result.sort(key=lambda x: x[2], reverse=True)
+    return result[:top]
@@ -0,0 +1,123 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While open, allow()
+    returns False, except for one trial call every reset_timeout seconds.
+    A success closes it; a failure of the trial call keeps it open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            # Trial call. The next one is due after another reset_timeout,
+            # in case this one never reports back.
+            self.opened_at = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """
+    Allows retries up to ratio of the requests made in the current window of
+    interval seconds, or min_retries, whichever is more. Keeps retries from
+    multiplying the load on an upstream that is already failing.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 10, interval: float = 10):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.interval = interval
+        self.requests = 0
+        self.retries = 0
+        self.retries_total = 0
+        self._window_start = time.monotonic()
+
+    def record_request(self):
+        self._roll()
+        self.requests += 1
+
+    def try_spend(self) -> bool:
+        self._roll()
+        if self.retries >= max(self.min_retries, self.ratio * self.requests):
+            return False
+        self.retries += 1
+        self.retries_total += 1
+        return True
+
+    def _roll(self):
+        now = time.monotonic()
+        if now - self._window_start >= self.interval:
+            self._window_start = now
+            self.requests = 0
+            self.retries = 0
+
+
+def jittered_backoff(attempt: int, base: float, max_delay: float) -> float:
+    """
+    Full jitter: random between 0 and min(max_delay, base * 2^attempt).
+    """
+    return random.uniform(0, min(max_delay, base * 2**attempt))
+
+
+async def hedged(
+    call: Callable[[], Awaitable[Any]],
+    delay: float,
+    can_hedge: Optional[Callable[[], bool]] = None,
+) -> Any:
+    """
+    Awaits call(). If it hasn't completed within delay seconds (and can_hedge()
+    allows), makes a second call. Returns the result of the first call to succeed
+    and cancels the other. Raises the last error if both fail.
+    """
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or (can_hedge and not can_hedge()):
+            return await tasks[0]
+        tasks.append(asyncio.ensure_future(call()))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,68 @@
+import math
+import os
+from typing import Optional
+
+
+def _read_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def get_cpu_limit() -> int:
+    """
+    CPUs available to this process, honouring affinity and cgroup (v2 or v1) quotas.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota, period = None, None
+    cpu_max = _read_file("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+    else:
+        quota = _read_file("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read_file("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    try:
+        if quota and period and quota != "max" and int(quota) > 0:
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except ValueError:
+        pass
+    return max(1, cpus)
+
+
+def get_memory_limit() -> Optional[int]:
+    """
+    Memory (in bytes) available to this process: the cgroup (v2 or v1) limit if any,
+    else the physical memory.
+    """
+    physical = None
+    try:
+        physical = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        pass
+    limit = _read_file("/sys/fs/cgroup/memory.max") or _read_file(
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+    )
+    try:
+        if limit and limit != "max":
+            # cgroup v1 reports a huge number when unlimited.
+            return min(int(limit), physical) if physical else int(limit)
+    except ValueError:
+        pass
+    return physical
+
+
+def get_auto_worker_count(worker_memory_mb: int) -> int:
+    """
+    One worker per CPU, as long as each worker gets worker_memory_mb of memory.
+    """
+    workers = get_cpu_limit()
+    memory = get_memory_limit()
+    if memory and worker_memory_mb > 0:
+        workers = min(workers, memory // (worker_memory_mb * 1024 * 1024))
+    return max(1, workers)
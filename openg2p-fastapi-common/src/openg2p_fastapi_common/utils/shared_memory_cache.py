@@ -0,0 +1,256 @@
+import errno
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import time
+from typing import Any, Hashable, Optional
+
+from .cache_backend import CacheBackend
+
+# magic, version, number of slots, slot size, used slots
+_HEADER = struct.Struct("<8sIIII")
+_HEADER_SIZE = 64
+_MAGIC = b"G2PCACHE"
+_VERSION = 1
+# key digest (all zeros if the slot is empty), expires at (0 if never), value length
+_SLOT_HEADER = struct.Struct("<16sdI")
+_SLOT_HEADER_SIZE = 32
+_EMPTY = bytes(16)
+_PROBES = 8
+
+_logger = logging.getLogger(__name__)
+
+
+class SharedMemoryCache(CacheBackend):
+    """
+    Cache in a memory mapped file, shared by all the processes (like the workers
+    of a server) that open the same file. Meant for a tmpfs like /dev/shm.
+    Values are unpickled, so the file must only be writable by trusted processes
+    (create_cache keeps it in a private directory).
+
+    The file is a fixed size hash table of max_entries slots of slot_size bytes
+    (plus 32 bytes of header per slot). Creating it fails with OSError if the file
+    system doesn't have that much space free (see _check_free_space).
+    Keys and values are pickled; values larger than slot_size are not cached,
+    but counted in oversized (and logged, the first time).
+    A key lives in one of 8 slots following its hash. When they are all taken,
+    the entry expiring first is replaced.
+    Reads and writes hold a shared or exclusive lock (fcntl) on the file, so
+    updates are atomic across processes. The lock is taken in the calling thread,
+    blocking it (in async code, the event loop) while another process holds it.
+    So the locked sections are kept bounded: at most 8 slot headers read and one
+    value copied, with pickling done outside. Not thread safe within a process.
+    hits, misses and oversized are counted per process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        slot_size: int = 4096,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.slot_size = slot_size
+        self.stride = _SLOT_HEADER_SIZE + slot_size
+        self.hits = 0
+        self.misses = 0
+        self.oversized = 0
+
+        size = _HEADER_SIZE + max_entries * self.stride
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        self._lock(fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if os.fstat(self._fd).st_size != size or _HEADER.unpack(header)[:4] != (
+                _MAGIC,
+                _VERSION,
+                max_entries,
+                slot_size,
+            ):
+                # New (or not compatible). Processes sharing a file must agree on
+                # max_entries and slot_size, so create_cache puts those in the path.
+                os.ftruncate(self._fd, 0)
+                self._check_free_space(size)
+                os.ftruncate(self._fd, size)
+                os.pwrite(
+                    self._fd,
+                    _HEADER.pack(_MAGIC, _VERSION, max_entries, slot_size, 0),
+                    0,
+                )
+            self._mm = mmap.mmap(self._fd, size, mmap.MAP_SHARED)
+        finally:
+            self._unlock()
+
+    def _check_free_space(self, size: int):
+        """
+        Raises OSError (ENOSPC) if the file system can't hold size more bytes.
+        The file is sparse: on a full tmpfs, touching a page that can't be
+        allocated kills the process with SIGBUS rather than raising.
+        Pages of the other files in the directory, not yet allocated, are counted
+        as taken, since those caches will fill up too.
+        """
+        directory = os.path.dirname(self.path) or "."
+        st = os.statvfs(directory)
+        free = st.f_bavail * st.f_frsize
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.path == self.path or not entry.is_file(follow_symlinks=False):
+                    continue
+                entry_st = entry.stat(follow_symlinks=False)
+                free -= max(0, entry_st.st_size - entry_st.st_blocks * 512)
+        if free < size:
+            raise OSError(
+                errno.ENOSPC,
+                f"{size} bytes needed in {directory}, {max(0, free)} available",
+            )
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        digest = self._digest(key)
+        value = None
+        self._lock(fcntl.LOCK_SH)
+        try:
+            offset = self._find(digest)
+            if offset is not None:
+                _, expires_at, length = _SLOT_HEADER.unpack_from(self._mm, offset)
+                if not expires_at or expires_at > time.time():
+                    start = offset + _SLOT_HEADER_SIZE
+                    value = self._mm[start : start + length]
+        finally:
+            self._unlock()
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            self.pop(key)
+            return
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.slot_size:
+            if not self.oversized:
+                _logger.warning(
+                    "Not caching a value of %s bytes in %s (slot_size %s).",
+                    len(data),
+                    self.path,
+                    self.slot_size,
+                )
+            self.oversized += 1
+            return
+        digest = self._digest(key)
+        expires_at = 0.0 if ttl is None else time.time() + ttl
+        self._lock(fcntl.LOCK_EX)
+        try:
+            offset = self._find(digest)
+            if offset is None:
+                offset = self._find_free(digest)
+            start = offset + _SLOT_HEADER_SIZE
+            self._mm[start : start + len(data)] = data
+            _SLOT_HEADER.pack_into(self._mm, offset, digest, expires_at, len(data))
+        finally:
+            self._unlock()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        digest = self._digest(key)
+        self._lock(fcntl.LOCK_EX)
+        try:
+            offset = self._find(digest)
+            if offset is None:
+                return default
+            _, expires_at, length = _SLOT_HEADER.unpack_from(self._mm, offset)
+            start = offset + _SLOT_HEADER_SIZE
+            value = self._mm[start : start + length]
+            self._release(offset)
+        finally:
+            self._unlock()
+        if expires_at and expires_at <= time.time():
+            return default
+        return pickle.loads(value)
+
+    def clear(self):
+        self._lock(fcntl.LOCK_EX)
+        try:
+            for index in range(self.max_entries):
+                offset = _HEADER_SIZE + index * self.stride
+                self._mm[offset : offset + _SLOT_HEADER_SIZE] = bytes(_SLOT_HEADER_SIZE)
+            self._set_used(0)
+        finally:
+            self._unlock()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "oversized": self.oversized,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            # size is shared by all processes, hits and misses are not.
+            "shared": True,
+        }
+
+    def __len__(self) -> int:
+        """
+        Number of slots taken, including expired entries not yet replaced.
+        """
+        return _HEADER.unpack_from(self._mm, 0)[4]
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+    def _digest(self, key: Hashable) -> bytes:
+        digest = hashlib.blake2b(pickle.dumps(key, protocol=4), digest_size=16).digest()
+        return digest if digest != _EMPTY else b"\x01" + digest[1:]
+
+    def _probe_offsets(self, digest: bytes):
+        start = int.from_bytes(digest[:8], "little") % self.max_entries
+        for i in range(min(_PROBES, self.max_entries)):
+            yield _HEADER_SIZE + ((start + i) % self.max_entries) * self.stride
+
+    def _find(self, digest: bytes) -> Optional[int]:
+        for offset in self._probe_offsets(digest):
+            if self._mm[offset : offset + 16] == digest:
+                return offset
+        return None
+
+    def _find_free(self, digest: bytes) -> int:
+        """
+        Returns an empty slot (marking it used), else the one expiring first.
+        """
+        now = time.time()
+        victim, victim_expires_at = None, None
+        for offset in self._probe_offsets(digest):
+            slot_digest, expires_at, _ = _SLOT_HEADER.unpack_from(self._mm, offset)
+            if slot_digest == _EMPTY:
+                self._set_used(len(self) + 1)
+                return offset
+            expires_at = expires_at or float("inf")
+            if expires_at <= now:
+                return offset
+            if victim is None or expires_at < victim_expires_at:
+                victim, victim_expires_at = offset, expires_at
+        return victim
+
+    def _release(self, offset: int):
+        self._mm[offset : offset + _SLOT_HEADER_SIZE] = bytes(_SLOT_HEADER_SIZE)
+        self._set_used(len(self) - 1)
+
+    def _set_used(self, used: int):
+        struct.pack_into("<I", self._mm, _HEADER.size - 4, used)
+
+    def _lock(self, operation: int):
+        fcntl.lockf(self._fd, operation)
+
+    def _unlock(self):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN)
@@ -0,0 +1,83 @@
+import logging
+import os
+import shutil
+import tempfile
+from typing import Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+MAX_SLOTS = 1024
+
+# (pid, worker id, open slot file) of the slot claimed by this process
+_claimed: Optional[Tuple[int, int, object]] = None
+
+
+def get_default_slot_dir(parent_pid: Optional[int] = None) -> str:
+    # Workers of one server share the parent (the gunicorn arbiter or uvicorn supervisor).
+    return os.path.join(
+        tempfile.gettempdir(),
+        f"openg2p-worker-slots-{parent_pid or os.getppid()}",
+    )
+
+
+def export_worker_slot_dir(slot_dir: Optional[str] = None) -> str:
+    """
+    For the server's master process, before starting the workers. Returns slot_dir,
+    else the default slot directory keyed by this process, and passes it to the
+    workers (spawned, forked, or this process itself, when it serves requests)
+    through the environment, so that it doesn't depend on their parent.
+    """
+    slot_dir = slot_dir or get_default_slot_dir(os.getpid())
+    os.environ["common_worker_slot_dir"] = slot_dir
+    return slot_dir
+
+
+def claim_worker_id(slot_dir: Optional[str] = None) -> int:
+    """
+    Returns the lowest worker slot (0, 1, ...) not held by another live worker,
+    claimed with an exclusive flock on its slot file. The lock lives as long as the
+    process, so a restarted worker gets the slot of the worker it replaces.
+    Claimed once per process; later calls return the same id.
+    Returns -1 if slots can't be claimed (like on platforms without fcntl).
+    """
+    global _claimed
+    pid = os.getpid()
+    if _claimed and _claimed[0] == pid:
+        return _claimed[1]
+
+    try:
+        import fcntl
+    except ImportError:
+        return -1
+
+    slot_dir = slot_dir or get_default_slot_dir()
+    try:
+        os.makedirs(slot_dir, exist_ok=True)
+        for slot in range(MAX_SLOTS):
+            f = open(os.path.join(slot_dir, f"{slot}.lock"), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            _claimed = (pid, slot, f)
+            return slot
+    except OSError as e:
+        _logger.warning("Unable to claim worker slot in %s. %s", slot_dir, repr(e))
+    return -1
+
+
+def remove_worker_slot_dir():
+    """
+    Removes the default slot directory of the workers of this process. For the
+    master, once its workers have exited.
+    """
+    shutil.rmtree(get_default_slot_dir(os.getpid()), ignore_errors=True)
+
+
+def set_worker_id(worker_id: int):
+    """
+    For process managers that assign worker ids themselves (like from a post_fork hook).
+    """
+    global _claimed
+    _claimed = (os.getpid(), worker_id, None)
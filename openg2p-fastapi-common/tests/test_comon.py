@@ -3,3 +3,1293 @@ from openg2p_fastapi_common.app import Initializer
 
 def test_initializer():
     Initializer()
+
+
+def test_ttl_cache():
+    from openg2p_fastapi_common.utils.ttl_cache import TTLCache
+
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    cache.set("d", 4, ttl=0)
+    assert "d" not in cache
+    assert cache.stats()["hits"] == 2
+    # Not caching drops the previous value.
+    cache.set("a", 5, ttl=-1)
+    assert "a" not in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_shared_memory_cache(tmp_path):
+    from openg2p_fastapi_common.utils.shared_memory_cache import SharedMemoryCache
+
+    path = str(tmp_path / "test.cache")
+    cache = SharedMemoryCache(path, max_entries=4, slot_size=64)
+    other = SharedMemoryCache(path, max_entries=4, slot_size=64)
+    cache.set(("id", 1), {"a": 1})
+    assert other.get(("id", 1)) == {"a": 1}
+    other.set(("id", 1), {"a": 2})
+    assert cache.get(("id", 1)) == {"a": 2}
+    cache.set("big", "x" * 100)
+    assert "big" not in other
+    assert cache.stats()["oversized"] == 1
+    cache.set("expired", 1, ttl=-1)
+    assert "expired" not in other
+    cache.set("expired", 1)
+    other.set("expired", 2, ttl=0)
+    assert cache.get("expired") is None
+    for i in range(10):
+        cache.set(i, i)
+    assert len(other) == 4
+    assert other.pop(9) == 9
+    other.clear()
+    assert cache.get(("id", 1)) is None and len(cache) == 0
+    cache.close()
+    other.close()
+
+
+def test_shared_memory_cache_free_space(tmp_path, monkeypatch):
+    import errno
+    from types import SimpleNamespace
+
+    import pytest
+    from openg2p_fastapi_common import cache
+    from openg2p_fastapi_common.utils import shared_memory_cache
+    from openg2p_fastapi_common.utils.ttl_cache import TTLCache
+
+    size = 64 + 16 * (32 + 4096)
+    monkeypatch.setattr(
+        shared_memory_cache.os,
+        "statvfs",
+        lambda path: SimpleNamespace(f_bavail=size + 10, f_frsize=1),
+    )
+    first = shared_memory_cache.SharedMemoryCache(
+        str(tmp_path / "a.cache"), max_entries=16, slot_size=4096
+    )
+    # The pages of the first file, not yet allocated, count as taken.
+    with pytest.raises(OSError) as e:
+        shared_memory_cache.SharedMemoryCache(
+            str(tmp_path / "b.cache"), max_entries=16, slot_size=4096
+        )
+    assert e.value.errno == errno.ENOSPC
+    # An existing file is opened as is.
+    shared_memory_cache.SharedMemoryCache(
+        str(tmp_path / "a.cache"), max_entries=16, slot_size=4096
+    ).close()
+    first.close()
+
+    monkeypatch.setattr(cache, "_shared_cache_dir", str(tmp_path))
+    assert isinstance(
+        cache.create_cache("big", max_entries=100, backend="shared"), TTLCache
+    )
+
+
+def test_shared_cache_dir(tmp_path, monkeypatch):
+    import os
+    import stat
+
+    from openg2p_fastapi_common import cache
+    from openg2p_fastapi_common.utils.shared_memory_cache import SharedMemoryCache
+    from openg2p_fastapi_common.utils.ttl_cache import TTLCache
+
+    monkeypatch.setattr(cache._config, "cache_shared_dir", None)
+    monkeypatch.delenv("common_cache_shared_dir", raising=False)
+    monkeypatch.setattr(cache, "_shared_cache_dir", None)
+    isdir = os.path.isdir
+    monkeypatch.setattr(
+        os.path, "isdir", lambda path: path != "/dev/shm" and isdir(path)
+    )
+    monkeypatch.setattr(cache.tempfile, "tempdir", str(tmp_path))
+    # Not predictable, and private.
+    shared_dir = cache.get_shared_cache_dir()
+    assert os.path.dirname(shared_dir) == str(tmp_path)
+    assert stat.S_IMODE(os.stat(shared_dir).st_mode) == 0o700
+    assert os.environ["common_cache_shared_dir"] == shared_dir
+    shared = cache.create_cache("test", max_entries=4, backend="shared", slot_size=64)
+    assert isinstance(shared, SharedMemoryCache)
+    shared.close()
+
+    # A configured directory writable by others is not used.
+    unsafe_dir = tmp_path / "unsafe"
+    unsafe_dir.mkdir()
+    os.chmod(unsafe_dir, 0o777)
+    monkeypatch.setattr(cache, "_shared_cache_dir", None)
+    monkeypatch.setattr(cache._config, "cache_shared_dir", str(unsafe_dir))
+    assert isinstance(cache.create_cache("test", backend="shared"), TTLCache)
+    assert not os.listdir(unsafe_dir)
+    os.chmod(unsafe_dir, 0o700)
+    assert cache.get_shared_cache_dir() == str(unsafe_dir)
+
+
+def test_metrics_render():
+    from openg2p_fastapi_common.metrics import Metrics
+
+    metrics = Metrics.get_component() or Metrics()
+    histogram = metrics.histogram("test_duration_seconds", "Test.", ["route"], [1])
+    histogram.observe("/a", value=0.5)
+    histogram.observe("/a", value=2)
+    body = metrics.render().decode()
+    assert 'test_duration_seconds_bucket{route="/a",le="1.0"} 1' in body
+    assert 'test_duration_seconds_bucket{route="/a",le="+Inf"} 2' in body
+    assert 'test_duration_seconds_count{route="/a"} 2' in body
+
+
+def test_metrics_multiprocess(tmp_path, monkeypatch):
+    import os
+    import subprocess
+    import sys
+
+    import orjson
+    from openg2p_fastapi_common import metrics as metrics_module
+
+    monkeypatch.setattr(
+        metrics_module._config, "metrics_multiprocess_dir", str(tmp_path)
+    )
+    metrics = metrics_module.Metrics()
+    metrics.counter("test_total", "Test.").inc(value=2)
+    labels = [["cache", "shared"]]
+    # Snapshots of another live worker (the parent process stands in for it) and
+    # of an exited worker. This worker writes its own on render.
+    exited = subprocess.Popen([sys.executable, "-c", ""])
+    exited.wait()
+    for pid, total in ((os.getppid(), 1), (exited.pid, 3)):
+        (tmp_path / f"metrics_{pid}.json").write_bytes(
+            orjson.dumps(
+                {
+                    "families": {
+                        "test_total": ["counter", "Test.", [["", [], total]]],
+                        "test_shared": ["gauge", "Test.", [["", labels, 7]]],
+                    },
+                    "shared": [["test_shared", labels]],
+                }
+            )
+        )
+    metrics.gauge("test_shared", "Test.", ["cache"]).set("shared", value=7)
+    metrics.mark_shared("test_shared", (("cache", "shared"),))
+
+    def render():
+        return metrics.render().decode().splitlines()
+
+    body = render()
+    assert "test_total 6" in body
+    assert 'test_shared{cache="shared"} 7' in body
+    # Exited workers' counters stay in the totals once their snapshots are gone.
+    assert "test_total 6" in render()
+    assert not (tmp_path / f"metrics_{exited.pid}.json").exists()
+
+
+def test_registry():
+    import asyncio
+    from types import SimpleNamespace
+
+    from openg2p_fastapi_common.registry import Registry, Scope
+
+    class A:
+        def __init__(self, name=""):
+            self.name = name
+
+    class B(A):
+        pass
+
+    registry = Registry()
+    a, b = A(), B(name="b")
+    registry.append(b)
+    registry.append(a)
+    assert registry.get(A) is b
+    assert registry.get(A, strict=True) is a
+    assert registry.get(A, name="b") is b
+    assert registry.get(A, name="b", strict=True) is None
+
+    registry.add_factory(list, list, scope=Scope.request)
+    request = SimpleNamespace(state=SimpleNamespace())
+    first = asyncio.run(registry.resolve(list, request=request))
+    assert asyncio.run(registry.resolve(list, request=request)) is first
+    other_request = SimpleNamespace(state=SimpleNamespace())
+    assert asyncio.run(registry.resolve(list, request=other_request)) is not first
+
+    registry.remove(b)
+    assert registry.get(A) is a and registry.get(A, name="b") is None
+    assert len(registry) == 1 and registry[0] is a and b not in registry
+
+    from openg2p_fastapi_common.component import BaseComponent
+    from openg2p_fastapi_common.context import component_registry
+
+    class Scoped(BaseComponent):
+        pass
+
+    Scoped.register_factory(Scoped, scope=Scope.request)
+    size = len(component_registry.get())
+    scoped = asyncio.run(
+        component_registry.get().resolve(Scoped, request=other_request)
+    )
+    assert isinstance(scoped, Scoped) and scoped not in component_registry.get()
+    assert len(component_registry.get()) == size
+
+
+def test_exception_handler():
+    import asyncio
+
+    import orjson
+    from openg2p_fastapi_common.errors.http_exceptions import NotFoundError
+    from openg2p_fastapi_common.exception import BaseExceptionHandler
+    from starlette.exceptions import HTTPException
+
+    handler = BaseExceptionHandler.get_component() or BaseExceptionHandler()
+    res = asyncio.run(handler.http_exception_handler(None, HTTPException(404)))
+    assert res.status_code == 404
+    assert orjson.loads(res.body) == {
+        "errors": [{"code": "G2P-REQ-404", "message": "Not Found"}]
+    }
+    # Subclasses can override how HTTPExceptions are mapped.
+    mapped = handler.map_http_to_base_exception(HTTPException(404, "No item 4"))
+    assert isinstance(mapped, NotFoundError) and mapped.message == "No item 4"
+    mapped = handler.map_http_to_base_exception(HTTPException(418))
+    assert (mapped.code, mapped.status_code) == ("G2P-REQ-100", 418)
+    res = asyncio.run(handler.base_exception_handler(None, NotFoundError()))
+    assert res.body is handler.get_error_body("G2P-REQ-404", "Not Found")
+    # Dynamic messages are serialized per error, not kept.
+    res = asyncio.run(
+        handler.base_exception_handler(None, NotFoundError(message="No item 5"))
+    )
+    assert orjson.loads(res.body) == {
+        "errors": [{"code": "G2P-REQ-404", "message": "No item 5"}]
+    }
+    assert len(handler.standard_error_bodies) == len(handler.standard_exceptions)
+
+
+def test_pydantic_json_route():
+    import asyncio
+    from typing import List
+
+    import httpx
+    from fastapi import FastAPI, Response
+    from fastapi.routing import APIRouter
+    from openg2p_fastapi_common.routing import PydanticJSONAPIRoute
+    from pydantic import BaseModel, Field
+
+    class Item(BaseModel):
+        id: int
+        display_name: str = Field(alias="displayName")
+
+    async def get_items(response: Response) -> List[Item]:
+        response.headers["X-Count"] = "1"
+        return [Item(id=1, displayName="a")]
+
+    async def get_invalid() -> List[Item]:
+        return [{"id": "a"}]
+
+    app = FastAPI()
+    router = APIRouter(route_class=PydanticJSONAPIRoute)
+    router.add_api_route("/items", get_items)
+    router.add_api_route("/invalid", get_invalid)
+    app.include_router(router)
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+            base_url="http://test",
+        ) as client:
+            res = await client.get("/items")
+            assert res.content == b'[{"id":1,"displayName":"a"}]'
+            assert res.headers["X-Count"] == "1"
+            assert (await client.get("/invalid")).status_code == 500
+
+    asyncio.run(run())
+
+
+def test_stream_response():
+    import asyncio
+
+    import orjson
+    from openg2p_fastapi_common.controller import BaseController
+    from pydantic import BaseModel
+
+    class Item(BaseModel):
+        id: int
+
+    async def rows():
+        for i in range(3):
+            yield Item(id=i)
+
+    async def read(ndjson):
+        response = BaseController().stream_response(rows(), ndjson=ndjson)
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    assert asyncio.run(read(True)).splitlines() == [
+        b'{"id":0}',
+        b'{"id":1}',
+        b'{"id":2}',
+    ]
+    assert orjson.loads(asyncio.run(read(False))) == [{"id": 0}, {"id": 1}, {"id": 2}]
+
+
+def test_compression():
+    import asyncio
+    import gzip
+
+    from openg2p_fastapi_common.middleware import CompressionMiddleware
+    from openg2p_fastapi_common.utils.compression import select_encoding
+    from starlette.responses import Response
+
+    assert select_encoding("gzip;q=0, deflate") is None
+    assert select_encoding("br;q=0, *") == "gzip"
+
+    async def run(body: bytes, accept_encoding: bytes):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        app = CompressionMiddleware(
+            Response(body, media_type="application/json", headers={"ETag": '"e"'})
+        )
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "headers": [(b"accept-encoding", accept_encoding)],
+        }
+        await app(scope, None, send)
+        return dict(messages[0]["headers"]), messages[1]["body"]
+
+    body = b"[" + b",".join(b"1" for _ in range(2000)) + b"]"
+    headers, res = asyncio.run(run(body, b"gzip"))
+    assert headers[b"content-encoding"] == b"gzip"
+    assert gzip.decompress(res) == body
+    # The bytes differ from the uncompressed ones.
+    assert headers[b"etag"] == b'W/"e"'
+    headers, res = asyncio.run(run(b"[1]", b"gzip"))
+    assert b"content-encoding" not in headers and res == b"[1]"
+    assert headers[b"etag"] == b'"e"'
+
+
+def test_response_cache():
+    import asyncio
+    from types import SimpleNamespace
+
+    import httpx
+    from fastapi import Depends, FastAPI, Request
+    from openg2p_fastapi_common.response_cache import (
+        cache_response,
+        invalidate_response_cache,
+    )
+    from pydantic import BaseModel
+
+    class Item(BaseModel):
+        q: int
+
+    calls = []
+
+    @cache_response(name="test_items")
+    async def get_items(q: int = 0) -> Item:
+        calls.append(q)
+        # Filtered by the response model, like FastAPI does.
+        return {"q": q, "secret": "x"}
+
+    @cache_response(name="test_untyped")
+    async def get_untyped():
+        calls.append("untyped")
+        return {"a": 1}
+
+    @cache_response(name="test_mine", vary_on_auth=True)
+    async def get_mine(request: Request) -> Item:
+        calls.append("mine")
+        return {"q": int(request.headers.get("x-user", "0"))}
+
+    def authenticate(request: Request):
+        if "x-user" in request.headers:
+            request.state.auth_credentials = SimpleNamespace(
+                iss="iss", sub=request.headers["x-user"]
+            )
+
+    app = FastAPI()
+    app.add_api_route("/items", get_items)
+    app.add_api_route("/untyped", get_untyped)
+    app.add_api_route("/mine", get_mine, dependencies=[Depends(authenticate)])
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            res = await client.get("/items")
+            assert res.json() == {"q": 0}
+            etag = res.headers["ETag"]
+            for if_none_match in (etag, f'"other", W/{etag}', "*"):
+                res = await client.get(
+                    "/items", headers={"If-None-Match": if_none_match}
+                )
+                assert res.status_code == 304
+            # Not an exact match of any of the tags.
+            for if_none_match in (etag[:-2] + '"', f'"x{etag[1:]}'):
+                res = await client.get(
+                    "/items", headers={"If-None-Match": if_none_match}
+                )
+                assert res.status_code == 200 and res.json() == {"q": 0}
+            await client.get("/items", params={"q": 1})
+            invalidate_response_cache("test_items")
+            await client.get("/items")
+            # Without a response model, plain values are not cached.
+            for _ in range(2):
+                assert (await client.get("/untyped")).json() == {"a": 1}
+            # Cached per subject. Without one, not cached (nor served from cache).
+            for user in ("1", "2", "1", None, None):
+                headers = {"X-User": user} if user else {}
+                res = await client.get("/mine", headers=headers)
+                assert res.json() == {"q": int(user or 0)}
+
+    asyncio.run(run())
+    assert calls == [0, 1, 0, "untyped", "untyped", "mine", "mine", "mine", "mine"]
+
+
+def test_admission_control(monkeypatch):
+    import asyncio
+
+    import httpx
+    from fastapi import FastAPI
+    from openg2p_fastapi_common import middleware
+
+    monkeypatch.setattr(middleware._config, "admission_max_concurrency", 1)
+    monkeypatch.setattr(middleware._config, "admission_max_queue", 1)
+    monkeypatch.setattr(middleware._config, "admission_queue_timeout", 0.5)
+    monkeypatch.setattr(middleware._config, "openapi_common_api_prefix", "/v1")
+
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow(delay: float):
+        await asyncio.sleep(delay)
+        return {}
+
+    @app.get("/v1/ping")
+    async def ping():
+        return {}
+
+    app.add_middleware(middleware.AdmissionControlMiddleware)
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            # One served, one queued then served, one rejected as the queue is full.
+            responses = await asyncio.gather(
+                client.get("/slow", params={"delay": 0.1}),
+                client.get("/slow", params={"delay": 0}),
+                client.get("/slow", params={"delay": 0}),
+                client.get("/v1/ping"),
+            )
+            assert sorted(res.status_code for res in responses) == [200, 200, 200, 503]
+            rejected = next(res for res in responses if res.status_code == 503)
+            assert rejected.headers["Retry-After"] == "1"
+            assert rejected.json()["errors"][0]["code"] == "G2P-REQ-503"
+            # Queued longer than the queue timeout.
+            responses = await asyncio.gather(
+                client.get("/slow", params={"delay": 1}),
+                client.get("/slow", params={"delay": 0}),
+                # Prefixed ping is exempt, and doesn't wait.
+                *[client.get("/v1/ping") for _ in range(3)],
+            )
+            assert [res.status_code for res in responses] == [200, 503, 200, 200, 200]
+
+    asyncio.run(run())
+
+
+def test_resilience():
+    import asyncio
+
+    from openg2p_fastapi_common.utils.resilience import (
+        CircuitBreaker,
+        RetryBudget,
+        hedged,
+    )
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow() and breaker.is_open
+    breaker.opened_at -= 60
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+    budget = RetryBudget(ratio=0.5, min_retries=1)
+    for _ in range(4):
+        budget.record_request()
+    assert [budget.try_spend() for _ in range(3)] == [True, True, False]
+
+    delays = [0.5, 0]
+
+    async def call():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    assert asyncio.run(hedged(call, 0.05)) == 0
+    delays = [0.1]
+    assert asyncio.run(hedged(call, 0.05, lambda: False)) == 0.1
+
+
+def use_sqlite_db(path, replica=False):
+    """
+    Sets up engines on an SQLite file (the replica, if any, is the same file).
+    Returns a function that restores the previous engines.
+    """
+    from openg2p_fastapi_common.context import (
+        dbengine,
+        dbengine_registry,
+        dbsession_maker,
+    )
+    from openg2p_fastapi_common.db import DbEngineRegistry
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    registry = DbEngineRegistry()
+    registry.register("primary", create_async_engine(f"sqlite+aiosqlite:///{path}"))
+    if replica:
+        registry.register(
+            "replica_0",
+            create_async_engine(f"sqlite+aiosqlite:///{path}"),
+            read_only=True,
+        )
+    tokens = [
+        (dbengine_registry, dbengine_registry.set(registry)),
+        (dbengine, dbengine.set(registry.get())),
+        (dbsession_maker, dbsession_maker.set(registry.get_session_maker())),
+    ]
+
+    def restore():
+        for var, token in tokens:
+            var.reset(token)
+
+    return restore
+
+
+def test_orm_cache(tmp_path):
+    import asyncio
+
+    from openg2p_fastapi_common.context import dbengine
+    from openg2p_fastapi_common.db import get_session_maker
+    from openg2p_fastapi_common.models import BaseORMModelWithId
+    from sqlalchemy.orm import Mapped
+
+    class CachedItem(BaseORMModelWithId):
+        __tablename__ = "test_orm_cache_items"
+        __cache__ = {"max_entries": 10}
+
+        name: Mapped[str]
+
+    restore = use_sqlite_db(tmp_path / "test.db")
+
+    async def run():
+        async with dbengine.get().begin() as conn:
+            await conn.run_sync(CachedItem.__table__.create)
+        async with get_session_maker()() as session:
+            session.add(CachedItem(id=1, name="a", active=True))
+            await session.commit()
+        assert (await CachedItem.get_by_id(1)).name == "a"
+        assert CachedItem.get_cache().get(("id", 1))["name"] == "a"
+
+        async with get_session_maker()() as session:
+            row = await session.get(CachedItem, 1)
+            row.name = "b"
+            await session.flush()
+            # Flushed, not committed. Cache keeps the committed row, and reads
+            # through this session don't fill the cache.
+            assert (await CachedItem.get_by_id(1)).name == "a"
+            CachedItem.cache_invalidate()
+            assert (await CachedItem.get_by_id(1, session=session)).name == "b"
+            assert CachedItem.get_cache().get(("id", 1)) is None
+            assert (await CachedItem.get_by_id(1)).name == "a"
+            await session.commit()
+        assert CachedItem.get_cache().get(("id", 1)) is None
+        assert (await CachedItem.get_by_id(1)).name == "b"
+
+        async with get_session_maker()() as session:
+            (await session.get(CachedItem, 1)).name = "c"
+            await session.flush()
+            await session.rollback()
+        assert (await CachedItem.get_by_id(1)).name == "b"
+        await dbengine.get().dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        restore()
+
+    restore = use_sqlite_db(tmp_path / "test.db", replica=True)
+
+    async def run_with_replica():
+        CachedItem.cache_invalidate()
+        assert (await CachedItem.get_by_id(1)).name == "b"
+        assert CachedItem.get_cache().get(("id", 1)) is None
+        assert (await CachedItem.get_by_id(1, use_primary=True)).name == "b"
+        assert CachedItem.get_cache().get(("id", 1)) is not None
+
+    try:
+        asyncio.run(run_with_replica())
+    finally:
+        restore()
+
+
+def test_bulk_operations(tmp_path):
+    import asyncio
+
+    from openg2p_fastapi_common.context import dbengine
+    from openg2p_fastapi_common.db import get_session_maker
+    from openg2p_fastapi_common.models import BaseORMModelWithId
+    from sqlalchemy.orm import Mapped, mapped_column
+
+    class BulkItem(BaseORMModelWithId):
+        __tablename__ = "test_bulk_items"
+        __cache__ = {"max_entries": 10}
+
+        # Attribute name differs from column name.
+        display_name: Mapped[str] = mapped_column("name")
+
+    restore = use_sqlite_db(tmp_path / "test.db")
+
+    async def run():
+        async with dbengine.get().begin() as conn:
+            await conn.run_sync(BulkItem.__table__.create)
+        rows = [{"id": i, "display_name": f"a{i}", "active": i != 3} for i in (1, 2, 3)]
+        assert await BulkItem.bulk_create(rows) == 3
+        items = await BulkItem.get_by_ids([2, 4, 1, 3])
+        assert [item and item.display_name for item in items] == [
+            "a2",
+            None,
+            "a1",
+            None,
+        ]
+        assert BulkItem.get_cache().get(("id", 3))["display_name"] == "a3"
+
+        async with get_session_maker()() as session:
+            await BulkItem.bulk_upsert(
+                [
+                    {"id": 1, "display_name": "b1", "active": True},
+                    {"id": 4, "display_name": "b4", "active": True},
+                ],
+                session=session,
+            )
+            # Not committed yet, so the cache is unchanged.
+            assert BulkItem.get_cache().get(("id", 1))["display_name"] == "a1"
+            await session.commit()
+        assert BulkItem.get_cache().get(("id", 1)) is None
+        items = await BulkItem.get_by_ids([1, 4])
+        assert [item.display_name for item in items] == ["b1", "b4"]
+        await BulkItem.bulk_upsert(
+            [{"id": 1, "display_name": "c1", "active": True}],
+            update_columns=[],
+        )
+        assert (await BulkItem.get_by_id(1)).display_name == "b1"
+        await dbengine.get().dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        restore()
+
+
+def test_lazy_import(tmp_path, monkeypatch):
+    import subprocess
+    import sys
+
+    from openg2p_fastapi_common.utils.lazy_import import LazyModule, lazy_import
+
+    # Already imported modules are returned as is.
+    assert lazy_import("sys") is sys
+
+    (tmp_path / "lazy_test_module.py").write_text("VALUE = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = lazy_import("lazy_test_module")
+    assert isinstance(module, LazyModule)
+    assert "lazy_test_module" not in sys.modules
+    assert module.VALUE == 1
+    assert "lazy_test_module" in sys.modules
+    # Copied over on first access.
+    assert "VALUE" in module.__dict__
+    del sys.modules["lazy_test_module"]
+
+    # Importing the app doesn't load the database layer.
+    res = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, openg2p_fastapi_common.app; "
+            "print(sorted(m for m in sys.modules if m.startswith('sqlalchemy')))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert res.stdout.strip() == "[]"
+
+
+def test_profiling():
+    import time
+
+    from openg2p_fastapi_common.context import startup_timings
+    from openg2p_fastapi_common.utils.profiling import get_import_times, timed_phase
+
+    token = startup_timings.set({})
+    try:
+        for _ in range(2):
+            with timed_phase("test_phase"):
+                time.sleep(0.01)
+        assert startup_timings.get()["test_phase"] >= 20
+    finally:
+        startup_timings.reset(token)
+
+    assert len(get_import_times("json", top=3)) == 3
+    import_times = get_import_times("json", top=1000)
+    assert "json" in [name for name, _, _ in import_times]
+    cumulative = [c for _, _, c in import_times]
+    assert cumulative == sorted(cumulative, reverse=True)
+    assert all(self_ms <= c for _, self_ms, c in import_times)
+
+
+def test_openapi_command():
+    initializer = Initializer.__new__(Initializer)
+    assert initializer.parse_command(["getOpenAPI", "openapi.json"]) == "getOpenAPI"
+    assert initializer.parse_command(["run"]) == "run"
+    # Command lines of other programs, like gunicorn importing the app.
+    assert initializer.parse_command(["main:app", "-w", "2"]) is None
+    assert initializer.parse_command([]) is None
+
+
+def test_openapi_controller(monkeypatch):
+    import asyncio
+    import gzip
+
+    import httpx
+    import orjson
+    from fastapi import FastAPI
+    from openg2p_fastapi_common import controller
+    from openg2p_fastapi_common.context import app_registry
+    from openg2p_fastapi_common.controller import BaseController
+    from openg2p_fastapi_common.openapi_controller import OpenAPIController
+
+    monkeypatch.setattr(controller._config, "openapi_common_api_prefix", "/v1")
+    app = FastAPI(root_path="/api")
+    token = app_registry.set(app)
+    try:
+        items = BaseController()
+        items.router.add_api_route("/items", lambda: [], methods=["GET"])
+        items.post_init()
+        openapi_controller = OpenAPIController().post_init()
+        openapi_controller.load()
+    finally:
+        app_registry.reset(token)
+    document = orjson.loads(openapi_controller.body)
+    assert "/v1/items" in document["paths"]
+    assert document["servers"] == [{"url": "/api"}]
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app, root_path="/api"),
+            base_url="http://test",
+        ) as client:
+            res = await client.get("/openapi.json")
+            assert res.status_code == 200
+            assert res.content == openapi_controller.body
+            etag = res.headers["ETag"]
+            res = await client.get(
+                "/openapi.json",
+                headers={"Accept-Encoding": "identity", "If-None-Match": etag},
+            )
+            assert res.status_code == 304
+            res = await client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+            assert res.headers["Content-Encoding"] == "gzip"
+            # Each encoding has its own ETag, and any of them is current.
+            gzip_etag = res.headers["ETag"]
+            assert gzip_etag == openapi_controller.etag[:-1] + '-gzip"'
+            res = await client.get(
+                "/openapi.json",
+                headers={
+                    "Accept-Encoding": "identity",
+                    "If-None-Match": gzip_etag,
+                },
+            )
+            assert res.status_code == 304
+            assert res.headers["ETag"] == openapi_controller.etag
+            res = await client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+            # Served as is, decoded by httpx.
+            assert res.content == openapi_controller.body
+            assert gzip.decompress(openapi_controller.encoded_bodies["gzip"]) == (
+                openapi_controller.body
+            )
+
+    asyncio.run(run())
+    assert [route.path for route in app.routes].count("/openapi.json") == 1
+
+
+def test_db_pool(tmp_path, monkeypatch):
+    import asyncio
+
+    from openg2p_fastapi_common import db
+    from openg2p_fastapi_common.config import WorkerType
+    from openg2p_fastapi_common.context import component_registry
+    from openg2p_fastapi_common.metrics import Metrics
+    from openg2p_fastapi_common.registry import Registry
+    from sqlalchemy import text
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    monkeypatch.setattr(db._config, "db_connection_budget", 12)
+    monkeypatch.setattr(db._config, "db_pool_size", 5)
+    monkeypatch.setattr(db._config, "db_max_overflow", 10)
+    monkeypatch.setattr(db._config, "worker_type", WorkerType.gunicorn)
+    monkeypatch.setattr(db._config, "no_of_workers", 0)
+    monkeypatch.setattr(db, "get_auto_worker_count", lambda worker_memory_mb: 4)
+    url = make_url("postgresql+asyncpg://localhost/db")
+    options = db.get_db_engine_options(url)
+    assert (options["pool_size"], options["max_overflow"]) == (3, 0)
+    monkeypatch.setattr(db._config, "worker_type", WorkerType.local)
+    options = db.get_db_engine_options(url)
+    assert (options["pool_size"], options["max_overflow"]) == (5, 7)
+
+    token = component_registry.set(Registry())
+    metrics = Metrics()
+    component_registry.reset(token)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}")
+    metrics.instrument_engine("primary", engine)
+
+    async def run():
+        for _ in range(2):
+            async with engine.connect() as connection:
+                await connection.execute(text("select 1"))
+            # Recreates the pool.
+            await engine.dispose()
+
+    asyncio.run(run())
+    assert metrics.db_pool_connections_opened_total._values == {("primary",): 2}
+    counts, _ = metrics.db_pool_connection_hold_seconds._values[("primary",)]
+    assert sum(counts) == 2
+
+
+def test_worker_slots(tmp_path, monkeypatch):
+    import os
+    import subprocess
+    import sys
+    from types import SimpleNamespace
+
+    from openg2p_fastapi_common import app
+    from openg2p_fastapi_common.config import WorkerType
+    from openg2p_fastapi_common.utils import worker_id
+
+    monkeypatch.setattr(worker_id, "_claimed", None)
+    monkeypatch.setattr(app._config, "worker_type", WorkerType.uvicorn)
+    monkeypatch.setattr(app._config, "worker_id", -1)
+    monkeypatch.setattr(app._config, "worker_slot_dir", str(tmp_path))
+    # Another live worker holds slot 0.
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from openg2p_fastapi_common.utils.worker_id import "
+            "claim_worker_id; print(claim_worker_id(sys.argv[1]), flush=True); "
+            "sys.stdin.read()",
+            str(tmp_path),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "0"
+        initializer = Initializer.__new__(Initializer)
+        initializer.init_worker_id()
+        assert app._config.worker_id == 1
+        assert app._config.worker_pid == os.getpid()
+    finally:
+        holder.communicate("")
+        worker_id._claimed[2].close()
+
+    # The master removes the default slot directory of its workers.
+    monkeypatch.setattr(worker_id.tempfile, "gettempdir", lambda: str(tmp_path))
+    slot_dir = worker_id.get_default_slot_dir(os.getpid())
+    os.makedirs(slot_dir)
+    open(os.path.join(slot_dir, "0.lock"), "w").close()
+    worker_id.remove_worker_slot_dir()
+    assert not os.path.exists(slot_dir)
+
+    # With a single uvicorn worker, the master serves requests itself. Its slot
+    # directory is keyed by its own pid (not its parent's), and removed.
+    def run(*args, **kwargs):
+        initializer.init_worker_id()
+        assert os.path.isfile(os.path.join(slot_dir, "0.lock"))
+        assert os.environ["common_worker_slot_dir"] == slot_dir
+
+    monkeypatch.setattr(worker_id, "_claimed", None)
+    monkeypatch.setattr(app._config, "worker_id", -1)
+    for config in app.config_registry.get():
+        monkeypatch.setattr(config, "worker_slot_dir", None)
+    monkeypatch.delenv("common_worker_slot_dir", raising=False)
+    monkeypatch.setattr(app, "uvicorn", SimpleNamespace(run=run))
+    monkeypatch.setattr(initializer, "return_app", lambda: None, raising=False)
+    try:
+        initializer.run_server(None)
+    finally:
+        worker_id._claimed[2].close()
+    assert app._config.worker_id == 0
+    assert not os.path.exists(slot_dir)
+
+
+def test_db_replica_routing(tmp_path, monkeypatch):
+    import asyncio
+
+    from openg2p_fastapi_common import db
+    from openg2p_fastapi_common.context import dbengine_registry, dbsession_maker
+    from openg2p_fastapi_common.db import DbEngineRegistry, db_session
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    monkeypatch.setattr(db._config, "db_replica_unhealthy_cooldown", 60)
+    registry = DbEngineRegistry()
+    registry.register(
+        "primary", create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'p.db'}")
+    )
+    registry.register(
+        "replica_0",
+        create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'r.db'}"),
+        read_only=True,
+    )
+    # Can't connect: the directory doesn't exist.
+    registry.register(
+        "replica_1",
+        create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'no' / 'r.db'}"),
+        read_only=True,
+    )
+    assert [registry.get_read_replica() for _ in range(4)] == [
+        "replica_0",
+        "replica_1",
+    ] * 2
+
+    async def session_engine(read_only):
+        async with db_session(read_only=read_only) as session:
+            return session.bind.url.database, session.info.get("read_replica")
+
+    async def run():
+        assert (await session_engine(False))[1] is None
+        assert await session_engine(True) == (str(tmp_path / "r.db"), "replica_0")
+        # replica_1 fails, so the primary serves and replica_1 is skipped.
+        assert await session_engine(True) == (str(tmp_path / "p.db"), None)
+        for _ in range(3):
+            assert (await session_engine(True))[1] == "replica_0"
+        # All replicas unhealthy: the primary serves.
+        registry.mark_unhealthy("replica_0")
+        assert await session_engine(True) == (str(tmp_path / "p.db"), None)
+        await registry.dispose()
+
+    tokens = [
+        (dbengine_registry, dbengine_registry.set(registry)),
+        (dbsession_maker, dbsession_maker.set(registry.get_session_maker())),
+    ]
+    try:
+        asyncio.run(run())
+    finally:
+        for var, token in tokens:
+            var.reset(token)
+    assert registry.get_read_replica() is None
+
+
+def test_queue_log_handler(tmp_path):
+    import logging
+    import os
+    import threading
+
+    import orjson
+    from openg2p_fastapi_common.log_queue import QueueLogHandler
+
+    class RecordingHandler(QueueLogHandler):
+        def __init__(self, *args, **kwargs):
+            self.batches = []
+            self.unblock = threading.Event()
+            super().__init__(*args, **kwargs)
+
+        def write(self, records):
+            if records:
+                self.batches.append(len(records))
+            # Hold the first batch, so that the next records queue up.
+            self.unblock.wait(timeout=5)
+            super().write(records)
+
+    path = tmp_path / "log.json"
+    stream = open(path, "ab")
+    handler = RecordingHandler([stream], batch_size=2, flush_interval=0.05)
+    logger = logging.getLogger("test_queue_log_handler")
+    logger.propagate = False
+    logger.addHandler(handler)
+    args = ["a"]
+    try:
+        logger.warning("first")
+        while not handler.batches:
+            threading.Event().wait(0.01)
+        for i in range(4):
+            logger.warning("msg %s %s", i, args)
+        # Message is resolved when logged.
+        args.append("b")
+        handler.unblock.set()
+        handler.close()
+        assert handler.batches == [1, 2, 2]
+        lines = [orjson.loads(line) for line in path.read_bytes().splitlines()]
+        assert [line["msg"] for line in lines] == ["first"] + [
+            f"msg {i} ['a']" for i in range(4)
+        ]
+        assert lines[0]["level"] == "WARNING" and lines[0]["correlation_id"] is None
+
+        # The writer thread is restarted in a forked child.
+        handler = QueueLogHandler([stream], flush_interval=0.05)
+        logger.handlers = [handler]
+        pid = os.fork()
+        if pid == 0:
+            try:
+                logger.warning("from child")
+                handler.close()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        handler.close()
+        assert orjson.loads(path.read_bytes().splitlines()[-1])["msg"] == "from child"
+    finally:
+        logger.handlers = []
+        stream.close()
+
+
+def test_request_context_middleware(monkeypatch):
+    import asyncio
+    import logging
+
+    import httpx
+    from fastapi import FastAPI
+    from openg2p_fastapi_common import middleware
+    from openg2p_fastapi_common.log_queue import CorrelationIdFilter
+    from starlette.responses import Response
+
+    monkeypatch.setattr(middleware._config, "logging_access_log_sample_rate", 0)
+
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    handler = ListHandler()
+    handler.addFilter(CorrelationIdFilter())
+    logger = logging.getLogger("test_request_context_middleware")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    access_logger = middleware._access_logger
+    access_logger.addHandler(handler)
+    monkeypatch.setattr(access_logger, "level", logging.INFO)
+
+    app = FastAPI()
+
+    @app.get("/echo")
+    async def echo(status: int = 200):
+        logger.info("in request")
+        return Response(status_code=status)
+
+    app.add_middleware(middleware.RequestContextMiddleware)
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            res = await client.get("/echo", headers={"X-Correlation-ID": "abc"})
+            assert res.headers["X-Correlation-ID"] == "abc"
+            generated = (await client.get("/echo")).headers["X-Correlation-ID"]
+            assert len(generated) == 32 and generated != "abc"
+            await client.get("/echo", params={"status": 404})
+            return generated
+
+    try:
+        generated = asyncio.run(run())
+        # Reset after the request.
+        logger.info("outside")
+    finally:
+        logger.removeHandler(handler)
+        access_logger.removeHandler(handler)
+    assert [(r.name, r.correlation_id) for r in records] == [
+        (logger.name, "abc"),
+        (logger.name, generated),
+        (logger.name, records[2].correlation_id),
+        # Successful requests aren't sampled. Errors are always logged.
+        (access_logger.name, records[2].correlation_id),
+        (logger.name, None),
+    ]
+    assert records[3].props["status"] == 404
+
+
+def test_gunicorn_server(tmp_path, monkeypatch):
+    import gc
+    import os
+    from types import SimpleNamespace
+
+    from gunicorn.config import Config
+    from openg2p_fastapi_common import server
+    from openg2p_fastapi_common.utils import worker_id
+
+    app = object()
+    gunicorn = server.GunicornServer(app, workers=3, timeout=None)
+    assert gunicorn.load() is app
+    assert gunicorn.cfg.workers == 3
+    assert gunicorn.cfg.preload_app
+    assert gunicorn.cfg.keepalive == server._config.server_keepalive
+    # None keeps the gunicorn default.
+    assert gunicorn.cfg.timeout == Config().timeout
+    assert gunicorn.cfg.worker_class_str.endswith(".AppUvicornWorker")
+
+    # The lowest id not used by a live worker, so a replacement gets the freed id.
+    monkeypatch.setattr(gc, "freeze", lambda: None)
+    workers = {pid: SimpleNamespace(worker_id=i) for pid, i in [(1, 0), (3, 2)]}
+    arbiter = SimpleNamespace(WORKERS=workers)
+    worker = SimpleNamespace(pid=2)
+    gunicorn.pre_fork(arbiter, worker)
+    assert worker.worker_id == 1
+    workers[2] = worker
+    new_worker = SimpleNamespace(pid=4)
+    gunicorn.pre_fork(arbiter, new_worker)
+    assert new_worker.worker_id == 3
+
+    monkeypatch.setattr(worker_id, "_claimed", None)
+    monkeypatch.setattr(server._config, "worker_id", -1)
+    monkeypatch.setattr(server._config, "worker_pid", -1)
+    gunicorn.post_fork(arbiter, worker)
+    assert (server._config.worker_id, server._config.worker_pid) == (1, 2)
+    assert worker_id.claim_worker_id() == 1
+
+    monkeypatch.setattr(worker_id.tempfile, "gettempdir", lambda: str(tmp_path))
+    slot_dir = worker_id.get_default_slot_dir(os.getpid())
+    os.makedirs(slot_dir)
+    gunicorn.on_exit(arbiter)
+    assert not os.path.exists(slot_dir)
+
+
+def test_db_session_dependency(tmp_path):
+    import asyncio
+
+    import httpx
+    from fastapi import APIRouter, Depends, FastAPI
+    from openg2p_fastapi_common.context import dbengine
+    from openg2p_fastapi_common.dependencies import get_db_session
+    from openg2p_fastapi_common.models import BaseORMModelWithId
+    from openg2p_fastapi_common.routing import BaseAPIRoute
+    from sqlalchemy.orm import Mapped, mapped_column
+
+    class SessionItem(BaseORMModelWithId):
+        __tablename__ = "test_session_items"
+
+        name: Mapped[str] = mapped_column(unique=True)
+
+    restore = use_sqlite_db(tmp_path / "test.db")
+
+    app = FastAPI()
+    router = APIRouter(route_class=BaseAPIRoute)
+
+    @router.post("/items")
+    async def create(id: int, name: str, session=Depends(get_db_session)):
+        session.add(SessionItem(id=id, name=name, active=True))
+        return {}
+
+    app.include_router(router)
+
+    async def run():
+        async with dbengine.get().begin() as conn:
+            await conn.run_sync(SessionItem.__table__.create)
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+            base_url="http://test",
+        ) as client:
+            res = await client.post("/items", params={"id": 1, "name": "a"})
+            assert res.status_code == 200
+            assert (await SessionItem.get_by_id(1)).name == "a"
+            # The commit fails (unique name), so the request fails.
+            res = await client.post("/items", params={"id": 2, "name": "a"})
+            assert res.status_code == 500
+            assert await SessionItem.get_by_id(2) is None
+        await dbengine.get().dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        restore()
+
+
+def test_http_client_pool():
+    import asyncio
+
+    import httpx
+    import pytest
+    from openg2p_fastapi_common import http_client
+    from openg2p_fastapi_common.context import component_registry
+    from openg2p_fastapi_common.http_client import HttpClientPool
+    from openg2p_fastapi_common.metrics import Metrics
+    from openg2p_fastapi_common.registry import Registry
+
+    def handler(request: httpx.Request):
+        if request.url.host == "down.test":
+            raise httpx.ConnectError("down", request=request)
+        return httpx.Response(200, json={"host": request.url.host})
+
+    token = component_registry.set(Registry())
+    try:
+        metrics = Metrics()
+        pool = HttpClientPool()
+    finally:
+        component_registry.reset(token)
+    client = pool.create_client(httpx.URL("https://a.test"))
+    assert client.timeout.connect == http_client._config.http_client_connect_timeout
+    asyncio.run(client.aclose())
+    pool.create_client = lambda url: httpx.AsyncClient(
+        transport=httpx.MockTransport(handler)
+    )
+
+    async def run():
+        # One client per (scheme, host, port).
+        a = pool.get_client("https://a.test/x")
+        assert pool.get_client("https://a.test/y?q=1") is a
+        assert pool.get_client("http://a.test/x") is not a
+        assert pool.get_client("https://a.test:8443/x") is not a
+        assert pool.get_client("https://b.test/x") is not a
+        assert pool.get_client("https://down.test/x") is not a
+        assert len(pool._clients) == 5
+        res = await pool.get("https://a.test/x")
+        assert res.json() == {"host": "a.test"}
+        await pool.post("https://b.test/x")
+        with pytest.raises(httpx.ConnectError):
+            await pool.get("https://down.test/x")
+        return a
+
+    token = component_registry.set(Registry())
+    component_registry.get().append(metrics)
+    try:
+        first = asyncio.run(run())
+        # Another event loop gets its own clients.
+        second = asyncio.run(run())
+        assert second is not first
+        assert not first.is_closed
+
+        async def shutdown():
+            client = pool.get_client("https://a.test/x")
+            await pool.aclose()
+            return client
+
+        closed = asyncio.run(shutdown())
+        assert closed.is_closed and not pool._clients
+        # Clients of other event loops are dropped.
+        asyncio.run(first.aclose())
+        asyncio.run(second.aclose())
+    finally:
+        component_registry.reset(token)
+
+    # Latency per host, method and status.
+    assert {
+        labels: sum(item[0])
+        for labels, item in metrics.http_client_request_duration_seconds._values.items()
+    } == {
+        ("a.test", "GET", "200"): 2,
+        ("b.test", "POST", "200"): 2,
+        ("down.test", "GET", "error"): 2,
+    }